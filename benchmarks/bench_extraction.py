@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+"""
+Сравнение скорости извлечения данных со страницы предмета:
+прежний путь (BeautifulSoup html.parser + отдельные выборки) и ExtractionPlan.
+
+Запуск:
+    python -m benchmarks.bench_extraction [--pages DIR] [--repeat N] [--json FILE]
+
+DIR - каталог с HTML-файлами, сохраненными через CSMarketParser.save_html.
+Без него используются синтетические страницы.
+"""
+import argparse
+import json
+import time
+from pathlib import Path
+
+from parser.parser import CSMarketParser
+from parser.extraction import DEFAULT_FEATURES, get_extraction_plan
+from benchmarks.synthetic import generate_item_pages
+
+URL = 'https://market.csgo.com/en/bench'
+
+
+def _load_pages(pages_dir: str) -> list:
+    if pages_dir:
+        return [p.read_text(encoding='utf-8') for p in sorted(Path(pages_dir).glob('*.html'))]
+    return generate_item_pages(30)
+
+
+def _timeit(func, pages: list, repeat: int) -> float:
+    """Среднее время обработки одной страницы в миллисекундах (лучший из повторов)"""
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        for html in pages:
+            func(html)
+        elapsed = (time.perf_counter() - started) / len(pages) * 1000
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    arg_parser.add_argument('--pages', help='Каталог с сохраненными страницами (*.html)')
+    arg_parser.add_argument('--repeat', type=int, default=3)
+    arg_parser.add_argument('--json', help='Куда записать результаты в JSON')
+    args = arg_parser.parse_args()
+
+    pages = _load_pages(args.pages)
+    legacy = CSMarketParser()
+    plan = get_extraction_plan(URL)
+
+    # Результаты обоих путей должны совпадать
+    mismatches = 0
+    for html in pages:
+        before = legacy.parse_html(html, URL)
+        after = plan.extract(html, URL)
+        if before != after:
+            mismatches += 1
+            print(f"Расхождение: {before} != {after}")
+
+    legacy_ms = _timeit(lambda html: legacy.parse_html(html, URL), pages, args.repeat)
+    plan_ms = _timeit(lambda html: plan.extract(html, URL), pages, args.repeat)
+
+    results = {
+        'benchmark': 'extraction',
+        'pages': len(pages),
+        'avg_page_kb': round(sum(len(p) for p in pages) / len(pages) / 1024, 1),
+        'features': DEFAULT_FEATURES,
+        'legacy_ms_per_page': round(legacy_ms, 3),
+        'plan_ms_per_page': round(plan_ms, 3),
+        'speedup': round(legacy_ms / plan_ms, 2) if plan_ms else None,
+        'mismatches': mismatches,
+    }
+    print(json.dumps(results, ensure_ascii=False, indent=2))
+    if args.json:
+        Path(args.json).write_text(json.dumps(results, ensure_ascii=False, indent=2), encoding='utf-8')
+
+
+if __name__ == '__main__':
+    main()
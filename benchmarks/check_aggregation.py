@@ -0,0 +1,136 @@
+# -*- coding: utf-8 -*-
+"""
+Проверка агрегатора портфеля на синтетическом портфеле: итоги и прибыль по
+предметам должны совпадать с прежним расчетом (цикл по Item.calculate_profit)
+после загрузки и после серии точечных изменений цен, закупок и удалений.
+
+Запуск:
+    python -m benchmarks.check_aggregation [--items N] [--updates N] [--json FILE]
+"""
+import argparse
+import json
+import random
+import tempfile
+import time
+from pathlib import Path
+
+from db.connector import CSMarketDatabase
+from db.models import Item
+from benchmarks.synthetic import generate_portfolio
+
+
+def legacy_totals(items_data: list) -> dict:
+    """Прежний расчет из show_statistics/_generate_report (в виде строк, как в отчете)"""
+    total_purchase_price = 0
+    total_current_price = 0
+    per_item = {}
+    for item_data in items_data:
+        item = Item.from_dict(item_data)
+        total_purchase_price += item.purchase_price or 0
+        total_current_price += item.current_price or 0
+        absolute_profit, percent_profit = item.calculate_profit()
+        per_item[item.id] = f"{absolute_profit:.2f} {percent_profit:.2f}"
+    total_profit = total_current_price - total_purchase_price
+    total_profit_percent = (total_profit / total_purchase_price * 100) if total_purchase_price > 0 else 0
+    return {
+        'totals': f"{total_purchase_price:.2f} {total_current_price:.2f} {total_profit:.2f} {total_profit_percent:.2f}",
+        'per_item': per_item,
+    }
+
+
+def aggregated_totals(db: CSMarketDatabase) -> dict:
+    """Те же значения из агрегатора"""
+    summary = db.portfolio_summary()
+    per_item = {}
+    for item_data in db.portfolio_snapshot().items:
+        absolute_profit, percent_profit = db.aggregator.item_profit(item_data['id'])
+        per_item[item_data['id']] = f"{absolute_profit:.2f} {percent_profit:.2f}"
+    return {
+        'totals': (f"{summary['total_purchase']:.2f} {summary['total_current']:.2f} "
+                   f"{summary['total_profit']:.2f} {summary['total_profit_percent']:.2f}"),
+        'per_item': per_item,
+    }
+
+
+def compare(db: CSMarketDatabase, stage: str) -> int:
+    """Сравнивает агрегатор с прежним расчетом по данным из базы, возвращает число расхождений"""
+    expected = legacy_totals(db._load_all_items())
+    actual = aggregated_totals(db)
+    mismatches = 0
+    if expected['totals'] != actual['totals']:
+        mismatches += 1
+        print(f"[{stage}] итоги: {expected['totals']} != {actual['totals']}")
+    if expected['per_item'].keys() != actual['per_item'].keys():
+        mismatches += 1
+        print(f"[{stage}] разный набор предметов")
+    for item_id, value in expected['per_item'].items():
+        if actual['per_item'].get(item_id, value) != value:
+            mismatches += 1
+            print(f"[{stage}] предмет {item_id}: {value} != {actual['per_item'][item_id]}")
+    return mismatches
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    arg_parser.add_argument('--items', type=int, default=50000)
+    arg_parser.add_argument('--updates', type=int, default=2000)
+    arg_parser.add_argument('--json', help='Куда записать результаты в JSON')
+    args = arg_parser.parse_args()
+
+    rng = random.Random(7)
+    with tempfile.TemporaryDirectory() as tmp:
+        db = CSMarketDatabase(str(Path(tmp) / 'portfolio.db'))
+        portfolio = generate_portfolio(args.items)
+        outcomes = db.upsert_items(portfolio)
+        # Цены закупки одной транзакцией (upsert_items их не меняет)
+        with db._connections.write() as conn:
+            conn.executemany(
+                'UPDATE items SET purchase_price = ? WHERE id = ?',
+                [(item['purchase_price'], o['id']) for item, o in zip(portfolio, outcomes)]
+            )
+        db.cache.invalidate()
+        ids = [o['id'] for o in outcomes]
+
+        mismatches = compare(db, 'загрузка')
+
+        # Точечные изменения: новые цены пачками, цены закупки и удаления по одному
+        started = time.perf_counter()
+        for start in range(0, args.updates, 100):
+            batch = rng.sample(range(len(portfolio)), 100)
+            db.upsert_items([
+                {**portfolio[i], 'price': f"${rng.uniform(0.03, 2500):.2f}"} for i in batch
+            ])
+            for item_id in rng.sample(ids, 5):
+                db.set_purchase_price_by_id(item_id, round(rng.uniform(0, 2000), 2))
+            removed = ids.pop(rng.randrange(len(ids)))
+            db.remove_item(removed)
+        updates_s = time.perf_counter() - started
+        mismatches += compare(db, 'после изменений')
+
+        # Время получения итогов: прежний цикл по всем строкам и готовые итоги агрегатора
+        items_data = db.get_all_items()
+        started = time.perf_counter()
+        legacy_totals(items_data)
+        legacy_ms = (time.perf_counter() - started) * 1000
+        started = time.perf_counter()
+        for _ in range(100):
+            db.portfolio_summary()
+        summary_ms = (time.perf_counter() - started) * 1000 / 100
+
+    results = {
+        'benchmark': 'aggregation',
+        'items': args.items,
+        'updates': args.updates,
+        'mismatches': mismatches,
+        'updates_s': round(updates_s, 2),
+        'legacy_totals_ms': round(legacy_ms, 2),
+        'summary_ms': round(summary_ms, 4),
+        'cache': db.cache_stats(),
+    }
+    print(json.dumps(results, ensure_ascii=False, indent=2))
+    if args.json:
+        Path(args.json).write_text(json.dumps(results, ensure_ascii=False, indent=2), encoding='utf-8')
+
+
+if __name__ == '__main__':
+    main()
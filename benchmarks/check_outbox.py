@@ -0,0 +1,124 @@
+# -*- coding: utf-8 -*-
+"""
+Проверка очереди исходящих сообщений на локальной заглушке Bot API:
+всплеск сообщений в несколько чатов и длинный отчет. Сравнивается прямая
+отправка (каждое сообщение сразу через send_message) и OutboundDispatcher:
+сколько ответов 429 получено, сколько запросов ушло, все ли тексты дошли по
+порядку, задержка доставки.
+
+Запуск:
+    python -m benchmarks.check_outbox [--chats N] [--messages N] [--error-rate P] [--json FILE]
+"""
+import argparse
+import json
+import time
+from pathlib import Path
+
+import telebot
+from telebot.apihelper import ApiException
+
+from item_tracker_bot.outbox import OutboundDispatcher
+from benchmarks.fake_bot_api import FakeBotAPI
+
+TOKEN = '123456:fake'
+
+
+def _workload(chats: int, messages: int) -> list:
+    """Сообщения по чатам (chat_id, text) в порядке постановки"""
+    workload = []
+    for i in range(messages):
+        for chat_id in range(1, chats + 1):
+            workload.append((chat_id, f"Сообщение {i} в чат {chat_id}"))
+    # Длинный отчет администратору: будет разделен на части
+    report = '\n'.join(f"{n}. Предмет {n}: $12.34 → $13.57 (+9.97%)" for n in range(400))
+    workload.append((1, report))
+    return workload
+
+
+def _delivered_in_order(api: FakeBotAPI, workload: list) -> bool:
+    """Все тексты дошли в свой чат и в исходном порядке (с учетом склеивания и деления)"""
+    expected = {}
+    for chat_id, text in workload:
+        expected.setdefault(chat_id, []).extend(text.split('\n'))
+    for chat_id, lines in expected.items():
+        received = [line for text in api.messages.get(chat_id, []) for line in text.split('\n') if line]
+        if received != lines:
+            return False
+    return True
+
+
+def run_direct(workload: list, error_rate: float) -> dict:
+    """Прежний способ: send_message прямо в обработчике, ошибки видит вызывающий код"""
+    api = FakeBotAPI(error_rate=error_rate).start()
+    telebot.apihelper.API_URL = api.api_url
+    bot = telebot.TeleBot(TOKEN, threaded=False)
+    failed = 0
+    started = time.perf_counter()
+    for chat_id, text in workload:
+        try:
+            bot.send_message(chat_id, text[:4096])
+        except ApiException:
+            failed += 1
+    elapsed = time.perf_counter() - started
+    api.stop()
+    return {
+        'requests': api.calls['sendMessage'],
+        'rate_limited': api.rate_limited,
+        'server_errors': api.errors,
+        'failed_in_caller': failed,
+        'delivered_in_order': _delivered_in_order(api, workload),
+        'wall_s': round(elapsed, 2),
+    }
+
+
+def run_outbox(workload: list, error_rate: float, timeout: float) -> dict:
+    """Очередь: постановка не блокирует, отправка с ограничениями и повторами"""
+    api = FakeBotAPI(error_rate=error_rate).start()
+    telebot.apihelper.API_URL = api.api_url
+    dispatcher = OutboundDispatcher(telebot.TeleBot(TOKEN, threaded=False), global_rate=25, chat_rate=1,
+                                    chat_burst=3, retry_base=0.2, retry_cap=2)
+    started = time.perf_counter()
+    for chat_id, text in workload:
+        dispatcher.send_message(chat_id, text)
+    enqueue_ms = (time.perf_counter() - started) * 1000
+    drained = dispatcher.flush(timeout)
+    elapsed = time.perf_counter() - started
+    dispatcher.stop(timeout=1)
+    api.stop()
+    return {
+        'requests': api.calls['sendMessage'],
+        'rate_limited': api.rate_limited,
+        'server_errors': api.errors,
+        'drained': drained,
+        'delivered_in_order': _delivered_in_order(api, workload),
+        'enqueue_ms': round(enqueue_ms, 2),
+        'wall_s': round(elapsed, 2),
+        'dispatcher': dispatcher.stats(),
+    }
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    arg_parser.add_argument('--chats', type=int, default=5)
+    arg_parser.add_argument('--messages', type=int, default=20, help='Сообщений в каждый чат')
+    arg_parser.add_argument('--error-rate', type=float, default=0.05, help='Доля ответов 500 от заглушки')
+    arg_parser.add_argument('--timeout', type=float, default=120)
+    arg_parser.add_argument('--json', help='Куда записать результаты в JSON')
+    args = arg_parser.parse_args()
+
+    workload = _workload(args.chats, args.messages)
+    results = {
+        'benchmark': 'outbox',
+        'chats': args.chats,
+        'messages': len(workload),
+        'error_rate': args.error_rate,
+        'direct': run_direct(workload, args.error_rate),
+        'outbox': run_outbox(workload, args.error_rate, args.timeout),
+    }
+    print(json.dumps(results, ensure_ascii=False, indent=2))
+    if args.json:
+        Path(args.json).write_text(json.dumps(results, ensure_ascii=False, indent=2), encoding='utf-8')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,180 @@
+# -*- coding: utf-8 -*-
+"""
+Сравнение приема обновлений через webhook и через long polling на одном и том
+же наборе обновлений. Обработчик имитирует работу задержкой; измеряются
+пропускная способность, задержка от публикации обновления до обработчика и
+нарушения порядка внутри чата.
+
+Webhook: обновления отправляются POST-запросами на WebhookServer (несколько
+клиентов, у каждого свои чаты - как Telegram с max_connections).
+Polling: обновления отдает заглушка Bot API через getUpdates.
+
+Запуск:
+    python -m benchmarks.check_webhook [--updates N | --recorded FILE.jsonl] [--chats N]
+                                       [--work-ms MS] [--workers N] [--json FILE]
+
+FILE.jsonl - записанные обновления Telegram, по одному JSON на строку.
+"""
+import argparse
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import requests
+import telebot
+
+from item_tracker_bot.webhook import SECRET_HEADER, WebhookServer
+from benchmarks.fake_bot_api import FakeBotAPI
+
+TOKEN = '123456:fake'
+SECRET = 'bench-secret'
+
+
+def generate_updates(count: int, chats: int) -> list:
+    """Текстовые сообщения от chats пользователей по очереди"""
+    now = int(time.time())
+    updates = []
+    for update_id in range(1, count + 1):
+        chat_id = 1000 + update_id % chats
+        updates.append({
+            'update_id': update_id,
+            'message': {
+                'message_id': update_id, 'date': now, 'text': f'msg {update_id}',
+                'chat': {'id': chat_id, 'type': 'private'},
+                'from': {'id': chat_id, 'is_bot': False, 'first_name': 'user'},
+            },
+        })
+    return updates
+
+
+class Recorder:
+    """Обработчик сообщений: имитирует работу и записывает порядок и время обработки"""
+
+    def __init__(self, work_ms: float, expected: int):
+        self.work_s = work_ms / 1000
+        self.expected = expected
+        self.published = {}
+        self.handled = {}
+        self.order = {}
+        self._lock = threading.Lock()
+        self.done = threading.Event()
+
+    def handler(self, message):
+        time.sleep(self.work_s)
+        with self._lock:
+            self.handled[message.message_id] = time.monotonic()
+            self.order.setdefault(message.chat.id, []).append(message.message_id)
+            if len(self.handled) >= self.expected:
+                self.done.set()
+
+    def summary(self, wall: float) -> dict:
+        latencies = sorted(self.handled[i] - self.published[i] for i in self.handled if i in self.published)
+        violations = sum(
+            1 for ids in self.order.values() for a, b in zip(ids, ids[1:]) if b < a
+        )
+        return {
+            'handled': len(self.handled),
+            'wall_s': round(wall, 3),
+            'throughput': round(len(self.handled) / wall, 1) if wall > 0 else 0.0,
+            'latency_avg_ms': round(sum(latencies) / len(latencies) * 1000, 1) if latencies else 0.0,
+            'latency_p95_ms': round(latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))] * 1000, 1) if latencies else 0.0,
+            'order_violations': violations,
+        }
+
+
+def _message_id(update: dict) -> int:
+    return update['message']['message_id']
+
+
+def run_webhook(updates: list, work_ms: float, workers: int, clients: int, timeout: float) -> dict:
+    recorder = Recorder(work_ms, len(updates))
+    bot = telebot.TeleBot(TOKEN, threaded=False)
+    bot.register_message_handler(recorder.handler, func=lambda message: True)
+    server = WebhookServer(lambda update: bot.process_new_updates([update]), '127.0.0.1', 0, '/hook',
+                           SECRET, workers=workers, max_pending=len(updates) + 1).start()
+    host, port = server.address
+    url = f"http://{host}:{port}/hook"
+
+    # Запрос с неверным секретом должен быть отклонен
+    forbidden = requests.post(url, json=updates[0], headers={SECRET_HEADER: 'wrong'}).status_code
+
+    # Как Telegram: обновления одного чата идут по одному соединению по порядку
+    shards = [[] for _ in range(clients)]
+    for update in updates:
+        shards[update['message']['chat']['id'] % clients].append(update)
+
+    def post_shard(shard):
+        session = requests.Session()
+        for update in shard:
+            recorder.published[_message_id(update)] = time.monotonic()
+            status = session.post(url, json=update, headers={SECRET_HEADER: SECRET}).status_code
+            if status != 200:
+                raise RuntimeError(f"Webhook ответил {status}")
+
+    started = time.monotonic()
+    with ThreadPoolExecutor(max_workers=clients) as pool:
+        list(pool.map(post_shard, shards))
+    recorder.done.wait(timeout)
+    wall = time.monotonic() - started
+    stats = server.stats()
+    server.stop()
+    return {**recorder.summary(wall), 'forbidden_status': forbidden, 'server': stats}
+
+
+def run_polling(updates: list, work_ms: float, workers: int, timeout: float) -> dict:
+    recorder = Recorder(work_ms, len(updates))
+    api = FakeBotAPI().start()
+    telebot.apihelper.API_URL = api.api_url
+    bot = telebot.TeleBot(TOKEN, threaded=True, num_threads=workers)
+    bot.register_message_handler(recorder.handler, func=lambda message: True)
+    poller = threading.Thread(target=bot.polling, kwargs={'interval': 0, 'timeout': 10, 'long_polling_timeout': 5},
+                              daemon=True)
+    poller.start()
+    time.sleep(0.5)  # Первый getUpdates уже ждет
+
+    started = time.monotonic()
+    for update in updates:
+        recorder.published[_message_id(update)] = time.monotonic()
+    api.push_updates(updates)
+    recorder.done.wait(timeout)
+    wall = time.monotonic() - started
+    bot.stop_polling()
+    api.stop()
+    return {**recorder.summary(wall), 'get_updates_calls': api.calls['getUpdates']}
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    arg_parser.add_argument('--updates', type=int, default=500)
+    arg_parser.add_argument('--recorded', help='Записанные обновления (JSONL)')
+    arg_parser.add_argument('--chats', type=int, default=20)
+    arg_parser.add_argument('--work-ms', type=float, default=5, help='Время работы обработчика')
+    arg_parser.add_argument('--workers', type=int, default=4)
+    arg_parser.add_argument('--clients', type=int, default=4, help='Параллельных соединений к webhook')
+    arg_parser.add_argument('--timeout', type=float, default=120)
+    arg_parser.add_argument('--json', help='Куда записать результаты в JSON')
+    args = arg_parser.parse_args()
+
+    if args.recorded:
+        lines = Path(args.recorded).read_text(encoding='utf-8').splitlines()
+        updates = [u for u in (json.loads(line) for line in lines if line.strip()) if 'message' in u]
+    else:
+        updates = generate_updates(args.updates, args.chats)
+
+    results = {
+        'benchmark': 'webhook',
+        'updates': len(updates),
+        'work_ms': args.work_ms,
+        'workers': args.workers,
+        'webhook': run_webhook(updates, args.work_ms, args.workers, args.clients, args.timeout),
+        'polling': run_polling(updates, args.work_ms, args.workers, args.timeout),
+    }
+    print(json.dumps(results, ensure_ascii=False, indent=2))
+    if args.json:
+        Path(args.json).write_text(json.dumps(results, ensure_ascii=False, indent=2), encoding='utf-8')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,152 @@
+# -*- coding: utf-8 -*-
+"""
+Локальная заглушка Telegram Bot API для проверок без сети.
+
+Принимает запросы в формате api.telegram.org (/bot<token>/<method>),
+записывает отправленные сообщения и, как настоящий сервер, отвечает 429 с
+retry_after при превышении ограничений на чат и на бота. Дополнительно
+может возвращать случайные 5xx и отдавать записанные обновления через
+getUpdates (long polling).
+
+Бот направляется на заглушку переменной окружения
+TELEGRAM_API_URL=http://127.0.0.1:<port>/bot{0}/{1}.
+"""
+import json
+import random
+import threading
+import time
+from collections import defaultdict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional
+from urllib.parse import parse_qsl, urlparse
+
+from parser.rate_limiter import TokenBucket
+
+
+class FakeBotAPI:
+    """HTTP-сервер, имитирующий sendMessage и прочие методы Bot API"""
+
+    def __init__(self, host: str = '127.0.0.1', port: int = 0, chat_rate: float = 1, chat_burst: float = 3,
+                 global_rate: float = 30, error_rate: float = 0.0, retry_after: int = 1, seed: int = 1):
+        """
+        Args:
+            host, port: Адрес сервера (port=0 - любой свободный)
+            chat_rate, chat_burst: Ограничение сообщений в один чат
+            global_rate: Ограничение сообщений в секунду на бота
+            error_rate: Доля запросов, на которые отвечаем 500
+            retry_after: Значение retry_after в ответах 429
+            seed: Зерно генератора ошибок
+        """
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.error_rate = error_rate
+        self.retry_after = retry_after
+        self._rng = random.Random(seed)
+        self._global = TokenBucket(global_rate, global_rate)
+        self._chat_buckets: Dict[int, TokenBucket] = {}
+        self._lock = threading.Lock()
+        self.messages: Dict[int, List[str]] = defaultdict(list)
+        # Обновления, ожидающие getUpdates
+        self._updates: List[Dict[str, Any]] = []
+        self._updates_cond = threading.Condition(self._lock)
+        self.calls: Dict[str, int] = defaultdict(int)
+        self.rate_limited = 0
+        self.errors = 0
+        self._next_message_id = 1
+        self._server = ThreadingHTTPServer((host, port), self._handler_class())
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def api_url(self) -> str:
+        """Адрес в формате telebot.apihelper.API_URL"""
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/bot{{0}}/{{1}}"
+
+    def start(self) -> 'FakeBotAPI':
+        self._thread = threading.Thread(target=self._server.serve_forever, name="fake-bot-api", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def _handler_class(self):
+        api = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def _handle(self):
+                parsed = urlparse(self.path)
+                params = dict(parse_qsl(parsed.query))
+                length = int(self.headers.get('Content-Length') or 0)
+                if length:
+                    body = self.rfile.read(length).decode('utf-8')
+                    if self.headers.get('Content-Type', '').startswith('application/json'):
+                        params.update(json.loads(body))
+                    else:
+                        params.update(parse_qsl(body))
+                method = parsed.path.rsplit('/', 1)[-1]
+                status, payload = api.handle(method, params)
+                data = json.dumps(payload).encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            do_GET = _handle
+            do_POST = _handle
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def push_updates(self, updates: List[Dict[str, Any]]):
+        """Делает обновления доступными для getUpdates"""
+        with self._updates_cond:
+            self._updates.extend(updates)
+            self._updates_cond.notify_all()
+
+    def _get_updates(self, params: Dict[str, Any]):
+        """getUpdates: отдает обновления с update_id >= offset, ждет до timeout секунд (под self._lock)"""
+        offset = int(params.get('offset') or 0)
+        limit = int(params.get('limit') or 100)
+        deadline = time.monotonic() + float(params.get('timeout') or 0)
+        while True:
+            self._updates = [update for update in self._updates if update['update_id'] >= offset]
+            if self._updates or time.monotonic() >= deadline:
+                return 200, {'ok': True, 'result': self._updates[:limit]}
+            self._updates_cond.wait(timeout=deadline - time.monotonic())
+
+    def handle(self, method: str, params: Dict[str, Any]):
+        """Обрабатывает вызов метода, возвращает (HTTP-статус, JSON-ответ)"""
+        with self._lock:
+            self.calls[method] += 1
+            if method == 'getUpdates':
+                return self._get_updates(params)
+            if self.error_rate and self._rng.random() < self.error_rate:
+                self.errors += 1
+                return 500, {'ok': False, 'error_code': 500, 'description': 'Internal Server Error'}
+            if method == 'getMe':
+                return 200, {'ok': True, 'result': {'id': 1, 'is_bot': True, 'first_name': 'fake', 'username': 'fake_bot'}}
+            if method != 'sendMessage':
+                return 200, {'ok': True, 'result': True}
+
+            chat_id = int(params['chat_id'])
+            bucket = self._chat_buckets.get(chat_id)
+            if bucket is None:
+                bucket = self._chat_buckets[chat_id] = TokenBucket(self.chat_rate, self.chat_burst)
+            if not bucket.try_acquire() or not self._global.try_acquire():
+                self.rate_limited += 1
+                return 429, {'ok': False, 'error_code': 429,
+                             'description': f'Too Many Requests: retry after {self.retry_after}',
+                             'parameters': {'retry_after': self.retry_after}}
+
+            self.messages[chat_id].append(params.get('text', ''))
+            message_id = self._next_message_id
+            self._next_message_id += 1
+            return 200, {'ok': True, 'result': {
+                'message_id': message_id, 'date': int(time.time()),
+                'chat': {'id': chat_id, 'type': 'private'}, 'text': params.get('text', ''),
+            }}
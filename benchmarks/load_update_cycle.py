@@ -0,0 +1,181 @@
+# -*- coding: utf-8 -*-
+"""
+Нагрузочный прогон полного цикла обновления (run_update_cycle) без рынка и
+браузера: страницы отдает ReplayTransport из кассеты с заданной задержкой и
+долей ошибок. Измеряются время цикла, пропускная способность, способы
+загрузки, исходы ожидания готовности страниц и память процесса.
+
+Запуск:
+    python -m benchmarks.load_update_cycle [--items N] [--cycles N] [--cassette FILE]
+                                           [--latency-ms MS] [--jitter-ms MS] [--error-rate P]
+                                           [--change-share P] [--concurrency N] [--wait-time S] [--rps R]
+                                           [--tracemalloc] [--json FILE]
+
+FILE - кассета, записанная ботом в режиме PARSER_TRANSPORT=record (портфель
+составляется из ее адресов). Без него кассета собирается в памяти из
+синтетических страниц. Между циклами у доли --change-share предметов меняется
+страница (и цена), остальные проходят путь «без изменений».
+"""
+import argparse
+import json
+import logging
+import random
+import resource
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+from config import config
+from parser.replay import PAGE, TEXT, ReplayTransport
+from benchmarks.synthetic import generate_item_pages
+
+URL_TEMPLATE = 'https://market.csgo.com/en/Rifle/AK-47/replay-{}'
+
+
+def _max_rss_mb() -> float:
+    """Пиковый размер процесса в памяти (ru_maxrss в Linux - в килобайтах)"""
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+
+
+def _readiness_outcomes(stats) -> dict:
+    """Исходы ожидания готовности страниц по всем доменам (ready, settled, error_page, timeout)"""
+    totals = {}
+    for domain in stats.summary().values():
+        for outcome, count in domain['outcomes'].items():
+            totals[outcome] = totals.get(outcome, 0) + count
+    return totals
+
+
+def build_synthetic(transport: ReplayTransport, items: int, templates: list) -> list:
+    """Ответы для items адресов (страницы повторяются по кругу), возвращает адреса"""
+    urls = [URL_TEMPLATE.format(i) for i in range(items)]
+    for i, url in enumerate(urls):
+        html = templates[i % len(templates)]
+        transport.put(TEXT, url, html)
+        transport.put(PAGE, url, html)
+    return urls
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    arg_parser.add_argument('--items', type=int, default=2000)
+    arg_parser.add_argument('--cycles', type=int, default=3)
+    arg_parser.add_argument('--cassette', help='Записанная кассета (JSONL)')
+    arg_parser.add_argument('--templates', type=int, default=120, help='Разных синтетических страниц')
+    arg_parser.add_argument('--latency-ms', type=float, default=50)
+    arg_parser.add_argument('--jitter-ms', type=float, default=50)
+    arg_parser.add_argument('--error-rate', type=float, default=0.02)
+    arg_parser.add_argument('--change-share', type=float, default=0.3)
+    arg_parser.add_argument('--concurrency', type=int, default=8)
+    arg_parser.add_argument('--wait-time', type=float, default=1,
+                            help='Таймаут готовности страницы, сек (страницы без названия ждут его целиком)')
+    arg_parser.add_argument('--rps', type=float, default=0, help='Лимит запросов в секунду к рынку (0 - без лимита)')
+    arg_parser.add_argument('--seed', type=int, default=42)
+    arg_parser.add_argument('--tracemalloc', action='store_true', help='Считать пик памяти Python (медленнее)')
+    arg_parser.add_argument('--json', help='Куда записать результаты в JSON')
+    args = arg_parser.parse_args()
+
+    tmp_dir = tempfile.TemporaryDirectory(prefix='tracker-load-')
+    # Модули бота открывают базу и создают ограничитель при импорте - настраиваем до импорта
+    config.DATABASE_PATH = str(Path(tmp_dir.name) / 'load.db')
+    config.DOMAIN_RATE_LIMITS = {'market.csgo.com': (args.rps, args.rps)} if args.rps else {}
+    config.UPDATER_CONCURRENCY = args.concurrency
+    config.PARSER_WAIT_TIME = args.wait_time
+    config.TRACE_DIR = str(Path(tmp_dir.name) / 'traces')
+    if not config.BOT_TOKEN or ':' not in config.BOT_TOKEN:
+        config.BOT_TOKEN = '123456:bench'
+    logging.basicConfig(level=logging.WARNING)
+
+    from item_tracker_bot import updater
+    from parser.http_fetcher import fetch_path_stats
+    from parser.readiness import readiness_stats
+
+    transport_args = dict(latency_ms=args.latency_ms, jitter_ms=args.jitter_ms,
+                          error_rate=args.error_rate, seed=args.seed, tabs=args.concurrency)
+    if args.cassette:
+        transport = ReplayTransport.from_file(args.cassette, **transport_args)
+        urls = sorted({record['url'] for record in transport.records.values()})[:args.items]
+        templates = [record['body'] for record in transport.records.values()
+                     if record['kind'] in (TEXT, PAGE) and record['status'] == 200]
+    else:
+        transport = ReplayTransport(**transport_args)
+        templates = generate_item_pages(args.templates, args.seed, noise_rows=100)
+        urls = build_synthetic(transport, args.items, templates)
+    # Цикл обновления берет вкладки и HTTP-клиент из модуля - подставляем транспорт воспроизведения
+    updater.browser_pool = transport.pool
+    updater.http_fetcher = transport
+
+    db = updater.db
+    db.upsert_items([
+        {'url': url, 'title': f'Replay item {i}', 'price': None, 'purchase_price': 10.0}
+        for i, url in enumerate(urls)
+    ])
+
+    rng = random.Random(args.seed)
+    if args.tracemalloc:
+        tracemalloc.start()
+    cycles = []
+    for number in range(args.cycles):
+        if number and args.change_share and not args.cassette:
+            for url in rng.sample(urls, int(len(urls) * args.change_share)):
+                html = rng.choice(templates)
+                transport.put(TEXT, url, html)
+                transport.put(PAGE, url, html)
+        paths_before = fetch_path_stats.summary()
+        outcomes_before = _readiness_outcomes(readiness_stats)
+        transport_before = transport.stats()
+        items = [dict(item) for item in db.portfolio_snapshot().items]
+        started = time.perf_counter()
+        stats = updater.run_update_cycle(items)
+        wall_time = time.perf_counter() - started
+        paths_after = fetch_path_stats.summary()
+        outcomes_after = _readiness_outcomes(readiness_stats)
+        transport_after = transport.stats()
+        cycles.append({
+            'cycle': number + 1,
+            'positions': stats['items'],
+            'pages': stats['pages'],
+            'changed': stats['changed'],
+            'unchanged': stats['unchanged'],
+            'failed': stats['failed'],
+            'wall_time': round(wall_time, 3),
+            'items_per_sec': round(stats['items'] / wall_time, 1) if wall_time else None,
+            'paths': {path: paths_after[path] - paths_before[path] for path in paths_after},
+            'readiness': {outcome: count - outcomes_before.get(outcome, 0)
+                          for outcome, count in outcomes_after.items()},
+            'transport_requests': transport_after['requests'] - transport_before['requests'],
+            'injected_errors': transport_after['injected_errors'] - transport_before['injected_errors'],
+            'stage_totals_ms': stats['trace']['stage_totals_ms'],
+            'cycle_spans_ms': {span['name']: span['ms'] for span in stats['trace']['spans']},
+            'max_rss_mb': _max_rss_mb(),
+        })
+        print(f"Цикл {number + 1}: {stats['items']} позиций за {wall_time:.2f} сек", flush=True)
+
+    results = {
+        'benchmark': 'load_update_cycle',
+        'items': len(urls),
+        'cassette': args.cassette or 'synthetic',
+        'latency_ms': args.latency_ms,
+        'jitter_ms': args.jitter_ms,
+        'error_rate': args.error_rate,
+        'concurrency': args.concurrency,
+        'wait_time': args.wait_time,
+        'rps_limit': args.rps or None,
+        'cycles': cycles,
+        'avg_cycle_s': round(sum(c['wall_time'] for c in cycles) / len(cycles), 3) if cycles else None,
+        'transport': transport.stats(),
+        'max_rss_mb': _max_rss_mb(),
+    }
+    if args.tracemalloc:
+        results['python_peak_mb'] = round(tracemalloc.get_traced_memory()[1] / 1024 / 1024, 1)
+        tracemalloc.stop()
+
+    print(json.dumps(results, ensure_ascii=False, indent=2))
+    if args.json:
+        Path(args.json).write_text(json.dumps(results, ensure_ascii=False, indent=2), encoding='utf-8')
+    tmp_dir.cleanup()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,260 @@
+# -*- coding: utf-8 -*-
+"""
+Набор бенчмарков горячих путей: извлечение данных со страницы предмета,
+операции CSMarketDatabase (добавление, обновление, get_all_items) на портфелях
+разного размера и формирование отчетов (страница статистики show_statistics и
+_generate_report). Все метрики - время в миллисекундах (меньше - лучше);
+результаты сохраняются в JSON и сравниваются с прогоном на другом коммите.
+
+Запуск:
+    python -m benchmarks.suite [--sizes 100,10000,100000] [--pages DIR] [--save-corpus DIR]
+                               [--only extraction,db,reports] [--ops N] [--repeat N]
+                               [--json FILE] [--compare BASELINE.json] [--tolerance P]
+
+DIR - каталог с HTML-файлами, сохраненными через CSMarketParser.save_html
+(без него используются синтетические страницы; --save-corpus записывает их в
+каталог, чтобы разные коммиты мерились на одном и том же корпусе).
+Базы создаются во временном каталоге, рабочая база бота не затрагивается.
+"""
+import argparse
+import contextlib
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from bs4 import BeautifulSoup
+
+from config import config
+from db.connector import CSMarketDatabase
+from parser.parser import CSMarketParser
+from parser.extraction import get_extraction_plan
+from benchmarks.bench_extraction import URL, _load_pages, _timeit
+from benchmarks.synthetic import generate_item_pages, generate_portfolio
+
+SECTIONS = ('extraction', 'db', 'reports')
+# Владелец синтетического портфеля
+USER_ID = 1
+
+
+@contextlib.contextmanager
+def _quiet():
+    """Подавляет построчный вывод коннектора (print на каждый предмет) во время замеров"""
+    with open(os.devnull, 'w', encoding='utf-8') as devnull, contextlib.redirect_stdout(devnull):
+        yield
+
+
+def _best_ms(func, repeat: int) -> float:
+    """Лучшее время одного вызова из repeat повторов, мс"""
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        elapsed = (time.perf_counter() - started) * 1000
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def _per_op_ms(func, args: list) -> float:
+    """Среднее время одного вызова func(arg) по списку аргументов, мс"""
+    started = time.perf_counter()
+    for arg in args:
+        func(arg)
+    return (time.perf_counter() - started) / len(args) * 1000 if args else 0.0
+
+
+def _git_commit() -> str:
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+            cwd=Path(__file__).resolve().parent, timeout=5
+        ).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def bench_extraction(pages: list, repeat: int) -> dict:
+    """Прежний путь (parse_html и отдельно _extract_best_offer_price) и ExtractionPlan"""
+    legacy = CSMarketParser()
+    plan = get_extraction_plan(URL)
+    soups = [BeautifulSoup(html, 'html.parser') for html in pages]
+
+    def best_offer(soup):
+        legacy.soup = soup
+        legacy._extract_best_offer_price()
+
+    return {
+        'extraction.legacy_ms_per_page': _timeit(lambda html: legacy.parse_html(html, URL), pages, repeat),
+        'extraction.best_offer_ms_per_page': _timeit(best_offer, soups, repeat),
+        'extraction.plan_ms_per_page': _timeit(lambda html: plan.extract(html, URL), pages, repeat),
+    }
+
+
+def bench_database(db_path: str, size: int, ops: int, repeat: int, seed: int) -> tuple:
+    """
+    Загружает синтетический портфель размера size и замеряет операции коннектора
+
+    Returns:
+        (метрики, база с загруженным портфелем)
+    """
+    rng = random.Random(seed)
+    prefix = f'db.{size}.'
+    metrics = {}
+    with _quiet():
+        db = CSMarketDatabase(db_path=db_path, default_user_id=USER_ID)
+        portfolio = generate_portfolio(size, seed)
+        started = time.perf_counter()
+        db.upsert_items(portfolio)
+        metrics[prefix + 'bulk_load_ms'] = (time.perf_counter() - started) * 1000
+
+        extra = generate_portfolio(ops, seed + 1)
+        for item in extra:
+            item['url'] += '-added'
+        metrics[prefix + 'add_item_ms'] = _per_op_ms(db.add_item, extra)
+
+        changes = [
+            {'url': item['url'], 'title': item['title'], 'price': f'${rng.uniform(0.03, 2500):.2f}'}
+            for item in rng.sample(portfolio, min(ops, size))
+        ]
+        metrics[prefix + 'update_item_ms'] = _per_op_ms(db.update_item, changes)
+
+        metrics[prefix + 'get_all_items_ms'] = _best_ms(db.get_all_items, repeat)
+        # Кэш портфеля общий для всех экземпляров с тем же файлом, поэтому чтение
+        # с диска (промах кэша, первый вызов в процессе) замеряется отдельно
+        metrics[prefix + 'load_all_items_ms'] = _best_ms(db._load_all_items, repeat)
+        metrics[prefix + 'get_items_page_ms'] = _best_ms(
+            lambda: db.get_items_page(USER_ID, config.LIST_PAGE_SIZE), repeat
+        )
+    return metrics, db
+
+
+def bench_reports(db: CSMarketDatabase, size: int, repeat: int) -> dict:
+    """Страница статистики (render_items_page) и периодический отчет (_generate_report)"""
+    from item_tracker_bot import handlers, updater
+    from item_tracker_bot.constants import ListViews
+
+    # Обработчики и обновлятель работают с модульным db - подставляем базу бенчмарка
+    handlers.db = db
+    updater.db = db
+    prefix = f'reports.{size}.'
+    items = [item for item in db.portfolio_snapshot().items if item['user_id'] == USER_ID]
+    # Первый отчет после изменения портфеля пересчитывает рейтинги, следующие берут их из кэша
+    report_first_ms = _best_ms(lambda: updater._generate_report(USER_ID, items), 1)
+    return {
+        prefix + 'stats_page_ms': _best_ms(lambda: handlers.render_items_page(USER_ID, ListViews.STATS), repeat),
+        prefix + 'report_first_ms': report_first_ms,
+        prefix + 'report_ms': _best_ms(lambda: updater._generate_report(USER_ID, items), repeat),
+    }
+
+
+def compare(metrics: dict, baseline: dict, tolerance: float) -> dict:
+    """
+    Сравнивает метрики с базовым прогоном
+
+    Args:
+        metrics: Метрики текущего прогона
+        baseline: Результаты прошлого прогона (содержимое JSON)
+        tolerance: Допустимое изменение (доля), больше которого отличие считается значимым
+
+    Returns:
+        {'baseline_commit', 'ratios': {метрика: новое/старое}, 'regressions': [...], 'improvements': [...]}
+    """
+    ratios = {}
+    old_metrics = baseline.get('metrics', {})
+    for name, value in metrics.items():
+        old = old_metrics.get(name)
+        if old and value is not None:
+            ratios[name] = round(value / old, 3)
+    return {
+        'baseline_commit': baseline.get('commit'),
+        'tolerance': tolerance,
+        'ratios': ratios,
+        'regressions': sorted(name for name, ratio in ratios.items() if ratio > 1 + tolerance),
+        'improvements': sorted(name for name, ratio in ratios.items() if ratio < 1 - tolerance),
+    }
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    arg_parser.add_argument('--sizes', default='100,10000,100000', help='Размеры портфеля через запятую')
+    arg_parser.add_argument('--pages', help='Каталог с сохраненными страницами (*.html)')
+    arg_parser.add_argument('--save-corpus', help='Записать синтетические страницы в каталог и выйти')
+    arg_parser.add_argument('--only', default=','.join(SECTIONS), help='Разделы через запятую')
+    arg_parser.add_argument('--ops', type=int, default=200, help='Сколько add_item/update_item на размер')
+    arg_parser.add_argument('--repeat', type=int, default=3)
+    arg_parser.add_argument('--seed', type=int, default=42)
+    arg_parser.add_argument('--json', help='Куда записать результаты в JSON')
+    arg_parser.add_argument('--compare', help='JSON прошлого прогона для сравнения')
+    arg_parser.add_argument('--tolerance', type=float, default=0.2,
+                            help='Допустимое замедление (доля) до признания регрессии')
+    args = arg_parser.parse_args()
+
+    if args.save_corpus:
+        corpus = Path(args.save_corpus)
+        corpus.mkdir(parents=True, exist_ok=True)
+        for number, html in enumerate(generate_item_pages(30, args.seed)):
+            (corpus / f'page_{number:03d}.html').write_text(html, encoding='utf-8')
+        print(f"Корпус записан: {corpus}")
+        return
+
+    sections = [name.strip() for name in args.only.split(',') if name.strip()]
+    unknown = set(sections) - set(SECTIONS)
+    if unknown:
+        arg_parser.error(f"неизвестные разделы: {', '.join(sorted(unknown))}")
+    sizes = [int(size) for size in args.sizes.split(',') if size.strip()]
+
+    tmp_dir = tempfile.TemporaryDirectory(prefix='tracker-bench-')
+    # Модули бота открывают базу при импорте - направляем их во временный каталог
+    config.DATABASE_PATH = str(Path(tmp_dir.name) / 'bot.db')
+    if not config.BOT_TOKEN or ':' not in config.BOT_TOKEN:
+        config.BOT_TOKEN = '123456:bench'
+
+    metrics = {}
+    info = {}
+    if 'extraction' in sections:
+        pages = _load_pages(args.pages)
+        info['pages'] = len(pages)
+        info['corpus'] = args.pages or 'synthetic'
+        metrics.update(bench_extraction(pages, args.repeat))
+
+    if 'db' in sections or 'reports' in sections:
+        for size in sizes:
+            db_metrics, db = bench_database(
+                str(Path(tmp_dir.name) / f'bench_{size}.db'), size, args.ops, args.repeat, args.seed
+            )
+            if 'db' in sections:
+                metrics.update(db_metrics)
+            if 'reports' in sections:
+                with _quiet():
+                    metrics.update(bench_reports(db, size, args.repeat))
+            print(f"Размер {size}: готово", file=sys.stderr)
+
+    results = {
+        'benchmark': 'suite',
+        'commit': _git_commit(),
+        'python': platform.python_version(),
+        'sizes': sizes,
+        'ops': args.ops,
+        'repeat': args.repeat,
+        **info,
+        'metrics': {name: round(value, 4) for name, value in metrics.items()},
+    }
+    if args.compare:
+        baseline = json.loads(Path(args.compare).read_text(encoding='utf-8'))
+        results['comparison'] = compare(results['metrics'], baseline, args.tolerance)
+
+    print(json.dumps(results, ensure_ascii=False, indent=2))
+    if args.json:
+        Path(args.json).write_text(json.dumps(results, ensure_ascii=False, indent=2), encoding='utf-8')
+    tmp_dir.cleanup()
+    if args.compare and results['comparison']['regressions']:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
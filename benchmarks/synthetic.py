@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+"""
+Генераторы синтетических данных для бенчмарков: страницы предметов
+и портфели произвольного размера.
+"""
+import random
+from typing import List
+
+
+def _noise_block(rng: random.Random, rows: int) -> str:
+    """Блок «похожих предложений»: много элементов с классами *price*"""
+    parts = ['<section class="similar">']
+    for i in range(rows):
+        price = rng.uniform(0.1, 500)
+        parts.append(
+            f'<div class="card"><a href="/item/{i}"><span class="card-title">Item {i}</span>'
+            f'<div class="card-price"><span class="price-value">{price:.2f}</span> $</div>'
+            f'<span class="price-old">${price * 1.1:.2f}</span></a></div>'
+        )
+    parts.append('</section>')
+    return ''.join(parts)
+
+
+def generate_item_page(rng: random.Random, variant: str = 'normal', noise_rows: int = 400) -> str:
+    """
+    Генерирует HTML отрендеренной страницы предмета
+
+    Args:
+        rng: Генератор случайных чисел (для воспроизводимости)
+        variant: 'normal', 'no_best_offer', 'empty_title' или 'not_found'
+        noise_rows: Сколько посторонних карточек с ценами добавить
+    """
+    title = f"AK-47 | Redline (Field-Tested) #{rng.randint(1, 10 ** 6)}"
+    best = rng.uniform(1, 1000)
+    head = '<head><title>Market</title>' + ''.join(
+        f'<script>window.__chunk{i}="{"x" * 2000}";</script>' for i in range(20)
+    ) + '<style>.price{color:red}</style></head>'
+    nav = '<nav>' + ''.join(f'<a class="nav-link" href="/c/{i}">Category {i}</a>' for i in range(50)) + '</nav>'
+
+    if variant == 'not_found':
+        # Страница рынка "не найдено" рендерится компонентом app-not-found (см. parser/readiness.py)
+        body = f'{nav}<app-not-found><h1>404</h1><p>Page not found</p></app-not-found>'
+    else:
+        h1 = ('<h1 class="name"><span> </span></h1><div class="name"><span>' + title + '</span></div>'
+              if variant == 'empty_title' else f'<h1 class="name"><span>{title}</span></h1>')
+        offer = ('' if variant == 'no_best_offer'
+                 else f'<div class="best-offer"><span>Best offer</span> <b>${best:.2f}</b></div>')
+        body = (
+            f'{nav}<main>{_noise_block(rng, noise_rows // 2)}{h1}'
+            f'<div class="item-info"><span class="price">${best * 0.9:.2f}</span></div>'
+            f'{offer}{_noise_block(rng, noise_rows // 2)}</main>'
+        )
+    return f'<!DOCTYPE html><html>{head}<body><app-root>{body}</app-root></body></html>'
+
+
+def generate_item_pages(count: int, seed: int = 42, noise_rows: int = 400) -> List[str]:
+    """Набор страниц с разными вариантами разметки"""
+    rng = random.Random(seed)
+    variants = ['normal', 'normal', 'normal', 'no_best_offer', 'empty_title', 'not_found']
+    return [generate_item_page(rng, variants[i % len(variants)], noise_rows) for i in range(count)]
+
+
+def generate_portfolio(count: int, seed: int = 42) -> List[dict]:
+    """
+    Синтетический портфель в формате upsert_items: {'url', 'title', 'price', 'purchase_price'}.
+    Часть предметов без цены закупки или без текущей цены, как в реальной базе.
+    """
+    rng = random.Random(seed)
+    items = []
+    for i in range(count):
+        current = round(rng.uniform(0.03, 2500), 2)
+        purchase = 0 if rng.random() < 0.1 else round(current * rng.uniform(0.5, 1.6), 2)
+        items.append({
+            'url': f'https://market.csgo.com/en/Rifle/AK-47/synthetic-{i}',
+            'title': f'AK-47 | Synthetic #{i}',
+            'price': None if rng.random() < 0.02 else f'${current:.2f}',
+            'purchase_price': purchase,
+        })
+    return items
@@ -10,18 +10,122 @@ class BotConfig:
         # Токен бота (получить от @BotFather)
         self.BOT_TOKEN: Optional[str] = os.getenv('BOT_TOKEN', 'YOUR_BOT_TOKEN_HERE')
         
+        # Режим работы: 'threaded' (polling + фоновый поток) или 'asyncio' (AsyncTeleBot, один цикл событий)
+        self.BOT_RUNTIME: str = os.getenv('BOT_RUNTIME', 'threaded')
+        # Размеры пулов потоков для блокирующей работы в режиме asyncio
+        self.ASYNC_SCRAPE_WORKERS: int = int(os.getenv('ASYNC_SCRAPE_WORKERS', '4'))
+        self.ASYNC_DB_WORKERS: int = int(os.getenv('ASYNC_DB_WORKERS', '4'))
+        
+        # Прием обновлений: 'polling' (long polling) или 'webhook' (встроенный HTTP-сервер)
+        self.BOT_RECEIVE_MODE: str = os.getenv('BOT_RECEIVE_MODE', 'polling')
+        # Публичный адрес webhook для setWebhook (None - адрес уже зарегистрирован или это локальная проверка)
+        self.WEBHOOK_URL: Optional[str] = os.getenv('WEBHOOK_URL') or None
+        self.WEBHOOK_LISTEN: str = os.getenv('WEBHOOK_LISTEN', '0.0.0.0')
+        self.WEBHOOK_PORT: int = int(os.getenv('WEBHOOK_PORT', '8443'))
+        self.WEBHOOK_PATH: str = os.getenv('WEBHOOK_PATH', '/telegram/webhook')
+        self.WEBHOOK_SECRET: Optional[str] = os.getenv('WEBHOOK_SECRET') or None  # Проверяется в каждом запросе
+        self.WEBHOOK_WORKERS: int = int(os.getenv('WEBHOOK_WORKERS', '4'))  # Потоков обработки обновлений
+        self.WEBHOOK_MAX_PENDING: int = 1000  # Предел очереди обновлений (дальше - ответ 503)
+        
+        # Метрики в формате Prometheus по GET /metrics (0 - сервер метрик не запускается)
+        self.METRICS_LISTEN: str = os.getenv('METRICS_LISTEN', '127.0.0.1')
+        self.METRICS_PORT: int = int(os.getenv('METRICS_PORT', '0'))
+        
         # ID администратора (для рассылки уведомлений)
         self.ADMIN_ID: Optional[int] = int(os.getenv('ADMIN_ID', '535511089'))  # Заглушка
+        # Пользователи, которым разрешен доступ (через запятую); у каждого свой портфель
+        self.ALLOWED_USER_IDS: set = {
+            int(user_id) for user_id in os.getenv('ALLOWED_USER_IDS', '').split(',') if user_id.strip()
+        }
+        # Открытый доступ: бот доступен любому пользователю Telegram
+        self.OPEN_ACCESS: bool = os.getenv('OPEN_ACCESS', '0') == '1'
         
         # Абсолютный путь к базе данных (гарантирует корректную работу вне зависимости от текущей директории)
         project_root = Path(__file__).resolve().parent
         self.DATABASE_PATH: str = str(project_root / 'db' / 'cs_market.db')
+        self.DB_BUSY_TIMEOUT_MS: int = int(os.getenv('DB_BUSY_TIMEOUT_MS', '5000'))  # Ожидание блокировки записи
+        
+        # Хранение истории цен: сырые точки N дней, затем часовые агрегаты, после - дневные
+        self.PRICE_HISTORY_RAW_DAYS: int = int(os.getenv('PRICE_HISTORY_RAW_DAYS', '14'))
+        self.PRICE_HISTORY_HOURLY_DAYS: int = int(os.getenv('PRICE_HISTORY_HOURLY_DAYS', '180'))
+        self.PRICE_HISTORY_COMPACT_HOURS: float = 1  # Политика хранения применяется не чаще раза в N часов
         
         # Настройки парсера
-        self.PARSER_WAIT_TIME: int = 5  # Время ожидания загрузки страницы
+        self.PARSER_WAIT_TIME: int = 5  # Максимальное время ожидания готовности страницы
+        
+        # Настройки пула браузеров (общий для добавления предметов и обновления цен)
+        self.BROWSER_POOL_SIZE: int = int(os.getenv('BROWSER_POOL_SIZE', '1'))  # Количество браузеров
+        self.BROWSER_TABS_PER_BROWSER: int = int(os.getenv('BROWSER_TABS_PER_BROWSER', '2'))  # Вкладок на браузер
+        self.BROWSER_ACQUIRE_TIMEOUT: int = 60  # Сколько секунд ждать свободную вкладку
+        self.BROWSER_HEALTH_CHECK_SECONDS: int = 300  # Проверка упавших браузеров не чаще раза в N секунд
+        
+        # Легкая загрузка без браузера (браузер используется, только если цену так получить не удалось)
+        self.PARSER_HTTP_FIRST: bool = os.getenv('PARSER_HTTP_FIRST', '1') == '1'
+        self.HTTP_TIMEOUT: int = 10  # Таймаут HTTP-запроса в секундах
+        self.HTTP_POOL_SIZE: int = 10  # Keep-alive соединений на хост
+        
+        # Извлечение полей в браузере: 'js' - скриптом на странице, 'html' - разбором page.html
+        self.PARSER_EXTRACTION_MODE: str = os.getenv('PARSER_EXTRACTION_MODE', 'js')
+        
+        # Источник страниц: 'live' - рынок и браузер, 'record' - то же с записью ответов в кассету,
+        # 'replay' - ответы из кассеты без сети и браузера (нагрузочные прогоны)
+        self.PARSER_TRANSPORT: str = os.getenv('PARSER_TRANSPORT', 'live')
+        self.PARSER_CASSETTE: str = os.getenv('PARSER_CASSETTE', str(project_root / 'db' / 'cassette.jsonl'))
+        self.REPLAY_LATENCY_MS: float = float(os.getenv('REPLAY_LATENCY_MS', '0'))  # Задержка ответа
+        self.REPLAY_JITTER_MS: float = float(os.getenv('REPLAY_JITTER_MS', '0'))  # Случайная добавка к задержке
+        self.REPLAY_ERROR_RATE: float = float(os.getenv('REPLAY_ERROR_RATE', '0'))  # Доля ответов с ошибкой
+        self.REPLAY_SEED: int = int(os.getenv('REPLAY_SEED', '0'))
+        
+        # Фоновая очередь добавления предметов
+        self.ADD_JOB_WORKERS: int = int(os.getenv('ADD_JOB_WORKERS', '1'))  # Заданий выполняется одновременно
+        self.ADD_JOB_MAX_ATTEMPTS: int = 2  # Попыток загрузить страницу
+        self.ADD_JOB_RETRY_SECONDS: float = 15  # Пауза перед повтором (удваивается с каждой попыткой)
+        
+        # Настройки цикла обновления
+        self.UPDATER_CONCURRENCY: int = int(os.getenv('UPDATER_CONCURRENCY', '2'))  # Предметов загружается одновременно
+        # Ограничение частоты запросов по доменам: (запросов в секунду, допустимый всплеск)
+        self.DOMAIN_RATE_LIMITS: dict = {
+            'market.csgo.com': (0.5, 2),
+            'steamcommunity.com': (0.2, 1),
+        }
+        
+        # Адаптивное расписание обновления: у каждого предмета свой интервал проверки
+        self.REFRESH_REQUESTS_PER_HOUR: int = int(os.getenv('REFRESH_REQUESTS_PER_HOUR', '120'))  # Общий бюджет проверок
+        self.REFRESH_BASE_INTERVAL_HOURS: float = 4  # Интервал для новых предметов
+        self.REFRESH_MIN_INTERVAL_MINUTES: float = 15  # Для предметов с быстро меняющейся ценой
+        self.REFRESH_MAX_INTERVAL_HOURS: float = 24  # Потолок для стабильных предметов
+        self.REFRESH_BACKOFF: float = 1.5  # Рост интервала, если цена не изменилась
+        self.REFRESH_VIEW_INTERVAL_MINUTES: float = 30  # Просмотренный предмет проверяется не позже чем через
+        self.SCHEDULER_TICK_SECONDS: int = 60  # Максимальная пауза между проверками очереди
+        # Добавление предмета, который уже отслеживается, не загружает страницу, если каталог проверял ее недавно
+        self.CATALOG_FRESH_MINUTES: float = 15
+        
+        # Трассировка циклов обновления: этапы загрузки каждого предмета JSON-строками в каталоге логов
+        self.TRACE_ENABLED: bool = os.getenv('TRACE_ENABLED', '1') == '1'
+        self.TRACE_DIR: str = os.getenv('TRACE_DIR', str(project_root / 'logs' / 'traces'))
+        self.TRACE_MAX_MB: float = float(os.getenv('TRACE_MAX_MB', '20'))  # Размер файла до ротации
+        self.TRACE_RAW_DAYS: int = int(os.getenv('TRACE_RAW_DAYS', '3'))  # Полные трассы, затем только сводки циклов
+        self.TRACE_KEEP_DAYS: int = int(os.getenv('TRACE_KEEP_DAYS', '30'))  # Старше - удаляются
+        self.TRACE_SLOWEST: int = 10  # Самых медленных предметов в сводке цикла
+        
+        # Размер страницы в списках предметов (статистика, редактирование, удаление)
+        self.LIST_PAGE_SIZE: int = 10
         
         # Настройки рассылки
         self.NOTIFICATION_INTERVAL_HOURS: int = 4  # Интервал рассылки в часах
+        self.REPORT_WORKERS: int = int(os.getenv('REPORT_WORKERS', '4'))  # Потоков подготовки отчетов пользователям
+        
+        # Уведомления о цене: повторный взвод после возврата цены за порог на N% и пауза между срабатываниями
+        self.ALERT_HYSTERESIS_PERCENT: float = 2
+        self.ALERT_DEBOUNCE_MINUTES: float = float(os.getenv('ALERT_DEBOUNCE_MINUTES', '30'))
+        
+        # Очередь исходящих сообщений (ограничения Telegram: ~30 сообщений/сек на бота, ~1/сек в чат)
+        self.OUTBOX_GLOBAL_RATE: float = float(os.getenv('OUTBOX_GLOBAL_RATE', '25'))
+        self.OUTBOX_CHAT_RATE: float = float(os.getenv('OUTBOX_CHAT_RATE', '1'))
+        self.OUTBOX_CHAT_BURST: float = 3  # Допустимый всплеск сообщений в один чат
+        self.OUTBOX_MAX_RETRIES: int = 5  # Повторов при сетевых ошибках и 5xx
+        # Адрес Bot API в формате telebot (например, http://127.0.0.1:8081/bot{0}/{1} для локального сервера)
+        self.TELEGRAM_API_URL: Optional[str] = os.getenv('TELEGRAM_API_URL') or None
         
         # Разрешенные домены для добавления ссылок
         self.ALLOWED_DOMAINS: list = [
@@ -36,6 +140,10 @@ class BotConfig:
     def is_admin(self, user_id: int) -> bool:
         """Проверяет, является ли пользователь администратором"""
         return user_id == self.ADMIN_ID
+    
+    def is_allowed(self, user_id: int) -> bool:
+        """Проверяет, разрешен ли пользователю доступ к боту"""
+        return self.OPEN_ACCESS or self.is_admin(user_id) or user_id in self.ALLOWED_USER_IDS
         
     def validate_config(self) -> bool:
         """Проверяет корректность конфигурации"""
@@ -45,6 +153,21 @@ class BotConfig:
             
         if not self.ADMIN_ID or self.ADMIN_ID == 0:
             print("⚠️  Не установлен ID администратора! Рассылка будет отключена")
+        
+        if self.PARSER_TRANSPORT not in ('live', 'record', 'replay'):
+            print(f"❌ Неизвестный источник страниц: {self.PARSER_TRANSPORT} (live, record или replay)")
+            return False
+        
+        if self.PARSER_TRANSPORT == 'replay' and not Path(self.PARSER_CASSETTE).exists():
+            print(f"❌ Кассета для воспроизведения не найдена: {self.PARSER_CASSETTE}")
+            return False
+        
+        if self.BOT_RECEIVE_MODE not in ('polling', 'webhook'):
+            print(f"❌ Неизвестный режим приема обновлений: {self.BOT_RECEIVE_MODE} (polling или webhook)")
+            return False
+        
+        if self.BOT_RECEIVE_MODE == 'webhook' and not self.WEBHOOK_SECRET:
+            print("⚠️  Не установлен WEBHOOK_SECRET! Webhook примет запросы от кого угодно")
             
         return True
 
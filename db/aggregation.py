@@ -0,0 +1,209 @@
+import heapq
+import threading
+from typing import Dict, Any, List, Optional, Iterable, Tuple
+
+from db.models import Item
+from db.cache import PortfolioCache
+
+
+def _cents(value: Optional[float]) -> int:
+    return int(round((value or 0) * 100))
+
+
+class _ItemState:
+    """Вклад одного предмета в итоги портфеля"""
+    __slots__ = ('id', 'user_id', 'title', 'purchase', 'current', 'profit', 'percent', 'purchase_cents', 'current_cents')
+
+    def __init__(self, item_data: Dict[str, Any]):
+        item = Item.from_dict(item_data)
+        self.id = item.id
+        self.user_id = item_data.get('user_id')
+        self.title = item.title
+        self.purchase = item.purchase_price or 0
+        self.current = item.current_price or 0
+        # Та же формула, что и в Item.calculate_profit, считается один раз при изменении строки
+        self.profit, self.percent = item.calculate_profit()
+        self.purchase_cents = _cents(self.purchase)
+        self.current_cents = _cents(self.current)
+
+    @property
+    def sign(self) -> int:
+        return (self.profit > 0) - (self.profit < 0)
+
+
+class _Totals:
+    """Суммы и счетчики одного портфеля (или всех портфелей вместе)"""
+    __slots__ = ('count', 'purchase_cents', 'current_cents', 'signs')
+
+    def __init__(self):
+        self.count = 0
+        self.purchase_cents = 0
+        self.current_cents = 0
+        self.signs = {1: 0, 0: 0, -1: 0}
+
+    def apply(self, state: _ItemState, direction: int):
+        self.count += direction
+        self.purchase_cents += direction * state.purchase_cents
+        self.current_cents += direction * state.current_cents
+        self.signs[state.sign] += direction
+
+
+class PortfolioAggregator:
+    """
+    Итоги портфеля, обновляемые по мере изменения отдельных предметов.
+
+    Подписывается на кэш портфеля: полная загрузка пересчитывает все за O(n),
+    а каждое изменение цены или цены закупки правит суммы и счетчики за O(1)
+    на предмет. Суммы хранятся в центах, поэтому не накапливают ошибку
+    округления. Рейтинги (лучшие/худшие, главные изменения) строятся лениво и
+    запоминаются до следующей версии.
+
+    Итоги ведутся и по всем предметам, и по каждому владельцу (user_id):
+    изменение предмета правит оба набора сумм, поэтому итоги пользователя
+    не требуют ни запроса к базе, ни прохода по чужим предметам.
+    """
+
+    def __init__(self, cache: PortfolioCache, top_n: int = 5):
+        """
+        Args:
+            cache: Кэш портфеля, на изменения которого подписывается агрегатор
+            top_n: Сколько предметов показывать в рейтингах
+        """
+        self._cache = cache
+        self.top_n = top_n
+        self._lock = threading.Lock()
+        self._items: Dict[int, _ItemState] = {}
+        # Изменение текущей цены в процентах при последнем обновлении предмета
+        self._moves: Dict[int, float] = {}
+        self._version = 0
+        # Итоги: ключ None - все предметы, иначе user_id владельца
+        self._totals: Dict[Optional[int], _Totals] = {None: _Totals()}
+        # Предметы каждого владельца (для рейтингов пользователя)
+        self._by_user: Dict[Optional[int], Dict[int, _ItemState]] = {}
+        # Рейтинги, запомненные для версии: {user_id или None: (версия, рейтинги)}
+        self._rankings: Dict[Optional[int], Tuple[int, Dict[str, List[Dict[str, Any]]]]] = {}
+        cache.add_listener(self._on_change)
+
+    def _add(self, state: _ItemState):
+        self._items[state.id] = state
+        self._by_user.setdefault(state.user_id, {})[state.id] = state
+        self._totals[None].apply(state, 1)
+        self._totals.setdefault(state.user_id, _Totals()).apply(state, 1)
+
+    def _remove(self, item_id: int) -> Optional[_ItemState]:
+        state = self._items.pop(item_id, None)
+        if state is not None:
+            self._by_user[state.user_id].pop(item_id, None)
+            self._totals[None].apply(state, -1)
+            self._totals[state.user_id].apply(state, -1)
+        return state
+
+    def _on_change(self, version: int, upserted: Iterable[Dict[str, Any]], removed: Iterable[int], reset: bool):
+        """Обработчик изменений кэша (вызывается под блокировкой кэша, по порядку версий)"""
+        with self._lock:
+            if reset:
+                self._items.clear()
+                self._moves.clear()
+                self._by_user.clear()
+                self._totals = {None: _Totals()}
+            for item_id in removed:
+                self._remove(item_id)
+                self._moves.pop(item_id, None)
+            for item_data in upserted:
+                state = _ItemState(item_data)
+                previous = self._remove(state.id)
+                if previous is not None and previous.current and state.current != previous.current:
+                    self._moves[state.id] = (state.current - previous.current) / previous.current * 100
+                self._add(state)
+            self._version = version
+
+    def summary(self, user_id: Optional[int] = None) -> Dict[str, Any]:
+        """
+        Итоги портфеля (загружает портфель при первом обращении)
+
+        Args:
+            user_id: Владелец портфеля (None - все предметы)
+
+        Returns:
+            Словарь: version, count, total_purchase, total_current, total_profit,
+            total_profit_percent, winners, losers, flat
+        """
+        self._cache.snapshot()
+        with self._lock:
+            totals = self._totals.get(user_id) or _Totals()
+            total_purchase = totals.purchase_cents / 100
+            total_current = totals.current_cents / 100
+            total_profit = (totals.current_cents - totals.purchase_cents) / 100
+            return {
+                'version': self._version,
+                'count': totals.count,
+                'total_purchase': total_purchase,
+                'total_current': total_current,
+                'total_profit': total_profit,
+                'total_profit_percent': (total_profit / total_purchase * 100) if total_purchase > 0 else 0,
+                'winners': totals.signs[1],
+                'losers': totals.signs[-1],
+                'flat': totals.signs[0],
+            }
+
+    def users(self) -> List[int]:
+        """Владельцы, у которых есть предметы"""
+        self._cache.snapshot()
+        with self._lock:
+            return [user_id for user_id, items in self._by_user.items() if items and user_id is not None]
+
+    def item_profit(self, item_id: int) -> Tuple[float, float]:
+        """Прибыль предмета (абсолютная, %) без повторного расчета"""
+        with self._lock:
+            state = self._items.get(item_id)
+            return (state.profit, state.percent) if state else (0.0, 0.0)
+
+    def rankings(self, user_id: Optional[int] = None) -> Dict[str, List[Dict[str, Any]]]:
+        """
+        Рейтинги предметов (пересчитываются не чаще одного раза на версию)
+
+        Args:
+            user_id: Владелец портфеля (None - все предметы)
+
+        Returns:
+            {'top_gainers', 'top_losers', 'top_movers'}: списки {'id', 'title', 'profit', 'percent'}
+            (для top_movers 'percent' - изменение цены при последнем обновлении)
+        """
+        self._cache.snapshot()
+        with self._lock:
+            cached = self._rankings.get(user_id)
+            if cached is not None and cached[0] == self._version:
+                return cached[1]
+            items = self._items if user_id is None else self._by_user.get(user_id, {})
+
+            def row(state: _ItemState, percent: float) -> Dict[str, Any]:
+                return {'id': state.id, 'title': state.title, 'profit': state.profit, 'percent': percent}
+
+            with_purchase = [s for s in items.values() if s.purchase > 0]
+            gainers = heapq.nlargest(self.top_n, (s for s in with_purchase if s.profit > 0), key=lambda s: s.percent)
+            losers = heapq.nsmallest(self.top_n, (s for s in with_purchase if s.profit < 0), key=lambda s: s.percent)
+            moves = self._moves.items() if user_id is None else \
+                ((item_id, self._moves[item_id]) for item_id in items if item_id in self._moves)
+            movers = heapq.nlargest(self.top_n, moves, key=lambda move: abs(move[1]))
+            rankings = {
+                'top_gainers': [row(s, s.percent) for s in gainers],
+                'top_losers': [row(s, s.percent) for s in losers],
+                'top_movers': [row(self._items[item_id], change) for item_id, change in movers],
+            }
+            if cached is None or cached[0] != self._version:
+                # Рейтинги прошлых версий больше не нужны
+                self._rankings = {key: value for key, value in self._rankings.items() if value[0] == self._version}
+            self._rankings[user_id] = (self._version, rankings)
+            return rankings
+
+
+_aggregators: Dict[int, PortfolioAggregator] = {}
+_aggregators_lock = threading.Lock()
+
+
+def get_portfolio_aggregator(cache: PortfolioCache) -> PortfolioAggregator:
+    """Возвращает агрегатор, подписанный на данный кэш (один на кэш)"""
+    with _aggregators_lock:
+        if id(cache) not in _aggregators:
+            _aggregators[id(cache)] = PortfolioAggregator(cache)
+        return _aggregators[id(cache)]
@@ -0,0 +1,127 @@
+from typing import Dict, Any, List, Optional, Tuple
+
+from db.connection import ConnectionManager, timed_method
+
+
+class AlertStore:
+    """
+    Уведомления о цене, заданные пользователями для своих предметов.
+
+    Виды (kind): above/below - цена выше/ниже порога в долларах,
+    profit_above/profit_below - прибыль от цены закупки выше/ниже порога в
+    процентах, move - изменение цены между двумя наблюдениями не меньше
+    порога в процентах. armed=0 - уведомление сработало и ждет возврата цены
+    за порог (гистерезис), last_fired_at - время последнего срабатывания (unix).
+    """
+
+    ABOVE = 'above'
+    BELOW = 'below'
+    PROFIT_ABOVE = 'profit_above'
+    PROFIT_BELOW = 'profit_below'
+    MOVE = 'move'
+    KINDS = (ABOVE, BELOW, PROFIT_ABOVE, PROFIT_BELOW, MOVE)
+
+    def __init__(self, connections: ConnectionManager):
+        """
+        Args:
+            connections: Менеджер соединений базы данных (общий с CSMarketDatabase)
+        """
+        self._connections = connections
+
+    def create_tables(self):
+        """Создает таблицу уведомлений"""
+        with self._connections.write() as conn:
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS price_alerts (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    item_id INTEGER NOT NULL,
+                    user_id INTEGER NOT NULL,
+                    kind TEXT NOT NULL,
+                    threshold REAL NOT NULL,
+                    armed INTEGER NOT NULL DEFAULT 1,
+                    last_fired_at INTEGER,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            ''')
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_price_alerts_item ON price_alerts(item_id)')
+
+    @staticmethod
+    def _rows(cursor) -> List[Dict[str, Any]]:
+        columns = [column[0] for column in cursor.description]
+        return [dict(zip(columns, row)) for row in cursor.fetchall()]
+
+    @timed_method
+    def add(self, item_id: int, user_id: int, kind: str, threshold: float) -> Dict[str, Any]:
+        """
+        Сохраняет новое уведомление (такое же уже существующее взводится заново)
+
+        Returns:
+            Уведомление: {'id', 'item_id', 'user_id', 'kind', 'threshold', 'armed', 'last_fired_at'}
+        """
+        if kind not in self.KINDS:
+            raise ValueError(f"Неизвестный вид уведомления: {kind}")
+        with self._connections.write() as conn:
+            row = conn.execute(
+                'SELECT id FROM price_alerts WHERE item_id = ? AND kind = ? AND threshold = ?',
+                (item_id, kind, threshold)
+            ).fetchone()
+            if row:
+                conn.execute('UPDATE price_alerts SET armed = 1 WHERE id = ?', (row[0],))
+                alert_id = row[0]
+            else:
+                alert_id = conn.execute(
+                    'INSERT INTO price_alerts (item_id, user_id, kind, threshold) VALUES (?, ?, ?, ?)',
+                    (item_id, user_id, kind, threshold)
+                ).lastrowid
+            cursor = conn.execute(
+                'SELECT id, item_id, user_id, kind, threshold, armed, last_fired_at FROM price_alerts WHERE id = ?',
+                (alert_id,)
+            )
+            return self._rows(cursor)[0]
+
+    @timed_method
+    def remove_for_item(self, item_id: int) -> int:
+        """Удаляет все уведомления предмета, возвращает их количество"""
+        with self._connections.write() as conn:
+            return conn.execute('DELETE FROM price_alerts WHERE item_id = ?', (item_id,)).rowcount
+
+    @timed_method
+    def for_item(self, item_id: int) -> List[Dict[str, Any]]:
+        """Уведомления предмета"""
+        with self._connections.read() as conn:
+            return self._rows(conn.execute(
+                'SELECT id, item_id, user_id, kind, threshold, armed, last_fired_at FROM price_alerts '
+                'WHERE item_id = ? ORDER BY id', (item_id,)
+            ))
+
+    @timed_method
+    def all(self) -> List[Dict[str, Any]]:
+        """Все уведомления (загрузка индекса)"""
+        with self._connections.read() as conn:
+            return self._rows(conn.execute(
+                'SELECT id, item_id, user_id, kind, threshold, armed, last_fired_at FROM price_alerts ORDER BY id'
+            ))
+
+    @timed_method
+    def save_states(self, states: List[Tuple[int, bool, Optional[int]]]):
+        """
+        Сохраняет состояние уведомлений после проверки наблюдений
+
+        Args:
+            states: Список (alert_id, armed, last_fired_at)
+        """
+        if not states:
+            return
+        with self._connections.write() as conn:
+            conn.executemany(
+                'UPDATE price_alerts SET armed = ?, last_fired_at = ? WHERE id = ?',
+                [(int(armed), last_fired_at, alert_id) for alert_id, armed, last_fired_at in states]
+            )
+
+    def stats(self) -> Dict[str, Any]:
+        """Количество уведомлений: всего и ожидающих возврата цены"""
+        with self._connections.read() as conn:
+            total, cooling = conn.execute(
+                'SELECT COUNT(*), COALESCE(SUM(armed = 0), 0) FROM price_alerts'
+            ).fetchone()
+        return {'alerts': total, 'cooling': cooling}
@@ -0,0 +1,148 @@
+import os
+import threading
+from typing import Dict, Any, List, Optional, Callable, Iterable, NamedTuple, Tuple
+
+
+class PortfolioSnapshot(NamedTuple):
+    """Неизменяемый снимок портфеля: версия и строки в порядке updated_at DESC, id DESC"""
+    version: int
+    items: Tuple[Dict[str, Any], ...]
+
+
+def _sort_key(item: Dict[str, Any]):
+    return item['updated_at'] or '', item['id']
+
+
+class PortfolioCache:
+    """
+    Кэш всех предметов в памяти со сквозной записью.
+
+    Снимок загружается из базы один раз; после каждой записи CSMarketDatabase
+    перечитывает только измененные строки и публикует новый снимок с новой
+    версией. Читатели получают целый снимок и никогда не видят
+    наполовину обновленные данные. Записи в файл из других процессов кэш не видит.
+    """
+
+    def __init__(self, load_all: Callable[[], List[Dict[str, Any]]],
+                 load_by_ids: Callable[[List[int]], List[Dict[str, Any]]]):
+        """
+        Args:
+            load_all: Загрузка всех предметов из базы
+            load_by_ids: Загрузка предметов по списку ID
+        """
+        self._load_all = load_all
+        self._load_by_ids = load_by_ids
+        self._lock = threading.Lock()
+        self._snapshot: Optional[PortfolioSnapshot] = None
+        self._version = 0
+        self._hits = 0
+        self._misses = 0
+        self._patches = 0
+        self._invalidations = 0
+        self._listeners: List[Callable] = []
+
+    def snapshot(self) -> PortfolioSnapshot:
+        """Возвращает текущий снимок (загружает из базы только при промахе)"""
+        snapshot = self._snapshot
+        if snapshot is not None:
+            with self._lock:
+                self._hits += 1
+            return snapshot
+        with self._lock:
+            if self._snapshot is None:
+                self._misses += 1
+                items = sorted(self._load_all(), key=_sort_key, reverse=True)
+                self._publish(items, reset=True)
+            else:
+                self._hits += 1
+            return self._snapshot
+
+    def add_listener(self, listener: Callable):
+        """
+        Подписывает на изменения: listener(version, upserted, removed_ids, reset).
+        При reset=True upserted - весь портфель. Если снимок уже загружен,
+        listener сразу получает его целиком.
+        """
+        with self._lock:
+            self._listeners.append(listener)
+            if self._snapshot is not None:
+                listener(self._snapshot.version, self._snapshot.items, [], True)
+
+    def _publish(self, items: List[Dict[str, Any]], upserted: Iterable[Dict[str, Any]] = (),
+                 removed: Iterable[int] = (), reset: bool = False):
+        # Вызывается под self._lock, поэтому подписчики получают изменения строго по порядку версий
+        self._version += 1
+        self._snapshot = PortfolioSnapshot(self._version, tuple(items))
+        for listener in self._listeners:
+            listener(self._version, self._snapshot.items if reset else upserted, removed, reset)
+
+    def refresh_items(self, item_ids: Iterable[int]):
+        """
+        Перечитывает указанные строки из базы и подменяет их в снимке.
+        Чтение выполняется под блокировкой кэша после фиксации записи, поэтому
+        даже при нескольких писателях в снимок попадает последнее состояние.
+        """
+        item_ids = set(item_ids)
+        if not item_ids:
+            return
+        with self._lock:
+            if self._snapshot is None:
+                return
+            # Строки, которых уже нет в базе, просто исчезают из снимка
+            items = [item for item in self._snapshot.items if item['id'] not in item_ids]
+            fresh = self._load_by_ids(list(item_ids))
+            items.extend(fresh)
+            items.sort(key=_sort_key, reverse=True)
+            self._patches += 1
+            self._publish(items, fresh, item_ids - {item['id'] for item in fresh})
+
+    def remove_items(self, item_ids: Iterable[int]):
+        """Убирает удаленные предметы из снимка"""
+        item_ids = set(item_ids)
+        with self._lock:
+            if self._snapshot is None:
+                return
+            self._patches += 1
+            self._publish([item for item in self._snapshot.items if item['id'] not in item_ids], removed=item_ids)
+
+    def invalidate(self):
+        """Сбрасывает снимок: следующее чтение загрузит портфель заново"""
+        with self._lock:
+            self._snapshot = None
+            self._invalidations += 1
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Метрики кэша
+
+        Returns:
+            {'hits', 'misses', 'hit_ratio', 'patches', 'invalidations', 'version', 'size'}
+        """
+        with self._lock:
+            total = self._hits + self._misses
+            return {
+                'hits': self._hits,
+                'misses': self._misses,
+                'hit_ratio': round(self._hits / total, 3) if total else 0.0,
+                'patches': self._patches,
+                'invalidations': self._invalidations,
+                'version': self._version,
+                'size': len(self._snapshot.items) if self._snapshot is not None else 0,
+            }
+
+
+_caches: Dict[str, PortfolioCache] = {}
+_caches_lock = threading.Lock()
+
+
+def get_portfolio_cache(db_path: str, load_all: Callable[[], List[Dict[str, Any]]],
+                        load_by_ids: Callable[[List[int]], List[Dict[str, Any]]]) -> PortfolioCache:
+    """
+    Возвращает общий кэш для файла базы данных, создавая его при первом вызове.
+    Записи любого экземпляра CSMarketDatabase с тем же путем обновляют один и тот же кэш.
+    """
+    key = os.path.abspath(db_path)
+    with _caches_lock:
+        if key not in _caches:
+            _caches[key] = PortfolioCache(load_all, load_by_ids)
+        return _caches[key]
@@ -0,0 +1,138 @@
+import time
+from typing import Dict, Any, Optional
+from urllib.parse import urlsplit, urlunsplit
+
+from db.connection import ConnectionManager, timed_method
+
+
+def normalize_url(url: str) -> str:
+    """
+    Ключ каталога для ссылки на предмет: разные записи одной страницы рынка
+    (русская/английская версия, регистр домена, якорь, завершающий "/") дают один ключ
+    """
+    url = (url or '').strip().replace('/ru/', '/en/')
+    if not url:
+        return url
+    parts = urlsplit(url)
+    path = parts.path.rstrip('/') or '/'
+    return urlunsplit((parts.scheme.lower(), parts.netloc.lower(), path, parts.query, ''))
+
+
+class ItemCatalog:
+    """
+    Каталог рыночных предметов: одна запись на страницу рынка.
+
+    Ключ записи - нормализованный URL (normalize_url). Позиции пользователей
+    (таблица items: цена закупки и прибыль) ссылаются на запись через
+    catalog_id, поэтому цикл обновления загружает страницу один раз, сколько
+    бы пользователей ни следило за предметом, и распространяет цену на все
+    позиции. Название и текущая цена копируются в items в той же транзакции,
+    чтобы чтение портфеля не требовало соединения таблиц.
+    """
+
+    def __init__(self, connections: ConnectionManager):
+        """
+        Args:
+            connections: Менеджер соединений базы данных (общий с CSMarketDatabase)
+        """
+        self._connections = connections
+
+    def create_tables(self):
+        """Создает таблицу каталога и связывает с ней существующие позиции (после создания items)"""
+        with self._connections.write() as conn:
+            cursor = conn.cursor()
+            # checked_at - время последней загрузки страницы (unix-время), updated_at - последнего изменения
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS catalog (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    url TEXT UNIQUE NOT NULL,
+                    title TEXT NOT NULL,
+                    current_price REAL,
+                    checked_at INTEGER,
+                    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            ''')
+
+            cursor.execute("SELECT name FROM pragma_table_info('items')")
+            if 'catalog_id' not in {row[0] for row in cursor.fetchall()}:
+                cursor.execute('ALTER TABLE items ADD COLUMN catalog_id INTEGER')
+            cursor.execute('CREATE INDEX IF NOT EXISTS idx_items_catalog ON items(catalog_id)')
+
+            # Позиции, созданные до появления каталога
+            cursor.execute('SELECT id, url, title, current_price FROM items WHERE catalog_id IS NULL ORDER BY id')
+            orphans = cursor.fetchall()
+            for item_id, url, title, current_price in orphans:
+                catalog_id = self.ensure(cursor, url, title, current_price, checked_at=None)
+                cursor.execute('UPDATE items SET catalog_id = ? WHERE id = ?', (catalog_id, item_id))
+            if orphans:
+                cursor.execute('SELECT COUNT(*) FROM catalog')
+                print(f"Каталог: {len(orphans)} позиций связаны с {cursor.fetchone()[0]} записями")
+
+    @staticmethod
+    def ensure(cursor, url: str, title: str, current_price: Optional[float],
+               checked_at: Optional[int] = 0) -> int:
+        """
+        Добавляет или обновляет запись каталога (в открытой транзакции записи)
+
+        Args:
+            cursor: Курсор открытой транзакции
+            url: Ссылка на предмет (нормализуется)
+            title: Название предмета
+            current_price: Текущая цена
+            checked_at: Время загрузки страницы (0 - сейчас, None - не менять)
+
+        Returns:
+            ID записи каталога
+        """
+        if checked_at == 0:
+            checked_at = int(time.time())
+        cursor.execute('''
+            INSERT INTO catalog (url, title, current_price, checked_at) VALUES (?, ?, ?, ?)
+            ON CONFLICT(url) DO UPDATE SET
+                updated_at = CASE
+                    WHEN catalog.title IS NOT excluded.title OR catalog.current_price IS NOT excluded.current_price
+                    THEN CURRENT_TIMESTAMP ELSE catalog.updated_at
+                END,
+                title = excluded.title,
+                current_price = excluded.current_price,
+                checked_at = COALESCE(excluded.checked_at, catalog.checked_at)
+            RETURNING id
+        ''', (normalize_url(url), title, current_price, checked_at))
+        return cursor.fetchone()[0]
+
+    @staticmethod
+    def prune(cursor, catalog_id: Optional[int]):
+        """Удаляет запись каталога, на которую больше не ссылается ни одна позиция"""
+        if catalog_id is not None:
+            cursor.execute('''
+                DELETE FROM catalog WHERE id = ? AND NOT EXISTS (SELECT 1 FROM items WHERE catalog_id = ?)
+            ''', (catalog_id, catalog_id))
+
+    @timed_method
+    def get(self, url: str) -> Optional[Dict[str, Any]]:
+        """Запись каталога по ссылке (None - предмет еще не отслеживается)"""
+        with self._connections.read() as conn:
+            cursor = conn.execute(
+                'SELECT id, url, title, current_price, checked_at, updated_at FROM catalog WHERE url = ?',
+                (normalize_url(url),)
+            )
+            row = cursor.fetchone()
+            if row is None:
+                return None
+            return dict(zip([column[0] for column in cursor.description], row))
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Размер каталога
+
+        Returns:
+            {'entries', 'positions', 'shared'} - записи каталога, позиции пользователей
+            и записи, за которыми следит больше одной позиции
+        """
+        with self._connections.read() as conn:
+            entries = conn.execute('SELECT COUNT(*) FROM catalog').fetchone()[0]
+            positions, shared = conn.execute('''
+                SELECT COALESCE(SUM(watchers), 0), COALESCE(SUM(watchers > 1), 0)
+                FROM (SELECT COUNT(*) AS watchers FROM items GROUP BY catalog_id)
+            ''').fetchone()
+        return {'entries': entries, 'positions': positions, 'shared': shared}
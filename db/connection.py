@@ -0,0 +1,245 @@
+import atexit
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+from typing import Dict, Any, Callable, Optional
+
+from metrics import DB_BUCKETS, histogram
+
+# Время методов хранилищ (запросы вместе с фиксацией) и отдельно COMMIT; метка - Класс.метод
+DB_QUERY_SECONDS = histogram('tracker_db_query_seconds', 'Время метода хранилища SQLite (сек)', ['method'],
+                             buckets=DB_BUCKETS)
+DB_COMMIT_SECONDS = histogram('tracker_db_commit_seconds', 'Время COMMIT транзакции записи (сек)', ['method'],
+                              buckets=DB_BUCKETS)
+
+
+def timed_method(method: Callable) -> Callable:
+    """
+    Декоратор методов хранилищ (у объекта должен быть self._connections):
+    время вызова пишется в tracker_db_query_seconds, а COMMIT транзакции,
+    открытой внутри вызова, - в tracker_db_commit_seconds с той же меткой.
+    Вложенные вызовы других таких методов (например, запись истории внутри
+    upsert_items) отдельно не замеряются - их время уже входит во внешний вызов.
+    """
+    name = method.__qualname__
+
+    @wraps(method)
+    def wrapper(self, *args, **kwargs):
+        if self._connections.current_operation() is not None:
+            return method(self, *args, **kwargs)
+        started = time.perf_counter()
+        try:
+            with self._connections.operation(name):
+                return method(self, *args, **kwargs)
+        finally:
+            DB_QUERY_SECONDS.observe(time.perf_counter() - started, method=name)
+
+    return wrapper
+
+
+class ConnectionManager:
+    """
+    Долгоживущие соединения SQLite: по одному на поток, с общими настройками.
+
+    База переводится в режим WAL, поэтому чтение (статистика, списки) не ждет
+    записи цикла обновления. Запись выполняется в транзакции BEGIN IMMEDIATE:
+    блокировка берется сразу, а ожидание ограничено busy_timeout.
+    """
+
+    def __init__(self, db_path: str, busy_timeout_ms: int = 5000, cached_statements: int = 256,
+                 mmap_size: int = 64 * 1024 * 1024):
+        """
+        Args:
+            db_path: Путь к файлу базы данных
+            busy_timeout_ms: Сколько ждать освобождения блокировки записи (мс)
+            cached_statements: Размер кэша подготовленных запросов на соединение
+            mmap_size: Объем файла, читаемый через mmap (байт, 0 - выключено)
+        """
+        self.db_path = db_path
+        self.busy_timeout_ms = busy_timeout_ms
+        self.cached_statements = cached_statements
+        self.mmap_size = mmap_size
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        # Открытые соединения: поток -> соединение (для закрытия и очистки после завершения потоков)
+        self._connections: Dict[threading.Thread, sqlite3.Connection] = {}
+        self._opened = 0
+        self._reuses = 0
+        self._writes = 0
+        self._busy_errors = 0
+        self._lock_wait_total = 0.0
+        self._lock_wait_max = 0.0
+
+    def _open(self) -> sqlite3.Connection:
+        # isolation_level=None: транзакциями управляем сами (BEGIN IMMEDIATE / COMMIT)
+        conn = sqlite3.connect(
+            self.db_path,
+            timeout=self.busy_timeout_ms / 1000,
+            isolation_level=None,
+            check_same_thread=False,
+            cached_statements=self.cached_statements,
+        )
+        conn.execute('PRAGMA journal_mode=WAL')
+        # В режиме WAL NORMAL безопасен при сбое приложения и не делает fsync на каждую запись
+        conn.execute('PRAGMA synchronous=NORMAL')
+        conn.execute(f'PRAGMA busy_timeout={int(self.busy_timeout_ms)}')
+        conn.execute(f'PRAGMA mmap_size={int(self.mmap_size)}')
+        conn.execute('PRAGMA temp_store=MEMORY')
+
+        with self._lock:
+            # Закрываем соединения потоков, которые уже завершились
+            for thread in [t for t in self._connections if not t.is_alive()]:
+                self._connections.pop(thread).close()
+            self._connections[threading.current_thread()] = conn
+            self._opened += 1
+        return conn
+
+    def connection(self) -> sqlite3.Connection:
+        """Возвращает соединение текущего потока (открывает при первом обращении)"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = self._local.conn = self._open()
+        else:
+            with self._lock:
+                self._reuses += 1
+        return conn
+
+    def after_commit(self, callback: Callable[[], None], on_error: Optional[Callable[[], None]] = None):
+        """
+        Выполняет callback после фиксации текущей транзакции записи этого потока
+        (при откате callback отбрасывается). Вне транзакции выполняется сразу.
+        
+        Args:
+            callback: Действие после фиксации
+            on_error: Что сделать, если callback упал (например, сбросить кэш, который мог устареть).
+                Данные уже зафиксированы, поэтому ошибка только печатается и не доходит до записи.
+        """
+        conn = self.connection()
+        if not conn.in_transaction:
+            self._run_after_commit(callback, on_error)
+            return
+        self._local.after_commit.append((callback, on_error))
+    
+    @staticmethod
+    def _run_after_commit(callback: Callable[[], None], on_error: Optional[Callable[[], None]]):
+        try:
+            callback()
+        except Exception as e:
+            print(f"Ошибка в обработчике после фиксации транзакции: {e}")
+            if on_error is not None:
+                try:
+                    on_error()
+                except Exception as e:
+                    print(f"Ошибка при восстановлении после сбоя обработчика: {e}")
+
+    def current_operation(self) -> Optional[str]:
+        """Имя операции (timed_method), выполняющейся в этом потоке, или None"""
+        return getattr(self._local, 'operation', None)
+
+    @contextmanager
+    def operation(self, name: str):
+        """Помечает транзакции записи внутри блока именем метода (вложенные вызовы наследуют внешнее имя)"""
+        outer = getattr(self._local, 'operation', None)
+        if outer is None:
+            self._local.operation = name
+        try:
+            yield
+        finally:
+            if outer is None:
+                self._local.operation = None
+
+    @contextmanager
+    def read(self):
+        """Соединение для чтения (каждый запрос видит последнее зафиксированное состояние)"""
+        yield self.connection()
+
+    @contextmanager
+    def write(self):
+        """
+        Транзакция записи: BEGIN IMMEDIATE, затем COMMIT или ROLLBACK при исключении.
+        Вложенный вызов в том же потоке выполняется в уже открытой транзакции.
+        """
+        conn = self.connection()
+        if conn.in_transaction:
+            yield conn
+            return
+
+        started = time.monotonic()
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+        except sqlite3.OperationalError:
+            with self._lock:
+                self._busy_errors += 1
+            raise
+        waited = time.monotonic() - started
+        with self._lock:
+            self._writes += 1
+            self._lock_wait_total += waited
+            self._lock_wait_max = max(self._lock_wait_max, waited)
+
+        self._local.after_commit = []
+        try:
+            yield conn
+        except BaseException:
+            if conn.in_transaction:
+                conn.rollback()
+            self._local.after_commit = []
+            raise
+        else:
+            if conn.in_transaction:
+                committing = time.perf_counter()
+                conn.commit()
+                DB_COMMIT_SECONDS.observe(time.perf_counter() - committing,
+                                          method=getattr(self._local, 'operation', None) or 'other')
+            callbacks, self._local.after_commit = self._local.after_commit, []
+            # Транзакция уже зафиксирована: сбой одного обработчика не отменяет остальные и не делает запись неудачной
+            for callback, on_error in callbacks:
+                self._run_after_commit(callback, on_error)
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Счетчики использования соединений
+
+        Returns:
+            Словарь: открыто/активно соединений, повторных использований,
+            транзакций записи, ожидание блокировки (сумма и максимум, сек), ошибок занятости
+        """
+        with self._lock:
+            return {
+                'opened': self._opened,
+                'open': len(self._connections),
+                'reuses': self._reuses,
+                'writes': self._writes,
+                'lock_wait_total': round(self._lock_wait_total, 4),
+                'lock_wait_max': round(self._lock_wait_max, 4),
+                'busy_errors': self._busy_errors,
+            }
+
+    def close(self):
+        """Закрывает все открытые соединения"""
+        with self._lock:
+            for conn in self._connections.values():
+                conn.close()
+            self._connections.clear()
+        # Соединения других потоков закрыты - их ссылки больше не действительны
+        self._local = threading.local()
+
+
+_managers: Dict[str, ConnectionManager] = {}
+_managers_lock = threading.Lock()
+
+
+def get_connection_manager(db_path: str, busy_timeout_ms: int = 5000) -> ConnectionManager:
+    """
+    Возвращает общий менеджер для файла базы данных, создавая его при первом вызове.
+    Все экземпляры CSMarketDatabase с одним путем используют одни и те же соединения.
+    """
+    key = os.path.abspath(db_path)
+    with _managers_lock:
+        if key not in _managers:
+            _managers[key] = ConnectionManager(db_path, busy_timeout_ms=busy_timeout_ms)
+            atexit.register(_managers[key].close)
+        return _managers[key]
@@ -1,73 +1,183 @@
-import sqlite3
 import json
-from typing import Dict, Any, List, Optional
+import sqlite3
+import time
+from typing import Dict, Any, List, Optional, Tuple
 from datetime import datetime
 
+from db.connection import get_connection_manager, timed_method
+from db.price_history import PriceHistory
+from db.jobs import AddJobStore
+from db.catalog import ItemCatalog, normalize_url
+from db.alerts import AlertStore
+from db.cache import PortfolioSnapshot, get_portfolio_cache
+from db.aggregation import get_portfolio_aggregator
+
 
 class CSMarketDatabase:
     """Класс для работы с базой данных CS:GO маркета"""
     
-    def __init__(self, db_path: str = 'cs_market.db'):
+    # Результаты upsert_items для каждой строки
+    UPSERT_INSERTED = 'inserted'
+    UPSERT_UPDATED = 'updated'
+    UPSERT_UNCHANGED = 'unchanged'
+    UPSERT_SKIPPED = 'skipped'
+    UPSERT_ERROR = 'error'
+    
+    # Поля предмета, которые возвращают методы чтения
+    ITEM_COLUMNS = 'id, user_id, catalog_id, url, title, current_price, purchase_price, profit_percent, created_at, updated_at'
+    
+    def __init__(self, db_path: str = 'cs_market.db', busy_timeout_ms: int = 5000, default_user_id: int = 0):
         """
         Инициализация базы данных
         
         Args:
             db_path: Путь к файлу базы данных
+            busy_timeout_ms: Сколько ждать освобождения блокировки записи (мс)
+            default_user_id: Владелец предметов, для которых пользователь не указан
+                (и предметов из базы, созданной до появления пользователей)
         """
         self.db_path = db_path
+        self.default_user_id = default_user_id
+        # Соединения общие для всех экземпляров с тем же файлом (обработчики и фоновое обновление)
+        self._connections = get_connection_manager(db_path, busy_timeout_ms)
+        # История цен (пополняется при каждой записи текущей цены)
+        self.history = PriceHistory(self._connections)
+        # Задания на добавление предметов (переживают перезапуск бота)
+        self.jobs = AddJobStore(self._connections)
+        # Каталог рыночных предметов: одна запись на страницу рынка, позиции ссылаются на нее
+        self.catalog = ItemCatalog(self._connections)
+        # Уведомления о цене, заданные пользователями
+        self.alerts = AlertStore(self._connections)
+        # Кэш портфеля в памяти: общий для всех экземпляров, обновляется методами записи
+        self.cache = get_portfolio_cache(db_path, self._load_all_items, self._load_items_by_ids)
+        # Итоги портфеля, обновляемые вместе с кэшем
+        self.aggregator = get_portfolio_aggregator(self.cache)
         self.create_tables()
     
+    def _owner(self, item_data: Dict[str, Any]) -> int:
+        """Владелец предмета из словаря данных (по умолчанию default_user_id)"""
+        user_id = item_data.get('user_id')
+        return self.default_user_id if user_id is None else user_id
+    
+    def connection_stats(self) -> Dict[str, Any]:
+        """Счетчики повторного использования соединений и ожидания блокировок"""
+        return self._connections.stats()
+    
     def create_tables(self):
         """Создает таблицы в базе данных"""
-        with sqlite3.connect(self.db_path) as conn:
+        with self._connections.write() as conn:
             cursor = conn.cursor()
             
-            # Создаем таблицу для предметов
+            # База без владельцев предметов: старая таблица пересоздается ниже (UNIQUE(url) -> UNIQUE(user_id, url))
+            cursor.execute("SELECT name FROM pragma_table_info('items')")
+            legacy = {row[0] for row in cursor.fetchall()}
+            if legacy and 'user_id' not in legacy:
+                cursor.execute('ALTER TABLE items RENAME TO items_legacy')
+            
+            # Пользователи бота (id - Telegram ID пользователя)
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS users (
+                    id INTEGER PRIMARY KEY,
+                    chat_id INTEGER NOT NULL,
+                    username TEXT,
+                    active INTEGER NOT NULL DEFAULT 1,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            ''')
+            
+            # Создаем таблицу для предметов (у каждого пользователя свой портфель)
             cursor.execute('''
                 CREATE TABLE IF NOT EXISTS items (
                     id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    url TEXT UNIQUE NOT NULL,
+                    user_id INTEGER NOT NULL,
+                    catalog_id INTEGER,
+                    url TEXT NOT NULL,
                     title TEXT NOT NULL,
                     current_price REAL,
                     purchase_price REAL DEFAULT 0,
                     profit_percent REAL DEFAULT 0,
                     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    UNIQUE (user_id, url)
                 )
             ''')
             
+            if legacy and 'user_id' not in legacy:
+                # Переносим предметы с прежними ID (на них ссылаются история и расписание)
+                cursor.execute('''
+                    INSERT INTO items (id, user_id, url, title, current_price, purchase_price, profit_percent, created_at, updated_at)
+                    SELECT id, ?, url, title, current_price, purchase_price, profit_percent, created_at, updated_at
+                    FROM items_legacy
+                ''', (self.default_user_id,))
+                cursor.execute('DROP TABLE items_legacy')
+                cursor.execute('INSERT OR IGNORE INTO users (id, chat_id) VALUES (?, ?)',
+                               (self.default_user_id, self.default_user_id))
+                print(f"Предметы перенесены в портфель пользователя {self.default_user_id}")
+            
             # Создаем индекс для быстрого поиска по URL
             cursor.execute('''
                 CREATE INDEX IF NOT EXISTS idx_url ON items(url)
             ''')
             
-            conn.commit()
+            # Индекс для постраничного вывода портфеля пользователя по ключу (updated_at, id)
+            cursor.execute('DROP INDEX IF EXISTS idx_items_updated')
+            cursor.execute('''
+                CREATE INDEX IF NOT EXISTS idx_items_user_updated ON items(user_id, updated_at, id)
+            ''')
+            
+            # Расписание обновления предметов (см. item_tracker_bot/scheduler.py)
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS refresh_schedule (
+                    item_id INTEGER PRIMARY KEY,
+                    next_check_at INTEGER NOT NULL,
+                    check_interval INTEGER NOT NULL,
+                    last_change_at INTEGER
+                )
+            ''')
+            
+            # Время последней успешной проверки предмета. Отдельная таблица: отметка
+            # о том, что цена не изменилась, не трогает items (updated_at, кэш, итоги)
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS item_heartbeats (
+                    item_id INTEGER PRIMARY KEY,
+                    last_verified_at INTEGER NOT NULL
+                )
+            ''')
+            
+            self.catalog.create_tables()
+            self.history.create_tables()
+            self.jobs.create_tables()
+            self.alerts.create_tables()
             print("Таблицы созданы успешно")
     
+    @timed_method
     def add_item(self, item_data: Dict[str, Any]) -> bool:
         """
         Добавляет новый предмет в базу данных
         
         Args:
-            item_data: Словарь с данными о предмете
+            item_data: Словарь с данными о предмете ('user_id' - владелец, по умолчанию default_user_id)
             
         Returns:
-            True если добавление успешно, False если предмет уже существует
+            True если добавление успешно, False если предмет уже есть у этого пользователя
         """
         try:
             # --- НОВОЕ: нормализуем URL ---
             item_data['url'] = self._sanitize_url(item_data.get('url', ''))
-            with sqlite3.connect(self.db_path) as conn:
+            with self._connections.write() as conn:
                 cursor = conn.cursor()
                 
                 # Конвертируем цены в числа
                 current_price = self._parse_price(item_data.get('price'))
+                catalog_id = self.catalog.ensure(cursor, item_data['url'], item_data['title'], current_price)
                 
                 cursor.execute('''
                     INSERT OR IGNORE INTO items 
-                    (url, title, current_price, purchase_price, profit_percent)
-                    VALUES (?, ?, ?, ?, ?)
+                    (user_id, catalog_id, url, title, current_price, purchase_price, profit_percent)
+                    VALUES (?, ?, ?, ?, ?, ?, ?)
                 ''', (
+                    self._owner(item_data),
+                    catalog_id,
                     item_data['url'],
                     item_data['title'],
                     current_price,
@@ -76,7 +186,8 @@ class CSMarketDatabase:
                 ))
                 
                 if cursor.rowcount > 0:
-                    conn.commit()
+                    self.history.record([(cursor.lastrowid, current_price)])
+                    self._refresh_cached([cursor.lastrowid])
                     print(f"Предмет добавлен: {item_data['title']}")
                     return True
                 else:
@@ -87,6 +198,7 @@ class CSMarketDatabase:
             print(f"Ошибка при добавлении предмета: {e}")
             return False
     
+    @timed_method
     def update_item(self, item_data: Dict[str, Any]) -> bool:
         """
         Обновляет существующий предмет в базе данных
@@ -100,7 +212,7 @@ class CSMarketDatabase:
         try:
             # --- НОВОЕ: нормализуем URL ---
             item_data['url'] = self._sanitize_url(item_data.get('url', ''))
-            with sqlite3.connect(self.db_path) as conn:
+            with self._connections.write() as conn:
                 cursor = conn.cursor()
                 
                 # Конвертируем цены в числа
@@ -116,21 +228,26 @@ class CSMarketDatabase:
                                 ((? - purchase_price) / purchase_price) * 100
                             ELSE 0 
                         END
-                    WHERE url = ?
+                    WHERE user_id = ? AND url = ?
                 ''', (
                     item_data['title'],
                     current_price,
                     current_price,  # Для расчета прибыли
+                    self._owner(item_data),
                     item_data['url']
                 ))
                 
                 if cursor.rowcount > 0:
-                    conn.commit()
                     # Получаем обновленные данные для отображения
-                    cursor.execute('SELECT current_price, purchase_price, profit_percent FROM items WHERE url = ?', (item_data['url'],))
+                    cursor.execute('SELECT id, current_price, purchase_price, profit_percent FROM items WHERE user_id = ? AND url = ?',
+                                   (self._owner(item_data), item_data['url']))
                     row = cursor.fetchone()
                     if row:
-                        current_p, purchase_p, profit_p = row
+                        item_id, current_p, purchase_p, profit_p = row
+                        catalog_id = self.catalog.ensure(cursor, item_data['url'], item_data['title'], current_price)
+                        cursor.execute('UPDATE items SET catalog_id = ? WHERE id = ?', (catalog_id, item_id))
+                        self.history.record([(item_id, current_p)])
+                        self._refresh_cached([item_id])
                         if purchase_p > 0:
                             print(f"🧮 Расчет прибыли: ({current_p} - {purchase_p}) / {purchase_p} * 100 = {profit_p:.2f}%")
                             print(f"✅ Прибыль обновлена: {profit_p:.2f}%")
@@ -155,26 +272,205 @@ class CSMarketDatabase:
         Returns:
             True если операция успешна
         """
-        # Сначала пытаемся добавить
-        if not self.add_item(item_data):
-            # Если не получилось добавить, обновляем
-            return self.update_item(item_data)
-        return True
+        result = self.upsert_items([item_data])[0]
+        if result['outcome'] in (self.UPSERT_INSERTED, self.UPSERT_UPDATED):
+            print(f"Предмет {'добавлен' if result['outcome'] == self.UPSERT_INSERTED else 'обновлен'}: {item_data.get('title')}")
+            return True
+        # Цена не изменилась - запись не нужна, но операция успешна
+        return result['outcome'] == self.UPSERT_UNCHANGED
+    
+    @timed_method
+    def upsert_items(self, items_data: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        Добавляет или обновляет пачку предметов в одной транзакции
+        (INSERT ... ON CONFLICT(user_id, url) DO UPDATE, прибыль пересчитывается в SQL)
+        
+        Запись каталога (catalog) обновляется один раз на страницу рынка, даже
+        если в пачке несколько позиций с этой ссылкой. Строки, у которых
+        название и цена совпадают с сохраненными, не перезаписываются: для них только обновляется отметка last_verified_at,
+        а updated_at, история цен, кэш и итоги портфеля остаются прежними.
+        
+        Args:
+            items_data: Список словарей {'url', 'title', 'price', 'user_id'} (например, результаты цикла
+                обновления); без 'user_id' предмет принадлежит default_user_id
+            
+        Returns:
+            Список в том же порядке: {'url', 'user_id', 'outcome', 'id', 'current_price', 'profit_percent', 'error'},
+            где outcome - inserted, updated, unchanged, skipped (нет названия) или error
+        """
+        results: List[Dict[str, Any]] = []
+        rows = []
+        for item_data in items_data:
+            url = self._sanitize_url(item_data.get('url', ''))
+            current_price = self._parse_price(item_data.get('price'))
+            result = {'url': url, 'user_id': self._owner(item_data), 'outcome': self.UPSERT_SKIPPED, 'id': None,
+                      'current_price': current_price, 'profit_percent': None, 'error': None}
+            results.append(result)
+            if url and item_data.get('title'):
+                rows.append((result, item_data['title'], current_price))
+        if not rows:
+            return results
+        
+        try:
+            with self._connections.write() as conn:
+                cursor = conn.cursor()
+                
+                # Последние известные значения (отличают добавление от обновления и от повторной проверки)
+                urls = list({result['url'] for result, _, _ in rows})
+                existing: Dict[Tuple[int, str], Tuple[int, str, Optional[float], float]] = {}
+                for start in range(0, len(urls), 500):
+                    chunk = urls[start:start + 500]
+                    cursor.execute(
+                        f"SELECT user_id, url, id, title, current_price, profit_percent FROM items "
+                        f"WHERE url IN ({','.join('?' * len(chunk))})", chunk
+                    )
+                    existing.update(((row[0], row[1]), row[2:]) for row in cursor.fetchall())
+                
+                # Одна запись каталога на страницу рынка
+                catalog_ids: Dict[str, int] = {}
+                for result, title, current_price in rows:
+                    key = normalize_url(result['url'])
+                    if key not in catalog_ids:
+                        catalog_ids[key] = self.catalog.ensure(cursor, result['url'], title, current_price)
+                
+                observations = []
+                verified = []
+                for result, title, current_price in rows:
+                    key = (result['user_id'], result['url'])
+                    known = existing.get(key)
+                    if known is not None and known[1] == title and known[2] == current_price:
+                        # Ничего не изменилось: не пишем строку, только отмечаем проверку
+                        result['id'], result['profit_percent'] = known[0], float(known[3] or 0)
+                        result['outcome'] = self.UPSERT_UNCHANGED
+                        verified.append(known[0])
+                        continue
+                    try:
+                        cursor.execute('''
+                            INSERT INTO items (user_id, catalog_id, url, title, current_price, purchase_price, profit_percent)
+                            VALUES (?, ?, ?, ?, ?, 0, 0)
+                            ON CONFLICT(user_id, url) DO UPDATE SET
+                                catalog_id = excluded.catalog_id,
+                                title = excluded.title,
+                                current_price = excluded.current_price,
+                                updated_at = CURRENT_TIMESTAMP,
+                                profit_percent = CASE 
+                                    WHEN items.purchase_price > 0 AND excluded.current_price IS NOT NULL THEN 
+                                        ((excluded.current_price - items.purchase_price) / items.purchase_price) * 100
+                                    ELSE 0 
+                                END
+                            RETURNING id, profit_percent
+                        ''', (result['user_id'], catalog_ids[normalize_url(result['url'])], result['url'], title, current_price))
+                        item_id, profit_percent = cursor.fetchone()
+                        result['id'], result['profit_percent'] = item_id, float(profit_percent)
+                        result['outcome'] = self.UPSERT_UPDATED if known is not None else self.UPSERT_INSERTED
+                        existing[key] = (item_id, title, current_price, profit_percent)
+                        observations.append((item_id, current_price))
+                        verified.append(item_id)
+                    except sqlite3.Error as e:
+                        # Ошибка одной строки не отменяет остальные
+                        result['outcome'] = self.UPSERT_ERROR
+                        result['error'] = str(e)
+                
+                # Точки истории пишутся в той же транзакции
+                self.history.record(observations)
+                self._mark_verified(cursor, verified)
+                self._refresh_cached([item_id for item_id, _ in observations])
+                        
+        except Exception as e:
+            print(f"Ошибка при пакетном сохранении предметов: {e}")
+            for result, _, _ in rows:
+                result.update(outcome=self.UPSERT_ERROR, id=None, profit_percent=None, error=str(e))
+        
+        return results
+    
+    @staticmethod
+    def _mark_verified(cursor, item_ids: List[int], ts: Optional[int] = None):
+        """Обновляет отметку последней успешной проверки (в открытой транзакции записи)"""
+        ts = int(time.time()) if ts is None else int(ts)
+        cursor.executemany('''
+            INSERT INTO item_heartbeats (item_id, last_verified_at) VALUES (?, ?)
+            ON CONFLICT(item_id) DO UPDATE SET last_verified_at = excluded.last_verified_at
+        ''', [(item_id, ts) for item_id in set(item_ids)])
     
-    def set_purchase_price(self, url: str, purchase_price: float) -> bool:
+    @timed_method
+    def get_last_verified(self) -> Dict[int, int]:
+        """
+        Время последней успешной проверки предметов
+        
+        Returns:
+            Словарь {item_id: last_verified_at (unix-время)}
+        """
+        try:
+            with self._connections.read() as conn:
+                return dict(conn.execute('SELECT item_id, last_verified_at FROM item_heartbeats').fetchall())
+        except Exception as e:
+            print(f"Ошибка при получении времени проверки предметов: {e}")
+            return {}
+
+    @timed_method
+    def register_user(self, user_id: int, chat_id: int, username: Optional[str] = None) -> bool:
+        """
+        Регистрирует пользователя бота (повторный вызов обновляет чат и имя)
+
+        Args:
+            user_id: Telegram ID пользователя
+            chat_id: Чат, в который отправляются отчеты
+            username: Имя пользователя в Telegram
+
+        Returns:
+            True, если пользователь сохранен
+        """
+        try:
+            with self._connections.write() as conn:
+                conn.execute('''
+                    INSERT INTO users (id, chat_id, username) VALUES (?, ?, ?)
+                    ON CONFLICT(id) DO UPDATE SET chat_id = excluded.chat_id, username = excluded.username, active = 1
+                ''', (user_id, chat_id, username))
+            return True
+        except Exception as e:
+            print(f"Ошибка при регистрации пользователя {user_id}: {e}")
+            return False
+
+    @timed_method
+    def get_users(self, active_only: bool = True) -> Dict[int, Dict[str, Any]]:
+        """
+        Возвращает пользователей бота
+
+        Args:
+            active_only: Только активные пользователи
+
+        Returns:
+            Словарь {user_id: {'id', 'chat_id', 'username', 'active', 'created_at'}}
+        """
+        try:
+            with self._connections.read() as conn:
+                cursor = conn.execute(
+                    'SELECT id, chat_id, username, active, created_at FROM users'
+                    + (' WHERE active = 1' if active_only else '')
+                )
+                columns = [column[0] for column in cursor.description]
+                return {row[0]: dict(zip(columns, row)) for row in cursor.fetchall()}
+        except Exception as e:
+            print(f"Ошибка при получении пользователей: {e}")
+            return {}
+
+    @timed_method
+    def set_purchase_price(self, url: str, purchase_price: float, user_id: Optional[int] = None) -> bool:
         """
         Устанавливает цену закупки для предмета
         
         Args:
             url: URL предмета
             purchase_price: Цена закупки
+            user_id: Владелец предмета (по умолчанию default_user_id)
             
         Returns:
             True если операция успешна
         """
         try:
             url = self._sanitize_url(url)  # Нормализуем URL перед запросом
-            with sqlite3.connect(self.db_path) as conn:
+            owner = self.default_user_id if user_id is None else user_id
+            with self._connections.write() as conn:
                 cursor = conn.cursor()
                 
                 # Устанавливаем цену закупки и сразу пересчитываем прибыль
@@ -186,16 +482,17 @@ class CSMarketDatabase:
                                 ((current_price - ?) / ?) * 100
                             ELSE 0 
                         END
-                    WHERE url = ?
-                ''', (purchase_price, purchase_price, purchase_price, purchase_price, url))
+                    WHERE user_id = ? AND url = ?
+                ''', (purchase_price, purchase_price, purchase_price, purchase_price, owner, url))
                 
                 if cursor.rowcount > 0:
-                    conn.commit()
                     # Получаем обновленные данные для отображения
-                    cursor.execute('SELECT current_price, purchase_price, profit_percent FROM items WHERE url = ?', (url,))
+                    cursor.execute('SELECT id, current_price, purchase_price, profit_percent FROM items WHERE user_id = ? AND url = ?',
+                                   (owner, url))
                     row = cursor.fetchone()
                     if row:
-                        current_p, purchase_p, profit_p = row
+                        item_id, current_p, purchase_p, profit_p = row
+                        self._refresh_cached([item_id])
                         print(f"🧮 Расчет прибыли: ({current_p} - {purchase_p}) / {purchase_p} * 100 = {profit_p:.2f}%")
                         print(f"✅ Прибыль обновлена: {profit_p:.2f}%")
                     
@@ -209,6 +506,7 @@ class CSMarketDatabase:
             print(f"Ошибка при установке цены закупки: {e}")
             return False
     
+    @timed_method
     def set_purchase_price_by_id(self, item_id: int, purchase_price: float) -> bool:
         """
         Устанавливает цену закупки для предмета по его ID.
@@ -221,7 +519,7 @@ class CSMarketDatabase:
             True если операция успешна
         """
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self._connections.write() as conn:
                 cursor = conn.cursor()
                 
                 cursor.execute('''
@@ -236,7 +534,7 @@ class CSMarketDatabase:
                 ''', (purchase_price, purchase_price, purchase_price, purchase_price, item_id))
                 
                 if cursor.rowcount > 0:
-                    conn.commit()
+                    self._refresh_cached([item_id])
                     print(f"Цена закупки для ID {item_id} установлена: ${purchase_price}")
                     return True
                 else:
@@ -249,51 +547,196 @@ class CSMarketDatabase:
     
     def get_all_items(self) -> List[Dict[str, Any]]:
         """
-        Возвращает все предметы из базы данных
+        Возвращает все предметы (из кэша портфеля, без обращения к диску после первой загрузки)
         
         Returns:
             Список словарей с данными о предметах
         """
         try:
-            with sqlite3.connect(self.db_path) as conn:
-                cursor = conn.cursor()
-                cursor.execute('''
-                    SELECT id, url, title, current_price, purchase_price, profit_percent, created_at, updated_at
+            return [dict(item) for item in self.cache.snapshot().items]
+        except Exception as e:
+            print(f"Ошибка при получении предметов: {e}")
+            return []
+    
+    def portfolio_snapshot(self) -> PortfolioSnapshot:
+        """
+        Согласованный снимок портфеля с версией (строки только для чтения)
+        
+        Returns:
+            PortfolioSnapshot(version, items)
+        """
+        return self.cache.snapshot()
+    
+    def portfolio_summary(self, user_id: Optional[int] = None) -> Dict[str, Any]:
+        """Итоги портфеля (всех предметов или одного пользователя): суммы, прибыль, число предметов в плюсе и в минусе"""
+        return self.aggregator.summary(user_id)
+    
+    def cache_stats(self) -> Dict[str, Any]:
+        """Метрики кэша портфеля (попадания, промахи, версия)"""
+        return self.cache.stats()
+    
+    @timed_method
+    def _load_all_items(self) -> List[Dict[str, Any]]:
+        """Загружает все предметы из базы (используется кэшем при промахе)"""
+        with self._connections.read() as conn:
+            cursor = conn.cursor()
+            cursor.execute(f'''
+                SELECT {self.ITEM_COLUMNS}
+                FROM items
+                ORDER BY updated_at DESC, id DESC
+            ''')
+            
+            columns = [desc[0] for desc in cursor.description]
+            return [dict(zip(columns, row)) for row in cursor.fetchall()]
+    
+    @timed_method
+    def _load_items_by_ids(self, item_ids: List[int]) -> List[Dict[str, Any]]:
+        """Загружает предметы по списку ID (используется кэшем после записи)"""
+        items = []
+        with self._connections.read() as conn:
+            cursor = conn.cursor()
+            for start in range(0, len(item_ids), 500):
+                chunk = item_ids[start:start + 500]
+                cursor.execute(f'''
+                    SELECT {self.ITEM_COLUMNS}
                     FROM items
-                    ORDER BY updated_at DESC
-                ''')
-                
+                    WHERE id IN ({','.join('?' * len(chunk))})
+                ''', chunk)
                 columns = [desc[0] for desc in cursor.description]
-                items = []
-                
-                for row in cursor.fetchall():
-                    item_dict = dict(zip(columns, row))
-                    items.append(item_dict)
-                
-                return items
+                items.extend(dict(zip(columns, row)) for row in cursor.fetchall())
+        return items
+    
+    def _refresh_cached(self, item_ids: List[int]):
+        """После фиксации транзакции обновляет измененные строки в кэше портфеля"""
+        self._connections.after_commit(lambda: self.cache.refresh_items(item_ids), on_error=self.cache.invalidate)
+    
+    @timed_method
+    def get_items_page(self, user_id: Optional[int] = None, limit: int = 10, after: Optional[Tuple[str, int]] = None,
+                       before: Optional[Tuple[str, int]] = None) -> Dict[str, Any]:
+        """
+        Возвращает страницу предметов пользователя в порядке updated_at DESC, id DESC.
+        Используется ключ (updated_at, id) по индексу (user_id, updated_at, id),
+        а не OFFSET, поэтому стоимость запроса не зависит от номера страницы.
+        
+        Args:
+            user_id: Владелец портфеля (по умолчанию default_user_id)
+            limit: Размер страницы
+            after: Ключ последнего предмета предыдущей страницы (следующая страница)
+            before: Ключ первого предмета текущей страницы (предыдущая страница)
+            
+        Returns:
+            Словарь {'items', 'has_next', 'has_prev'}
+        """
+        columns_sql = self.ITEM_COLUMNS
+        owner = self.default_user_id if user_id is None else user_id
+        try:
+            with self._connections.read() as conn:
+                cursor = conn.cursor()
+                if before is not None:
+                    cursor.execute(f'''
+                        SELECT {columns_sql} FROM items
+                        WHERE user_id = ? AND (updated_at, id) > (?, ?)
+                        ORDER BY updated_at ASC, id ASC
+                        LIMIT ?
+                    ''', (owner, *before, limit + 1))
+                elif after is not None:
+                    cursor.execute(f'''
+                        SELECT {columns_sql} FROM items
+                        WHERE user_id = ? AND (updated_at, id) < (?, ?)
+                        ORDER BY updated_at DESC, id DESC
+                        LIMIT ?
+                    ''', (owner, *after, limit + 1))
+                else:
+                    cursor.execute(f'''
+                        SELECT {columns_sql} FROM items
+                        WHERE user_id = ?
+                        ORDER BY updated_at DESC, id DESC
+                        LIMIT ?
+                    ''', (owner, limit + 1))
                 
+                columns = [desc[0] for desc in cursor.description]
+                rows = [dict(zip(columns, row)) for row in cursor.fetchall()]
         except Exception as e:
-            print(f"Ошибка при получении предметов: {e}")
-            return []
+            print(f"Ошибка при получении страницы предметов: {e}")
+            return {'items': [], 'has_next': False, 'has_prev': False}
+        
+        # Лишняя строка показывает, есть ли еще предметы в направлении запроса
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+        if before is not None:
+            rows.reverse()
+            return {'items': rows, 'has_next': True, 'has_prev': has_more}
+        return {'items': rows, 'has_next': has_more, 'has_prev': after is not None}
+    
+    @timed_method
+    def get_refresh_schedule(self) -> Dict[int, Dict[str, Any]]:
+        """
+        Возвращает сохраненное расписание обновления
+        
+        Returns:
+            {item_id: {'next_check_at', 'check_interval', 'last_change_at'}}
+        """
+        try:
+            with self._connections.read() as conn:
+                rows = conn.execute(
+                    'SELECT item_id, next_check_at, check_interval, last_change_at FROM refresh_schedule'
+                ).fetchall()
+            return {
+                item_id: {'next_check_at': next_check_at, 'check_interval': interval, 'last_change_at': last_change_at}
+                for item_id, next_check_at, interval, last_change_at in rows
+            }
+        except Exception as e:
+            print(f"Ошибка при получении расписания обновления: {e}")
+            return {}
+    
+    @timed_method
+    def save_refresh_schedule(self, entries: List[Tuple[int, int, int, Optional[int]]]) -> bool:
+        """
+        Сохраняет расписание одной транзакцией
+        
+        Args:
+            entries: Список (item_id, next_check_at, check_interval, last_change_at)
+            
+        Returns:
+            True если операция успешна
+        """
+        if not entries:
+            return True
+        try:
+            with self._connections.write() as conn:
+                conn.executemany('''
+                    INSERT INTO refresh_schedule (item_id, next_check_at, check_interval, last_change_at)
+                    VALUES (?, ?, ?, ?)
+                    ON CONFLICT(item_id) DO UPDATE SET
+                        next_check_at = excluded.next_check_at,
+                        check_interval = excluded.check_interval,
+                        last_change_at = excluded.last_change_at
+                ''', entries)
+            return True
+        except Exception as e:
+            print(f"Ошибка при сохранении расписания обновления: {e}")
+            return False
     
-    def get_item_by_url(self, url: str) -> Optional[Dict[str, Any]]:
+    @timed_method
+    def get_item_by_url(self, url: str, user_id: Optional[int] = None) -> Optional[Dict[str, Any]]:
         """
         Возвращает предмет по URL
         
         Args:
             url: URL предмета
+            user_id: Владелец предмета (по умолчанию default_user_id)
             
         Returns:
             Словарь с данными о предмете или None
         """
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self._connections.read() as conn:
                 cursor = conn.cursor()
-                cursor.execute('''
-                    SELECT id, url, title, current_price, purchase_price, profit_percent, created_at, updated_at
+                cursor.execute(f'''
+                    SELECT {self.ITEM_COLUMNS}
                     FROM items
-                    WHERE url = ?
-                ''', (url,))
+                    WHERE user_id = ? AND url = ?
+                ''', (self.default_user_id if user_id is None else user_id, url))
                 
                 row = cursor.fetchone()
                 if row:
@@ -306,19 +749,21 @@ class CSMarketDatabase:
             print(f"Ошибка при поиске предмета: {e}")
             return None
     
-    def get_items_by_url(self, url: str) -> List[Dict[str, Any]]:
+    def get_items_by_url(self, url: str, user_id: Optional[int] = None) -> List[Dict[str, Any]]:
         """
         Возвращает предметы по URL (возвращает список для совместимости)
         
         Args:
             url: URL предмета
+            user_id: Владелец предмета (по умолчанию default_user_id)
             
         Returns:
             Список с одним элементом или пустой список
         """
-        item = self.get_item_by_url(url)
+        item = self.get_item_by_url(url, user_id)
         return [item] if item else []
     
+    @timed_method
     def get_item_by_id(self, item_id: int) -> Optional[Dict[str, Any]]:
         """
         Возвращает предмет по ID
@@ -330,10 +775,10 @@ class CSMarketDatabase:
             Словарь с данными о предмете или None
         """
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self._connections.read() as conn:
                 cursor = conn.cursor()
-                cursor.execute('''
-                    SELECT id, url, title, current_price, purchase_price, profit_percent, created_at, updated_at
+                cursor.execute(f'''
+                    SELECT {self.ITEM_COLUMNS}
                     FROM items
                     WHERE id = ?
                 ''', (item_id,))
@@ -349,6 +794,7 @@ class CSMarketDatabase:
             print(f"Ошибка при поиске предмета по ID: {e}")
             return None
     
+    @timed_method
     def remove_item(self, item_id: int) -> bool:
         """
         Удаляет предмет из базы данных
@@ -360,24 +806,31 @@ class CSMarketDatabase:
             True если удаление успешно
         """
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self._connections.write() as conn:
                 cursor = conn.cursor()
                 
                 # Сначала получаем название предмета для вывода
-                cursor.execute('SELECT title FROM items WHERE id = ?', (item_id,))
+                cursor.execute('SELECT title, catalog_id FROM items WHERE id = ?', (item_id,))
                 row = cursor.fetchone()
                 
                 if not row:
                     print(f"Предмет с ID {item_id} не найден")
                     return False
                 
-                title = row[0]
+                title, catalog_id = row
                 
                 # Удаляем предмет
                 cursor.execute('DELETE FROM items WHERE id = ?', (item_id,))
+                deleted = cursor.rowcount
+                self.history.delete_item(item_id)
+                cursor.execute('DELETE FROM refresh_schedule WHERE item_id = ?', (item_id,))
+                cursor.execute('DELETE FROM item_heartbeats WHERE item_id = ?', (item_id,))
+                cursor.execute('DELETE FROM price_alerts WHERE item_id = ?', (item_id,))
+                # Запись каталога удаляется вместе с последней позицией
+                self.catalog.prune(cursor, catalog_id)
+                self._connections.after_commit(lambda: self.cache.remove_items([item_id]), on_error=self.cache.invalidate)
                 
-                if cursor.rowcount > 0:
-                    conn.commit()
+                if deleted > 0:
                     print(f"Предмет удален: {title}")
                     return True
                 else:
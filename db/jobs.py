@@ -0,0 +1,169 @@
+import time
+from typing import Dict, Any, List, Optional
+
+from db.connection import ConnectionManager, timed_method
+
+
+class AddJobStore:
+    """
+    Задания на добавление предметов.
+
+    Каждое добавление из бота сохраняется как задание до начала загрузки
+    страницы, поэтому после перезапуска процесса незавершенные задания
+    (queued и fetching) можно продолжить. Времена - unix-время в секундах.
+    """
+
+    QUEUED = 'queued'
+    FETCHING = 'fetching'
+    DONE = 'done'
+    FAILED = 'failed'
+
+    def __init__(self, connections: ConnectionManager):
+        """
+        Args:
+            connections: Менеджер соединений базы данных (общий с CSMarketDatabase)
+        """
+        self._connections = connections
+
+    def create_tables(self):
+        """Создает таблицу заданий"""
+        with self._connections.write() as conn:
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS add_jobs (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    chat_id INTEGER NOT NULL,
+                    user_id INTEGER,
+                    url TEXT NOT NULL,
+                    purchase_price REAL NOT NULL,
+                    status TEXT NOT NULL,
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    message_id INTEGER,
+                    item_id INTEGER,
+                    error TEXT,
+                    created_at REAL NOT NULL,
+                    started_at REAL,
+                    finished_at REAL,
+                    not_before REAL
+                )
+            ''')
+            # Задания, созданные до появления владельца: владельцем считается чат (личный чат = пользователь)
+            columns = {row[0] for row in conn.execute("SELECT name FROM pragma_table_info('add_jobs')")}
+            if 'user_id' not in columns:
+                conn.execute('ALTER TABLE add_jobs ADD COLUMN user_id INTEGER')
+            # Время, раньше которого задание не повторяется после ошибки
+            if 'not_before' not in columns:
+                conn.execute('ALTER TABLE add_jobs ADD COLUMN not_before REAL')
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_add_jobs_status ON add_jobs(status, id)')
+
+    @timed_method
+    def enqueue(self, chat_id: int, url: str, purchase_price: float, user_id: Optional[int] = None) -> int:
+        """
+        Сохраняет новое задание
+
+        Args:
+            chat_id: Чат, в котором показывается ход задания
+            url: Ссылка на предмет
+            purchase_price: Цена закупки
+            user_id: Владелец предмета (None - совпадает с chat_id)
+
+        Returns:
+            ID задания
+        """
+        with self._connections.write() as conn:
+            cursor = conn.execute('''
+                INSERT INTO add_jobs (chat_id, user_id, url, purchase_price, status, created_at)
+                VALUES (?, ?, ?, ?, ?, ?)
+            ''', (chat_id, chat_id if user_id is None else user_id, url, purchase_price, self.QUEUED, time.time()))
+            return cursor.lastrowid
+
+    @timed_method
+    def get(self, job_id: int) -> Optional[Dict[str, Any]]:
+        """Задание по ID (None - не найдено)"""
+        with self._connections.read() as conn:
+            cursor = conn.execute('SELECT * FROM add_jobs WHERE id = ?', (job_id,))
+            row = cursor.fetchone()
+            if row is None:
+                return None
+            return dict(zip([column[0] for column in cursor.description], row))
+
+    @timed_method
+    def unfinished(self) -> List[Dict[str, Any]]:
+        """Задания, которые еще не выполнены (queued и прерванные fetching), по порядку создания"""
+        with self._connections.read() as conn:
+            cursor = conn.execute(
+                'SELECT * FROM add_jobs WHERE status IN (?, ?) ORDER BY id', (self.QUEUED, self.FETCHING)
+            )
+            columns = [column[0] for column in cursor.description]
+            return [dict(zip(columns, row)) for row in cursor.fetchall()]
+
+    @timed_method
+    def set_message_id(self, job_id: int, message_id: int):
+        """Запоминает сообщение, в котором показывается ход задания"""
+        with self._connections.write() as conn:
+            conn.execute('UPDATE add_jobs SET message_id = ? WHERE id = ?', (message_id, job_id))
+
+    @timed_method
+    def mark_started(self, job_id: int) -> int:
+        """
+        Отмечает начало загрузки
+
+        Returns:
+            Номер попытки
+        """
+        with self._connections.write() as conn:
+            row = conn.execute('''
+                UPDATE add_jobs SET status = ?, attempts = attempts + 1, started_at = ?
+                WHERE id = ? RETURNING attempts
+            ''', (self.FETCHING, time.time(), job_id)).fetchone()
+            return row[0] if row else 0
+
+    @timed_method
+    def mark_done(self, job_id: int, item_id: Optional[int]):
+        """Задание выполнено"""
+        with self._connections.write() as conn:
+            conn.execute('''
+                UPDATE add_jobs SET status = ?, item_id = ?, error = NULL, finished_at = ? WHERE id = ?
+            ''', (self.DONE, item_id, time.time(), job_id))
+
+    @timed_method
+    def mark_failed(self, job_id: int, error: str, retry: bool, delay: float = 0) -> Optional[float]:
+        """
+        Ошибка задания: retry=True - вернуть в очередь, иначе завершить с ошибкой
+
+        Args:
+            delay: Не повторять задание раньше чем через delay секунд
+
+        Returns:
+            Время (unix), раньше которого задание не повторяется, или None
+        """
+        now = time.time()
+        not_before = now + delay if retry else None
+        with self._connections.write() as conn:
+            conn.execute('''
+                UPDATE add_jobs SET status = ?, error = ?, finished_at = ?, not_before = ? WHERE id = ?
+            ''', (self.QUEUED if retry else self.FAILED, error, None if retry else now, not_before, job_id))
+        return not_before
+
+    def stats(self, window: int = 100) -> Dict[str, Any]:
+        """
+        Глубина очереди, счетчики и время выполнения последних заданий
+
+        Returns:
+            {'queued', 'fetching', 'done', 'failed', 'latency_avg', 'latency_p95'}
+            (время от постановки до завершения, сек, по последним window завершенным заданиям)
+        """
+        with self._connections.read() as conn:
+            counts = dict(conn.execute('SELECT status, COUNT(*) FROM add_jobs GROUP BY status').fetchall())
+            latencies = sorted(row[0] for row in conn.execute('''
+                SELECT finished_at - created_at FROM add_jobs
+                WHERE status IN (?, ?) AND finished_at IS NOT NULL
+                ORDER BY id DESC LIMIT ?
+            ''', (self.DONE, self.FAILED, window)).fetchall())
+        return {
+            'queued': counts.get(self.QUEUED, 0),
+            'fetching': counts.get(self.FETCHING, 0),
+            'done': counts.get(self.DONE, 0),
+            'failed': counts.get(self.FAILED, 0),
+            'latency_avg': round(sum(latencies) / len(latencies), 2) if latencies else 0.0,
+            'latency_p95': round(latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))], 2) if latencies else 0.0,
+        }
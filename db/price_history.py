@@ -0,0 +1,232 @@
+import time
+from typing import Dict, Any, List, Optional, Tuple, Iterable
+
+from db.connection import ConnectionManager, timed_method
+
+# Разрешения агрегатов (секунды)
+HOUR = 3600
+DAY = 86400
+
+
+def to_cents(price: Optional[float]) -> Optional[int]:
+    """Цена в долларах -> целое число центов"""
+    return None if price is None else int(round(price * 100))
+
+
+def from_cents(cents: Optional[int]) -> Optional[float]:
+    """Целое число центов -> цена в долларах"""
+    return None if cents is None else cents / 100
+
+
+class PriceHistory:
+    """
+    История цен предметов.
+
+    Сырые наблюдения хранятся в price_observations (целые секунды и центы) с
+    кластерным ключом (item_id, ts): выборка по предмету за период читает
+    только этот B-tree. Старые точки сворачиваются в часовые агрегаты, а
+    часовые - в дневные (price_rollups), поэтому объем хранилища ограничен.
+    """
+
+    def __init__(self, connections: ConnectionManager):
+        """
+        Args:
+            connections: Менеджер соединений базы данных (общий с CSMarketDatabase)
+        """
+        self._connections = connections
+
+    def create_tables(self):
+        """Создает таблицы истории цен"""
+        with self._connections.write() as conn:
+            cursor = conn.cursor()
+
+            # WITHOUT ROWID: строки лежат прямо в индексе (item_id, ts), отдельной таблицы нет
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS price_observations (
+                    item_id INTEGER NOT NULL,
+                    ts INTEGER NOT NULL,
+                    price INTEGER NOT NULL,
+                    PRIMARY KEY (item_id, ts)
+                ) WITHOUT ROWID
+            ''')
+
+            # Агрегаты за час/день: min, max, сумма и количество (для среднего), последняя цена
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS price_rollups (
+                    item_id INTEGER NOT NULL,
+                    resolution INTEGER NOT NULL,
+                    bucket INTEGER NOT NULL,
+                    low INTEGER NOT NULL,
+                    high INTEGER NOT NULL,
+                    total INTEGER NOT NULL,
+                    count INTEGER NOT NULL,
+                    close INTEGER NOT NULL,
+                    close_ts INTEGER NOT NULL,
+                    PRIMARY KEY (item_id, resolution, bucket)
+                ) WITHOUT ROWID
+            ''')
+
+            # Политика хранения выбирает строки по времени всех предметов сразу - ключ (item_id, ...)
+            # для этого не подходит, без индексов compact просматривал бы обе таблицы целиком
+            cursor.execute('CREATE INDEX IF NOT EXISTS idx_price_observations_ts ON price_observations (ts)')
+            cursor.execute('CREATE INDEX IF NOT EXISTS idx_price_rollups_bucket ON price_rollups (resolution, bucket)')
+
+    @timed_method
+    def record(self, observations: Iterable[Tuple[int, Optional[float]]], ts: Optional[int] = None) -> int:
+        """
+        Сохраняет наблюдения цен одной транзакцией (или в уже открытой транзакции записи)
+
+        Args:
+            observations: Пары (item_id, цена в долларах); пары без цены пропускаются
+            ts: Время наблюдения (unix-время, по умолчанию сейчас)
+
+        Returns:
+            Количество сохраненных точек
+        """
+        ts = int(time.time()) if ts is None else int(ts)
+        rows = [(item_id, ts, to_cents(price)) for item_id, price in observations if price is not None]
+        if not rows:
+            return 0
+        with self._connections.write() as conn:
+            # Повторное наблюдение в ту же секунду заменяет предыдущее
+            conn.executemany(
+                'INSERT OR REPLACE INTO price_observations (item_id, ts, price) VALUES (?, ?, ?)', rows
+            )
+        return len(rows)
+
+    @timed_method
+    def get_range(self, item_id: int, start_ts: int, end_ts: int) -> List[Tuple[int, float]]:
+        """
+        Сырые наблюдения предмета за период (по ключу, без обращения к другим таблицам)
+
+        Returns:
+            Список (ts, цена) по возрастанию времени
+        """
+        with self._connections.read() as conn:
+            rows = conn.execute('''
+                SELECT ts, price FROM price_observations
+                WHERE item_id = ? AND ts BETWEEN ? AND ?
+                ORDER BY ts
+            ''', (item_id, start_ts, end_ts)).fetchall()
+        return [(ts, from_cents(price)) for ts, price in rows]
+
+    @timed_method
+    def get_series(self, item_id: int, start_ts: int, end_ts: int) -> List[Dict[str, Any]]:
+        """
+        Полный ряд за период: дневные и часовые агрегаты для старых данных и сырые точки для новых
+
+        Returns:
+            Список {'ts', 'resolution' (0 - сырая точка), 'low', 'high', 'avg', 'close'} по возрастанию времени
+        """
+        series = []
+        with self._connections.read() as conn:
+            rollups = conn.execute('''
+                SELECT bucket, resolution, low, high, total, count, close FROM price_rollups
+                WHERE item_id = ? AND resolution IN (?, ?) AND bucket BETWEEN ? AND ?
+            ''', (item_id, HOUR, DAY, start_ts, end_ts)).fetchall()
+        for bucket, resolution, low, high, total, count, close in rollups:
+            series.append({
+                'ts': bucket, 'resolution': resolution, 'low': from_cents(low), 'high': from_cents(high),
+                'avg': round(total / count / 100, 2), 'close': from_cents(close),
+            })
+        for ts, price in self.get_range(item_id, start_ts, end_ts):
+            series.append({'ts': ts, 'resolution': 0, 'low': price, 'high': price, 'avg': price, 'close': price})
+        series.sort(key=lambda point: point['ts'])
+        return series
+
+    @timed_method
+    def price_at(self, item_id: int, ts: int) -> Optional[float]:
+        """
+        Цена предмета на момент ts: последнее наблюдение не позже ts
+        (если сырые точки уже свернуты - цена закрытия последнего агрегата, закрытого не позже ts;
+        наблюдения внутри агрегата, в который попадает ts, после свертки не различаются)
+        """
+        with self._connections.read() as conn:
+            row = conn.execute('''
+                SELECT price FROM price_observations
+                WHERE item_id = ? AND ts <= ?
+                ORDER BY ts DESC LIMIT 1
+            ''', (item_id, ts)).fetchone()
+            if row is None:
+                row = conn.execute('''
+                    SELECT close FROM price_rollups
+                    WHERE item_id = ? AND close_ts <= ?
+                    ORDER BY close_ts DESC LIMIT 1
+                ''', (item_id, ts)).fetchone()
+        return from_cents(row[0]) if row else None
+
+    @timed_method
+    def delete_item(self, item_id: int):
+        """Удаляет историю предмета"""
+        with self._connections.write() as conn:
+            conn.execute('DELETE FROM price_observations WHERE item_id = ?', (item_id,))
+            conn.execute('DELETE FROM price_rollups WHERE item_id = ?', (item_id,))
+
+    @timed_method
+    def compact(self, raw_days: int = 14, hourly_days: int = 180, now: Optional[int] = None) -> Dict[str, int]:
+        """
+        Применяет политику хранения: сырые точки старше raw_days сворачиваются
+        в часовые агрегаты, часовые старше hourly_days - в дневные
+
+        Returns:
+            Словарь {'raw_rolled', 'hourly_rolled'} - сколько строк свернуто
+        """
+        now = int(time.time()) if now is None else int(now)
+        # Границы выравниваются по началу часа/дня, чтобы не разрезать агрегат
+        raw_cutoff = (now - raw_days * DAY) // HOUR * HOUR
+        hourly_cutoff = (now - hourly_days * DAY) // DAY * DAY
+
+        with self._connections.write() as conn:
+            cursor = conn.cursor()
+
+            cursor.execute('''
+                SELECT item_id, ts, price FROM price_observations WHERE ts < ?
+            ''', (raw_cutoff,))
+            raw_rows = cursor.fetchall()
+            self._merge_rollups(cursor, HOUR, (
+                (item_id, ts, price, price, price, 1, price, ts) for item_id, ts, price in raw_rows
+            ))
+            cursor.execute('DELETE FROM price_observations WHERE ts < ?', (raw_cutoff,))
+
+            cursor.execute('''
+                SELECT item_id, bucket, low, high, total, count, close, close_ts FROM price_rollups
+                WHERE resolution = ? AND bucket < ?
+            ''', (HOUR, hourly_cutoff))
+            hourly_rows = cursor.fetchall()
+            self._merge_rollups(cursor, DAY, hourly_rows)
+            cursor.execute('DELETE FROM price_rollups WHERE resolution = ? AND bucket < ?', (HOUR, hourly_cutoff))
+
+        return {'raw_rolled': len(raw_rows), 'hourly_rolled': len(hourly_rows)}
+
+    @staticmethod
+    def _merge_rollups(cursor, resolution: int, rows: Iterable[tuple]):
+        """
+        Сворачивает строки (item_id, ts, low, high, total, count, close, close_ts)
+        в агрегаты разрешения resolution и сливает их с уже существующими
+        (порядок строк не важен: цена закрытия выбирается по close_ts)
+        """
+        buckets: Dict[Tuple[int, int], list] = {}
+        for item_id, ts, low, high, total, count, close, close_ts in rows:
+            key = (item_id, ts // resolution * resolution)
+            bucket = buckets.get(key)
+            if bucket is None:
+                buckets[key] = [low, high, total, count, close, close_ts]
+                continue
+            bucket[0] = min(bucket[0], low)
+            bucket[1] = max(bucket[1], high)
+            bucket[2] += total
+            bucket[3] += count
+            if close_ts >= bucket[5]:
+                bucket[4], bucket[5] = close, close_ts
+
+        cursor.executemany('''
+            INSERT INTO price_rollups (item_id, resolution, bucket, low, high, total, count, close, close_ts)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT(item_id, resolution, bucket) DO UPDATE SET
+                low = MIN(low, excluded.low),
+                high = MAX(high, excluded.high),
+                total = total + excluded.total,
+                count = count + excluded.count,
+                close = CASE WHEN excluded.close_ts >= close_ts THEN excluded.close ELSE close END,
+                close_ts = MAX(close_ts, excluded.close_ts)
+        ''', [(item_id, resolution, start, *values) for (item_id, start), values in buckets.items()])
@@ -0,0 +1,410 @@
+# -*- coding: utf-8 -*-
+"""
+Уведомления о цене, проверяемые при каждом новом наблюдении.
+
+Пороги каждого предмета хранятся в отсортированных списках, поэтому новая
+цена сравнивается только с порогами, которые она действительно пересекла
+(поиск bisect), а не со всеми уведомлениями. Пороги прибыли переводятся в
+цену по цене закупки. Сработавшее уведомление переходит в список
+"остывающих" и снова взводится, только когда цена вернется за порог с
+запасом (гистерезис); повторное срабатывание раньше чем через debounce
+секунд не отправляется.
+"""
+import html
+import logging
+import re
+import threading
+import time
+from bisect import bisect_left, bisect_right, insort
+from typing import Callable, Dict, List, Optional, Tuple
+
+from db.alerts import AlertStore
+from db.connector import CSMarketDatabase
+from item_tracker_bot.outbox import get_outbox
+from config import config
+
+INF = float('inf')
+
+# Виды, срабатывающие при росте цены (остальные пороговые - при падении)
+_UPWARD = (AlertStore.ABOVE, AlertStore.PROFIT_ABOVE)
+
+_RULE = re.compile(r'^\s*([<>~+-])\s*(\d+(?:[.,]\d+)?)\s*(%?)\s*$')
+
+
+def parse_alert_rule(text: str) -> Optional[Tuple[str, float]]:
+    """
+    Разбирает правило уведомления, введенное пользователем.
+
+    ">25" - цена выше $25, "<10" - ниже $10, "+20%" - прибыль от закупки
+    выше 20%, "-10%" - ниже -10%, "~5%" - изменение цены за одну проверку от 5%.
+
+    Returns:
+        (вид, порог) или None, если формат не распознан.
+    """
+    match = _RULE.match(text or '')
+    if not match:
+        return None
+    sign, value, percent = match.group(1), float(match.group(2).replace(',', '.')), match.group(3)
+    if sign in '<>' and not percent:
+        return (AlertStore.ABOVE if sign == '>' else AlertStore.BELOW), value
+    if sign in '+-' and percent:
+        return (AlertStore.PROFIT_ABOVE, value) if sign == '+' else (AlertStore.PROFIT_BELOW, -value)
+    if sign == '~' and percent and value > 0:
+        return AlertStore.MOVE, value
+    return None
+
+
+def describe_alert(alert: dict) -> str:
+    """Правило уведомления в виде текста для пользователя"""
+    kind, threshold = alert['kind'], alert['threshold']
+    text = {
+        AlertStore.ABOVE: f"цена выше ${threshold:.2f}",
+        AlertStore.BELOW: f"цена ниже ${threshold:.2f}",
+        AlertStore.PROFIT_ABOVE: f"прибыль выше {threshold:+.2f}%",
+        AlertStore.PROFIT_BELOW: f"прибыль ниже {threshold:+.2f}%",
+        AlertStore.MOVE: f"изменение цены за проверку от {threshold:.2f}%",
+    }[kind]
+    return text if alert['armed'] else text + " (сработало, ждет возврата цены)"
+
+
+class _ItemIndex:
+    """Пороги одного предмета: взведенные и остывающие, отсортированные по цене"""
+    __slots__ = ('up_armed', 'up_cooling', 'down_armed', 'down_cooling', 'moves')
+
+    def __init__(self):
+        # (цена порога, id) - срабатывают при цене >= порога
+        self.up_armed: List[Tuple[float, int]] = []
+        # (цена повторного взвода, id) - взводятся при цене <= этой цены
+        self.up_cooling: List[Tuple[float, int]] = []
+        # (цена порога, id) - срабатывают при цене <= порога
+        self.down_armed: List[Tuple[float, int]] = []
+        # (цена повторного взвода, id) - взводятся при цене >= этой цены
+        self.down_cooling: List[Tuple[float, int]] = []
+        # (порог изменения в %, id)
+        self.moves: List[Tuple[float, int]] = []
+
+    def __len__(self):
+        return len(self.up_armed) + len(self.up_cooling) + len(self.down_armed) + len(self.down_cooling) + len(self.moves)
+
+
+class AlertEngine:
+    """Индекс порогов уведомлений всех предметов и проверка новых наблюдений."""
+
+    def __init__(self, db: CSMarketDatabase, notify: Callable[[List[dict]], None],
+                 hysteresis: float = 0.02, debounce: int = 1800):
+        """
+        Args:
+            db (CSMarketDatabase): Коннектор к базе данных (уведомления хранятся в db.alerts).
+            notify: Отправка сработавших уведомлений: notify(events), событие -
+                {'alert', 'item', 'price', 'previous'}.
+            hysteresis (float): Доля цены порога, на которую цена должна вернуться
+                назад, чтобы уведомление взвелось снова.
+            debounce (int): Минимальная пауза между срабатываниями одного уведомления (сек).
+        """
+        self.db = db
+        self.store = db.alerts
+        self.notify = notify
+        self.hysteresis = hysteresis
+        self.debounce = debounce
+        self._lock = threading.Lock()
+        self._alerts: Dict[int, dict] = {}
+        self._index: Dict[int, _ItemIndex] = {}
+        # Предметы из снимка портфеля (название и цена закупки для порогов прибыли)
+        self._items: Dict[int, dict] = {}
+        self._portfolio_version = None
+        self._loaded = False
+        self.fired = 0
+        self.suppressed = 0
+
+    def _level(self, alert: dict) -> Optional[float]:
+        """Цена порога (для порогов прибыли - по цене закупки; None - цена закупки не задана)"""
+        if alert['kind'] in (AlertStore.ABOVE, AlertStore.BELOW):
+            return alert['threshold']
+        purchase = (self._items.get(alert['item_id']) or {}).get('purchase_price') or 0
+        if purchase <= 0:
+            return None
+        return purchase * (1 + alert['threshold'] / 100)
+
+    def _arm(self, index: _ItemIndex, alert: dict):
+        # Вызывается под self._lock: возвращает порог во взведенный список
+        alert['armed'] = 1
+        level = self._level(alert)
+        if level is not None:
+            insort(index.up_armed if alert['kind'] in _UPWARD else index.down_armed, (level, alert['id']))
+
+    def _insert(self, alert: dict):
+        # Вызывается под self._lock
+        index = self._index.setdefault(alert['item_id'], _ItemIndex())
+        if alert['kind'] == AlertStore.MOVE:
+            insort(index.moves, (alert['threshold'], alert['id']))
+            return
+        level = self._level(alert)
+        if level is None:
+            return
+        if alert['kind'] in _UPWARD:
+            if alert['armed']:
+                insort(index.up_armed, (level, alert['id']))
+            else:
+                insort(index.up_cooling, (level * (1 - self.hysteresis), alert['id']))
+        elif alert['armed']:
+            insort(index.down_armed, (level, alert['id']))
+        else:
+            insort(index.down_cooling, (level * (1 + self.hysteresis), alert['id']))
+
+    def _rebuild(self, item_id: int):
+        # Вызывается под self._lock
+        self._index.pop(item_id, None)
+        for alert in self._alerts.values():
+            if alert['item_id'] == item_id:
+                self._insert(alert)
+
+    def sync(self):
+        """Загружает уведомления при первом вызове и сверяет пороги прибыли с ценами закупки."""
+        snapshot = self.db.portfolio_snapshot()
+        with self._lock:
+            if not self._loaded:
+                self._items = {item['id']: item for item in snapshot.items}
+                self._alerts = {alert['id']: alert for alert in self.store.all()}
+                for alert in self._alerts.values():
+                    self._insert(alert)
+                self._portfolio_version = snapshot.version
+                self._loaded = True
+                return
+            if snapshot.version == self._portfolio_version:
+                return
+            previous = self._items
+            self._items = {item['id']: item for item in snapshot.items}
+            for item_id in list(self._index):
+                if item_id not in self._items:
+                    # Предмет удален вместе с уведомлениями
+                    del self._index[item_id]
+                    self._alerts = {k: a for k, a in self._alerts.items() if a['item_id'] != item_id}
+                elif previous.get(item_id, {}).get('purchase_price') != self._items[item_id]['purchase_price']:
+                    self._rebuild(item_id)
+            self._portfolio_version = snapshot.version
+
+    def add(self, item_id: int, user_id: int, kind: str, threshold: float,
+            now: Optional[int] = None) -> dict:
+        """
+        Сохраняет уведомление, добавляет его порог в индекс и сразу сверяет
+        порог с текущей ценой предмета: если цена уже за порогом, уведомление
+        срабатывает и переходит в остывающие (armed = 0 в возвращаемом словаре).
+        """
+        now = int(time.time()) if now is None else now
+        self.sync()
+        alert = self.store.add(item_id, user_id, kind, threshold)
+        events: List[dict] = []
+        with self._lock:
+            self._alerts[alert['id']] = alert
+            self._rebuild(item_id)
+            price = (self._items.get(item_id) or {}).get('current_price')
+            if price is not None and self._check_new(alert, price, now, events):
+                states = [(alert['id'], bool(alert['armed']), alert['last_fired_at'])]
+            else:
+                states = []
+            alert = dict(alert)
+        self.store.save_states(states)
+        if events:
+            try:
+                self.notify(events)
+            except Exception as e:
+                logging.error(f"Ошибка при отправке уведомлений о цене: {e}")
+        return alert
+
+    def _check_new(self, alert: dict, price: float, now: int, events: List[dict]) -> bool:
+        """
+        Сверяет только что добавленный порог с текущей ценой (под self._lock).
+        Остальные пороги предмета не трогаются - они уже проверены прошлыми наблюдениями.
+
+        Returns:
+            bool: True - цена уже за порогом, уведомление сработало.
+        """
+        if alert['kind'] == AlertStore.MOVE:
+            return False
+        level = self._level(alert)
+        if level is None:
+            return False
+        index = self._index[alert['item_id']]
+        entry = (level, alert['id'])
+        if alert['kind'] in _UPWARD:
+            if price < level:
+                return False
+            index.up_armed.remove(entry)
+            insort(index.up_cooling, (level * (1 - self.hysteresis), alert['id']))
+        else:
+            if price > level:
+                return False
+            index.down_armed.remove(entry)
+            insort(index.down_cooling, (level * (1 + self.hysteresis), alert['id']))
+        alert['armed'] = 0
+        self._fire(alert, now, events, alert['item_id'], price, None)
+        return True
+
+    def remove_for_item(self, item_id: int) -> int:
+        """Удаляет все уведомления предмета."""
+        removed = self.store.remove_for_item(item_id)
+        with self._lock:
+            self._alerts = {k: a for k, a in self._alerts.items() if a['item_id'] != item_id}
+            self._index.pop(item_id, None)
+        return removed
+
+    def _fire(self, alert: dict, now: int, events: List[dict], item_id: int, price: float,
+              previous: Optional[float]) -> bool:
+        # Вызывается под self._lock; False - срабатывание подавлено (слишком рано после прошлого)
+        last = alert['last_fired_at']
+        if last is not None and now - last < self.debounce:
+            self.suppressed += 1
+            return False
+        alert['last_fired_at'] = now
+        self.fired += 1
+        events.append({'alert': dict(alert), 'item': self._items.get(item_id, {}), 'price': price, 'previous': previous})
+        return True
+
+    def _observe(self, item_id: int, previous: Optional[float], price: float, now: int,
+                 events: List[dict]) -> List[int]:
+        """Проверяет одно наблюдение (под self._lock), возвращает ID уведомлений с новым состоянием"""
+        index = self._index.get(item_id)
+        if index is None or not len(index):
+            return []
+        changed = []
+        alerts = self._alerts
+
+        # Рост: срабатывают взведенные пороги не выше цены (начало списка)
+        count = bisect_right(index.up_armed, (price, INF))
+        hit, index.up_armed[:count] = index.up_armed[:count], []
+        for level, alert_id in hit:
+            alerts[alert_id]['armed'] = 0
+            insort(index.up_cooling, (level * (1 - self.hysteresis), alert_id))
+            self._fire(alerts[alert_id], now, events, item_id, price, previous)
+            changed.append(alert_id)
+        # Цена ушла ниже порога с запасом - взводим снова (конец списка остывающих)
+        start = bisect_left(index.up_cooling, (price, -INF))
+        back, index.up_cooling[start:] = index.up_cooling[start:], []
+        for _, alert_id in back:
+            self._arm(index, alerts[alert_id])
+            changed.append(alert_id)
+
+        # Падение: срабатывают взведенные пороги не ниже цены (конец списка)
+        start = bisect_left(index.down_armed, (price, -INF))
+        hit, index.down_armed[start:] = index.down_armed[start:], []
+        for level, alert_id in hit:
+            alerts[alert_id]['armed'] = 0
+            insort(index.down_cooling, (level * (1 + self.hysteresis), alert_id))
+            self._fire(alerts[alert_id], now, events, item_id, price, previous)
+            changed.append(alert_id)
+        count = bisect_right(index.down_cooling, (price, INF))
+        back, index.down_cooling[:count] = index.down_cooling[:count], []
+        for _, alert_id in back:
+            self._arm(index, alerts[alert_id])
+            changed.append(alert_id)
+
+        # Изменение за одну проверку: пороги не выше изменения (начало списка)
+        if previous and index.moves:
+            change = abs(price - previous) / previous * 100
+            for _, alert_id in index.moves[:bisect_right(index.moves, (change, INF))]:
+                if self._fire(alerts[alert_id], now, events, item_id, price, previous):
+                    changed.append(alert_id)
+        return changed
+
+    def observe(self, observations: List[Tuple[int, Optional[float], Optional[float]]],
+                now: Optional[int] = None) -> List[dict]:
+        """
+        Проверяет новые цены и отправляет сработавшие уведомления.
+
+        Args:
+            observations: Список (item_id, предыдущая цена, новая цена).
+
+        Returns:
+            list: Сработавшие (и отправленные) уведомления.
+        """
+        now = int(time.time()) if now is None else now
+        self.sync()
+        events: List[dict] = []
+        changed = set()
+        with self._lock:
+            for item_id, previous, price in observations:
+                if price is not None:
+                    changed.update(self._observe(item_id, previous, price, now, events))
+            states = [(alert_id, bool(self._alerts[alert_id]['armed']), self._alerts[alert_id]['last_fired_at'])
+                      for alert_id in changed]
+        self.store.save_states(states)
+        if events:
+            try:
+                self.notify(events)
+            except Exception as e:
+                logging.error(f"Ошибка при отправке уведомлений о цене: {e}")
+        return events
+
+    def proximity(self, item_id: int, price: float) -> Optional[float]:
+        """
+        Расстояние от цены до ближайшего взведенного порога (доля цены) - для планировщика.
+
+        Returns:
+            float или None, если у предмета нет взведенных порогов цены.
+        """
+        if not price:
+            return None
+        with self._lock:
+            index = self._index.get(item_id)
+            if index is None:
+                return None
+            distances = []
+            if index.up_armed:
+                distances.append(abs(index.up_armed[0][0] - price) / price)
+            if index.down_armed:
+                distances.append(abs(price - index.down_armed[-1][0]) / price)
+            return min(distances) if distances else None
+
+    def stats(self) -> Dict[str, int]:
+        """Число уведомлений в индексе и счетчики срабатываний."""
+        with self._lock:
+            return {
+                'alerts': len(self._alerts),
+                'items': sum(1 for index in self._index.values() if len(index)),
+                'fired': self.fired,
+                'suppressed': self.suppressed,
+            }
+
+
+def format_alert_events(events: List[dict]) -> str:
+    """Текст сообщения о сработавших уведомлениях (HTML)."""
+    parts = ["<b>🔔 Уведомления о цене</b>"]
+    for event in events:
+        title = html.escape(event['item'].get('title') or f"Предмет {event['alert']['item_id']}")
+        change = ""
+        if event['previous']:
+            change = f" ({(event['price'] - event['previous']) / event['previous'] * 100:+.2f}% за проверку)"
+        parts.append(f"\n<b>{title}</b>: ${event['price']:.2f}{change}\n  - {describe_alert({**event['alert'], 'armed': 1})}")
+    return "\n".join(parts)
+
+
+_shared_engine: Optional[AlertEngine] = None
+_shared_lock = threading.Lock()
+
+
+def get_alert_engine(db: CSMarketDatabase) -> AlertEngine:
+    """
+    Возвращает общий для процесса движок уведомлений (обработчики добавляют
+    уведомления, цикл обновления проверяет наблюдения), создавая его при первом вызове.
+    Сообщения отправляются через общую очередь исходящих сообщений в чат владельца.
+    """
+    global _shared_engine
+    with _shared_lock:
+        if _shared_engine is None:
+            outbox = get_outbox()
+
+            def notify(events: List[dict]):
+                users = db.get_users(active_only=False)
+                by_user: Dict[int, List[dict]] = {}
+                for event in events:
+                    by_user.setdefault(event['alert']['user_id'], []).append(event)
+                for user_id, user_events in by_user.items():
+                    user = users.get(user_id)
+                    outbox.send_message(user['chat_id'] if user else user_id, format_alert_events(user_events))
+
+            _shared_engine = AlertEngine(
+                db, notify,
+                hysteresis=config.ALERT_HYSTERESIS_PERCENT / 100,
+                debounce=int(config.ALERT_DEBOUNCE_MINUTES * 60),
+            )
+        return _shared_engine
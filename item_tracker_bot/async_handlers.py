@@ -0,0 +1,286 @@
+# -*- coding: utf-8 -*-
+"""
+Асинхронные обработчики команд для режима asyncio (AsyncTeleBot).
+Сценарии те же, что и в handlers.py, но шаги диалога хранятся в состояниях,
+а блокирующие вызовы БД и парсера выполняются в отдельных пулах потоков.
+"""
+from telebot.async_telebot import AsyncTeleBot
+from telebot.asyncio_filters import StateFilter
+from telebot.states import State, StatesGroup
+from telebot.types import Message, CallbackQuery
+
+from item_tracker_bot.handlers import (
+    db, outbox, access_checker, parse_price_text, render_items_page, parse_items_callback,
+    add_jobs, get_own_item, alerts_prompt, apply_alert_rule
+)
+from item_tracker_bot.executors import run_db
+from item_tracker_bot.keyboards import main_menu_keyboard, cancel_keyboard, confirm_delete_keyboard
+from item_tracker_bot.constants import MainMenuCommands, ActionCommands, ListViews, CallbackActions
+from config import config
+
+
+class AddItemStates(StatesGroup):
+    """Шаги добавления предмета."""
+    url = State()
+    price = State()
+
+
+class EditPriceStates(StatesGroup):
+    """Шаги редактирования цены закупки (предмет выбирается inline-кнопкой)."""
+    price = State()
+
+
+class DeleteItemStates(StatesGroup):
+    """Шаги удаления предмета (предмет выбирается inline-кнопкой)."""
+    confirm = State()
+
+
+class AlertStates(StatesGroup):
+    """Шаги настройки уведомлений (предмет выбирается inline-кнопкой)."""
+    rule = State()
+
+
+def register_async_handlers(bot: AsyncTeleBot):
+    """
+    Регистрирует все обработчики команд для асинхронного бота.
+
+    Args:
+        bot (AsyncTeleBot): Экземпляр асинхронного бота.
+    """
+    bot.add_custom_filter(StateFilter(bot))
+    # Продолжаем задания на добавление, прерванные перезапуском
+    add_jobs.start()
+
+    # Кнопки меню и отмена обрабатываются раньше шагов диалога и сбрасывают его
+    bot.register_message_handler(
+        lambda message: cancel_handler(message, bot),
+        func=lambda message: message.text == ActionCommands.CANCEL
+    )
+    bot.register_message_handler(
+        lambda message: start_handler(message, bot),
+        commands=['start', 'help']
+    )
+    bot.register_message_handler(
+        lambda message: add_item_start(message, bot),
+        func=lambda message: message.text == MainMenuCommands.ADD_ITEM
+    )
+    bot.register_message_handler(
+        lambda message: delete_item_start(message, bot),
+        func=lambda message: message.text == MainMenuCommands.REMOVE_ITEM
+    )
+    bot.register_message_handler(
+        lambda message: show_statistics(message, bot),
+        func=lambda message: message.text == MainMenuCommands.GET_STATS
+    )
+    bot.register_message_handler(
+        lambda message: edit_price_start(message, bot),
+        func=lambda message: message.text == MainMenuCommands.EDIT_PRICE
+    )
+    bot.register_message_handler(
+        lambda message: alerts_start(message, bot),
+        func=lambda message: message.text == MainMenuCommands.ALERTS
+    )
+
+    # Шаги диалогов
+    bot.register_message_handler(lambda message: process_url_step(message, bot), state=AddItemStates.url)
+    bot.register_message_handler(lambda message: process_price_step(message, bot), state=AddItemStates.price)
+    bot.register_message_handler(lambda message: process_new_price_step(message, bot), state=EditPriceStates.price)
+    bot.register_message_handler(lambda message: confirm_delete_step(message, bot), state=DeleteItemStates.confirm)
+    bot.register_message_handler(lambda message: process_alert_step(message, bot), state=AlertStates.rule)
+
+    # Inline-кнопки списков предметов
+    bot.register_callback_query_handler(
+        lambda call: items_callback_handler(call, bot),
+        func=lambda call: parse_items_callback(call.data) is not None
+    )
+
+
+@access_checker
+async def start_handler(message: Message, bot: AsyncTeleBot):
+    """Обработчик команд /start и /help."""
+    await bot.delete_state(message.from_user.id, message.chat.id)
+    outbox.send_message(
+        message.chat.id,
+        "Привет! Я бот для отслеживания цен на предметы. Выбери действие:",
+        reply_markup=main_menu_keyboard()
+    )
+
+
+# --- Логика редактирования цены ---
+
+@access_checker
+async def edit_price_start(message: Message, bot: AsyncTeleBot):
+    """Начало сценария редактирования цены: первая страница списка с кнопками выбора."""
+    await bot.delete_state(message.from_user.id, message.chat.id)
+    await send_items_page(message, bot, ListViews.EDIT, "У вас пока нет предметов для редактирования.")
+
+
+async def process_new_price_step(message: Message, bot: AsyncTeleBot):
+    """Обрабатывает новую цену и обновляет ее в БД."""
+    new_price = parse_price_text(message.text)
+    if new_price is None:
+        outbox.send_message(message.chat.id, "Неверный формат цены. Попробуй еще раз, например: 15.55", reply_markup=cancel_keyboard())
+        return
+
+    async with bot.retrieve_data(message.from_user.id, message.chat.id) as data:
+        item_id = data.get('item_id')
+    await bot.delete_state(message.from_user.id, message.chat.id)
+
+    if await run_db(db.set_purchase_price_by_id, item_id, new_price):
+        outbox.send_message(message.chat.id, f"✅ Цена закупки для предмета успешно изменена на ${new_price:.2f}.", reply_markup=main_menu_keyboard())
+    else:
+        outbox.send_message(message.chat.id, "❌ Не удалось изменить цену. Предмет не найден.", reply_markup=main_menu_keyboard())
+
+
+# --- Логика удаления предмета ---
+
+@access_checker
+async def delete_item_start(message: Message, bot: AsyncTeleBot):
+    """Начало сценария удаления предмета: первая страница списка с кнопками выбора."""
+    await bot.delete_state(message.from_user.id, message.chat.id)
+    await send_items_page(message, bot, ListViews.DELETE, "У вас пока нет отслеживаемых предметов.")
+
+
+async def confirm_delete_step(message: Message, bot: AsyncTeleBot):
+    """Подтверждение удаления."""
+    if message.text != ActionCommands.CONFIRM_DELETE:
+        outbox.send_message(message.chat.id, "Нажмите '✅ Да' для удаления или '❌ Отмена' для отмены.", reply_markup=confirm_delete_keyboard())
+        return
+
+    async with bot.retrieve_data(message.from_user.id, message.chat.id) as data:
+        item_id, item_title = data.get('item_id'), data.get('item_title')
+    await bot.delete_state(message.from_user.id, message.chat.id)
+
+    if await run_db(db.remove_item, item_id):
+        outbox.send_message(message.chat.id, f"✅ Предмет '{item_title}' был успешно удалён.", reply_markup=main_menu_keyboard())
+    else:
+        outbox.send_message(message.chat.id, "❌ Не удалось удалить предмет.", reply_markup=main_menu_keyboard())
+
+
+# --- Логика статистики ---
+
+@access_checker
+async def show_statistics(message: Message, bot: AsyncTeleBot):
+    """Показывает первую страницу статистики; остальные открываются кнопками навигации."""
+    await bot.delete_state(message.from_user.id, message.chat.id)
+    await send_items_page(message, bot, ListViews.STATS, "У вас пока нет отслеживаемых предметов для статистики.")
+
+
+async def send_items_page(message: Message, bot: AsyncTeleBot, view: str, empty_text: str):
+    """Отправляет первую страницу списка предметов."""
+    rendered = await run_db(render_items_page, message.from_user.id, view)
+    if not rendered:
+        outbox.send_message(message.chat.id, empty_text)
+        return
+    text, markup = rendered
+    outbox.send_message(message.chat.id, text, reply_markup=markup)
+
+
+# --- Inline-кнопки списков: навигация и выбор предмета ---
+
+@access_checker
+async def items_callback_handler(call: CallbackQuery, bot: AsyncTeleBot):
+    """Листает страницу списка или начинает редактирование/удаление выбранного предмета."""
+    data = parse_items_callback(call.data)
+    outbox.answer_callback_query(call.message.chat.id, call.id)
+    if not data:
+        return
+    chat_id = call.message.chat.id
+
+    if data['action'] == CallbackActions.PAGE:
+        rendered = await run_db(render_items_page, call.from_user.id, data['view'], data['direction'], data['page_number'], data['cursor'])
+        text, markup = rendered or ("Список предметов пуст.", None)
+        # Повторное нажатие (страница не изменилась) очередь считает успешной правкой
+        outbox.edit_message_text(chat_id, call.message.message_id, text, reply_markup=markup)
+        return
+
+    # Кнопка могла прийти с чужим ID предмета - выбирать можно только свои предметы
+    item = await run_db(get_own_item, data['item_id'], call.from_user.id)
+    if not item:
+        outbox.send_message(chat_id, "❌ Предмет не найден. Возможно, он уже удален.", reply_markup=main_menu_keyboard())
+        return
+
+    if data['view'] == ListViews.EDIT:
+        await bot.set_state(call.from_user.id, EditPriceStates.price, chat_id)
+        await bot.add_data(call.from_user.id, chat_id, item_id=item['id'])
+        outbox.send_message(chat_id, f"Введите новую закупочную цену для '{item['title']}':", reply_markup=cancel_keyboard())
+    elif data['view'] == ListViews.DELETE:
+        await bot.set_state(call.from_user.id, DeleteItemStates.confirm, chat_id)
+        await bot.add_data(call.from_user.id, chat_id, item_id=item['id'], item_title=item['title'])
+        outbox.send_message(chat_id, f"Вы уверены, что хотите удалить '{item['title']}'?", reply_markup=confirm_delete_keyboard())
+    elif data['view'] == ListViews.ALERTS:
+        await bot.set_state(call.from_user.id, AlertStates.rule, chat_id)
+        await bot.add_data(call.from_user.id, chat_id, item_id=item['id'])
+        outbox.send_message(chat_id, await run_db(alerts_prompt, item), reply_markup=cancel_keyboard())
+
+
+# --- Логика уведомлений о цене ---
+
+@access_checker
+async def alerts_start(message: Message, bot: AsyncTeleBot):
+    """Начало сценария настройки уведомлений: первая страница списка с кнопками выбора."""
+    await bot.delete_state(message.from_user.id, message.chat.id)
+    await send_items_page(message, bot, ListViews.ALERTS, "У вас пока нет предметов для уведомлений.")
+
+
+async def process_alert_step(message: Message, bot: AsyncTeleBot):
+    """Сохраняет правило уведомления для выбранного предмета."""
+    async with bot.retrieve_data(message.from_user.id, message.chat.id) as data:
+        item_id = data.get('item_id')
+    reply = await run_db(apply_alert_rule, item_id, message.from_user.id, message.text) if message.text else None
+    if reply is None:
+        outbox.send_message(message.chat.id, "Не понял правило. Пример: >25, <10, +20%, -10% или ~5%", reply_markup=cancel_keyboard())
+        return
+    await bot.delete_state(message.from_user.id, message.chat.id)
+    outbox.send_message(message.chat.id, reply, reply_markup=main_menu_keyboard())
+
+
+# --- Логика добавления предмета ---
+
+@access_checker
+async def add_item_start(message: Message, bot: AsyncTeleBot):
+    """Начало сценария добавления предмета. Запрашивает у пользователя URL."""
+    await bot.set_state(message.from_user.id, AddItemStates.url, message.chat.id)
+    outbox.send_message(message.chat.id, "Пожалуйста, отправь мне ссылку на предмет:", reply_markup=cancel_keyboard())
+
+
+async def process_url_step(message: Message, bot: AsyncTeleBot):
+    """Обрабатывает полученный URL и запрашивает цену закупки."""
+    if not message.text:
+        outbox.send_message(message.chat.id, "Пожалуйста, отправь ссылку в виде текстового сообщения.", reply_markup=cancel_keyboard())
+        return
+
+    url = message.text
+    if not config.is_valid_url(url):
+        outbox.send_message(message.chat.id, "Этот домен не поддерживается. Пожалуйста, отправь ссылку с одного из разрешенных доменов.", reply_markup=cancel_keyboard())
+        return
+
+    await bot.add_data(message.from_user.id, message.chat.id, url=url)
+    await bot.set_state(message.from_user.id, AddItemStates.price, message.chat.id)
+    outbox.send_message(message.chat.id, "Отлично! Теперь введи цену закупки (например: 15.55):", reply_markup=cancel_keyboard())
+
+
+async def process_price_step(message: Message, bot: AsyncTeleBot):
+    """Обрабатывает цену закупки и ставит добавление предмета в фоновую очередь."""
+    purchase_price = parse_price_text(message.text)
+    if purchase_price is None:
+        outbox.send_message(message.chat.id, "Неверный формат цены. Попробуй еще раз, например: 15.55", reply_markup=cancel_keyboard())
+        return
+
+    async with bot.retrieve_data(message.from_user.id, message.chat.id) as data:
+        url = data.get('url')
+    await bot.delete_state(message.from_user.id, message.chat.id)
+
+    outbox.send_message(message.chat.id, "👌 Принято! Предмет добавляется в фоне, ход выполнения - в следующем сообщении.", reply_markup=main_menu_keyboard())
+
+    try:
+        # Задание сохраняется в БД, загрузка страницы идет в потоках очереди
+        await run_db(add_jobs.submit, message.chat.id, url, purchase_price, message.from_user.id)
+    except Exception as e:
+        outbox.send_message(message.chat.id, f"Произошла ошибка при обработке: {e}. Попробуй еще раз.")
+
+
+async def cancel_handler(message: Message, bot: AsyncTeleBot):
+    """Обрабатывает команду отмены, сбрасывает состояние и возвращает в главное меню."""
+    await bot.delete_state(message.from_user.id, message.chat.id)
+    outbox.send_message(message.chat.id, "Действие отменено.", reply_markup=main_menu_keyboard())
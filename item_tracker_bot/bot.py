@@ -3,6 +3,7 @@
 Главный файл для запуска телеграм-бота для отслеживания предметов.
 """
 import telebot
+import asyncio
 import logging
 import threading
 from dotenv import load_dotenv
@@ -13,10 +14,88 @@ load_dotenv()
 from config import config
 from item_tracker_bot.handlers import register_handlers
 from item_tracker_bot.updater import periodic_updater
+from item_tracker_bot.outbox import get_outbox
+from item_tracker_bot.webhook import WebhookServer
+from metrics import MetricsServer
 
 # Настройка логирования
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 
+
+def _start_metrics_server():
+    """Запускает сервер метрик, если задан METRICS_PORT."""
+    if not config.METRICS_PORT:
+        return None
+    try:
+        return MetricsServer(config.METRICS_LISTEN, config.METRICS_PORT).start()
+    except OSError as e:
+        logging.error(f"Не удалось запустить сервер метрик на порту {config.METRICS_PORT}: {e}")
+        return None
+
+
+def _webhook_server(process) -> WebhookServer:
+    """Создает сервер webhook по настройкам из config."""
+    return WebhookServer(
+        process,
+        listen=config.WEBHOOK_LISTEN,
+        port=config.WEBHOOK_PORT,
+        path=config.WEBHOOK_PATH,
+        secret=config.WEBHOOK_SECRET,
+        workers=config.WEBHOOK_WORKERS,
+        max_pending=config.WEBHOOK_MAX_PENDING,
+    )
+
+
+async def _run_async():
+    """
+    Запуск в режиме asyncio: обработчики и цикл обновления работают в одном цикле
+    событий, блокирующая работа вынесена в пулы потоков, а сообщения отправляет
+    очередь исходящих сообщений в своем потоке.
+    """
+    from telebot import asyncio_helper
+    from telebot.async_telebot import AsyncTeleBot
+    from telebot.asyncio_storage import StateMemoryStorage
+    from item_tracker_bot.async_handlers import register_async_handlers
+    from item_tracker_bot.updater import periodic_updater_async
+    from item_tracker_bot.executors import shutdown_executors
+
+    if config.TELEGRAM_API_URL:
+        asyncio_helper.API_URL = config.TELEGRAM_API_URL
+    bot = AsyncTeleBot(config.BOT_TOKEN, parse_mode="HTML", state_storage=StateMemoryStorage())
+    logging.info("Асинхронный бот для отслеживания предметов инициализирован.")
+
+    register_async_handlers(bot)
+    logging.info("Асинхронные обработчики зарегистрированы.")
+    metrics_server = _start_metrics_server()
+
+    updater_task = asyncio.create_task(periodic_updater_async(bot, config.NOTIFICATION_INTERVAL_HOURS))
+    server = None
+    try:
+        if config.BOT_RECEIVE_MODE == 'webhook':
+            loop = asyncio.get_running_loop()
+            # Поток пула ждет завершения обработчиков, поэтому порядок внутри чата сохраняется
+            server = _webhook_server(
+                lambda update: asyncio.run_coroutine_threadsafe(bot.process_new_updates([update]), loop).result()
+            ).start()
+            if config.WEBHOOK_URL:
+                await bot.set_webhook(url=config.WEBHOOK_URL, secret_token=config.WEBHOOK_SECRET,
+                                      max_connections=config.WEBHOOK_WORKERS)
+            logging.info("Запуск бота для отслеживания предметов (asyncio, webhook)...")
+            await updater_task
+        else:
+            logging.info("Запуск бота для отслеживания предметов (asyncio)...")
+            await bot.infinity_polling()
+    finally:
+        if server is not None:
+            server.stop()
+        if metrics_server is not None:
+            metrics_server.stop()
+        updater_task.cancel()
+        await bot.close_session()
+        get_outbox().stop()
+        shutdown_executors()
+
+
 def run():
     """
     Основная функция для инициализации и запуска бота.
@@ -29,11 +108,22 @@ def run():
         logging.error("Токен бота не является строкой. Проверьте .env файл.")
         return
 
-    bot = telebot.TeleBot(config.BOT_TOKEN, parse_mode="HTML")
+    if config.TELEGRAM_API_URL:
+        # Другой адрес Bot API (локальный сервер или тестовая заглушка)
+        telebot.apihelper.API_URL = config.TELEGRAM_API_URL
+        logging.info(f"Bot API: {config.TELEGRAM_API_URL}")
+
+    if config.BOT_RUNTIME == 'asyncio':
+        asyncio.run(_run_async())
+        return
+
+    # В режиме webhook обработчики выполняются в пуле сервера, а не в собственном пуле TeleBot
+    bot = telebot.TeleBot(config.BOT_TOKEN, parse_mode="HTML", threaded=config.BOT_RECEIVE_MODE != 'webhook')
     logging.info("Бот для отслеживания предметов инициализирован.")
 
     register_handlers(bot)
     logging.info("Обработчики для трекера зарегистрированы.")
+    _start_metrics_server()
 
     update_thread = threading.Thread(
         target=periodic_updater, 
@@ -42,8 +132,24 @@ def run():
     )
     update_thread.start()
 
+    if config.BOT_RECEIVE_MODE == 'webhook':
+        server = _webhook_server(lambda update: bot.process_new_updates([update]))
+        if config.WEBHOOK_URL:
+            bot.set_webhook(url=config.WEBHOOK_URL, secret_token=config.WEBHOOK_SECRET,
+                            max_connections=config.WEBHOOK_WORKERS)
+        logging.info("Запуск бота для отслеживания предметов (webhook)...")
+        try:
+            server.serve_forever()
+        finally:
+            server.stop()
+            get_outbox().stop()
+        return
+
     logging.info("Запуск бота для отслеживания предметов...")
-    bot.polling(none_stop=True)
+    try:
+        bot.polling(none_stop=True)
+    finally:
+        get_outbox().stop()
 
 if __name__ == "__main__":
     run() 
\ No newline at end of file
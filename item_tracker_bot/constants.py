@@ -11,9 +11,23 @@ class MainMenuCommands(str, Enum):
     REMOVE_ITEM = "🗑️ Удалить предмет"
     GET_STATS = "📊 Статистика"
     EDIT_PRICE = "✏️ Редактировать цену"
+    ALERTS = "🔔 Уведомления"
 
 
 class ActionCommands(str, Enum):
     """Команды для действий в процессе диалога."""
     CANCEL = "❌ Отмена"
-    CONFIRM_DELETE = "✅ Да" 
\ No newline at end of file
+    CONFIRM_DELETE = "✅ Да" 
+
+class ListViews(str, Enum):
+    """Постраничные списки предметов (код используется в callback_data)."""
+    STATS = "s"
+    EDIT = "e"
+    DELETE = "d"
+    ALERTS = "a"
+
+
+class CallbackActions(str, Enum):
+    """Действия inline-кнопок: callback_data имеет вид "<действие>|<список>|..."."""
+    PAGE = "pg"
+    SELECT = "sel"
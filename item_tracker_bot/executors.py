@@ -0,0 +1,35 @@
+# -*- coding: utf-8 -*-
+"""
+Ограниченные пулы потоков для блокирующей работы в режиме asyncio.
+Парсинг и SQLite выполняются в отдельных пулах, чтобы медленная загрузка страницы
+не занимала потоки, нужные для работы с базой данных.
+"""
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+from config import config
+
+# Пул для загрузки страниц (HTTP и вкладки браузера)
+scrape_executor = ThreadPoolExecutor(max_workers=config.ASYNC_SCRAPE_WORKERS, thread_name_prefix="scrape")
+
+# Пул для запросов к SQLite
+db_executor = ThreadPoolExecutor(max_workers=config.ASYNC_DB_WORKERS, thread_name_prefix="db")
+
+
+async def run_scrape(func, *args, **kwargs):
+    """Выполняет блокирующую загрузку страницы в пуле парсинга."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(scrape_executor, partial(func, *args, **kwargs))
+
+
+async def run_db(func, *args, **kwargs):
+    """Выполняет блокирующий запрос к БД в пуле базы данных."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(db_executor, partial(func, *args, **kwargs))
+
+
+def shutdown_executors():
+    """Останавливает пулы потоков при завершении работы."""
+    scrape_executor.shutdown(wait=False, cancel_futures=True)
+    db_executor.shutdown(wait=False, cancel_futures=True)
@@ -2,41 +2,280 @@
 """
 Модуль для обработки команд и сообщений от пользователя.
 """
+import asyncio
+import html
+import math
+import threading
+import time
 from functools import wraps
+from typing import Optional, Tuple, Union
 import telebot
-from telebot.types import Message
+from telebot.types import Message, CallbackQuery, InlineKeyboardMarkup
 
 # Импортируем бизнес-логику
 from db.connector import CSMarketDatabase
-from db.models import Item
 from parser.parser import CSMarketParser
+from parser.rate_limiter import get_rate_limiter
 
 # Импортируем клавиатуру, константы и общую конфигурацию
-from item_tracker_bot.keyboards import main_menu_keyboard, cancel_keyboard, numeric_keyboard, confirm_delete_keyboard
-from item_tracker_bot.constants import MainMenuCommands, ActionCommands
+from item_tracker_bot.scheduler import get_refresh_scheduler
+from item_tracker_bot.transport import get_parser_transport
+from item_tracker_bot.outbox import get_outbox
+from item_tracker_bot.jobs import AddItemJobs
+from item_tracker_bot.alerts import get_alert_engine, parse_alert_rule, describe_alert
+from item_tracker_bot.executors import run_db
+from item_tracker_bot.keyboards import main_menu_keyboard, cancel_keyboard, items_page_keyboard, confirm_delete_keyboard
+from item_tracker_bot.constants import MainMenuCommands, ActionCommands, ListViews, CallbackActions
 from config import config
 
 # Инициализируем коннектор к базе данных
 # Путь к БД берется из общего конфига
-db = CSMarketDatabase(db_path=config.DATABASE_PATH)
+# Предметы из базы без владельцев переносятся в портфель администратора
+db = CSMarketDatabase(db_path=config.DATABASE_PATH, busy_timeout_ms=config.DB_BUSY_TIMEOUT_MS,
+                      default_user_id=config.ADMIN_ID)
+
+# Общий пул браузеров и HTTP-клиент (те же экземпляры использует фоновый обновлятель)
+# либо воспроизведение кассеты вместо них (config.PARSER_TRANSPORT)
+browser_pool, http_fetcher, page_recorder = get_parser_transport()
+rate_limiter = get_rate_limiter(config.DOMAIN_RATE_LIMITS)
+# Ответы пользователям уходят через общую очередь с учетом ограничений Telegram
+outbox = get_outbox()
+# Уведомления о цене (тот же движок проверяет наблюдения в фоновом обновлении)
+alert_engine = get_alert_engine(db)
+
+# Пользователи, уже сохраненные в таблице users этим процессом (регистрация - одна запись на пользователя)
+_registered_users = set()
+_registered_lock = threading.Lock()
+
+
+def register_user(update: Union[Message, CallbackQuery]):
+    """Сохраняет пользователя и его чат для отчетов (блокирующий вызов, только при первом обращении)."""
+    user = update.from_user
+    chat = update.chat if isinstance(update, Message) else update.message.chat
+    with _registered_lock:
+        if user.id in _registered_users:
+            return
+    if db.register_user(user.id, chat.id, user.username):
+        with _registered_lock:
+            _registered_users.add(user.id)
 
 
 def access_checker(func):
     """
     Декоратор для проверки доступа к боту.
-    Разрешает доступ только администратору, указанному в config.py.
+    Разрешает доступ администратору и пользователям из config.ALLOWED_USER_IDS
+    (или всем при config.OPEN_ACCESS) и регистрирует пользователя при первом обращении.
     """
+    if asyncio.iscoroutinefunction(func):
+        # Вариант для асинхронных обработчиков (режим asyncio)
+        @wraps(func)
+        async def async_wrapper(message: Message, *args, **kwargs):
+            if not message.from_user or not config.is_allowed(message.from_user.id):
+                return
+            if message.from_user.id not in _registered_users:
+                await run_db(register_user, message)
+            return await func(message, *args, **kwargs)
+        return async_wrapper
+
     @wraps(func)
     def wrapper(message: Message, *args, **kwargs):
-        if not message.from_user or not config.is_admin(message.from_user.id):
-            # Если ID пользователя не совпадает, ничего не делаем
+        if not message.from_user or not config.is_allowed(message.from_user.id):
+            # Если доступ пользователю не разрешен, ничего не делаем
             return
+        register_user(message)
         
         # Если проверка пройдена, вызываем основную функцию
         return func(message, *args, **kwargs)
     return wrapper
 
 
+# --- Общая логика, которую используют и обычные, и асинхронные обработчики ---
+
+def parse_price_text(text: str) -> Optional[float]:
+    """Преобразует введенную пользователем цену ("15,55" или "15.55") в число."""
+    try:
+        return float(text.replace(',', '.'))
+    except (ValueError, TypeError, AttributeError):
+        return None
+
+
+def render_items_page(user_id: int, view: str, direction: Optional[str] = None, page_number: int = 1,
+                      cursor: Optional[Tuple[str, int]] = None) -> Optional[Tuple[str, InlineKeyboardMarkup]]:
+    """
+    Формирует одну страницу списка предметов пользователя (HTML) и клавиатуру навигации (блокирующий вызов).
+    Запрашивается только эта страница, поэтому размер ответа не зависит от числа предметов.
+    
+    Args:
+        user_id: Владелец портфеля.
+        view: Код списка (ListViews): статистика, редактирование или удаление.
+        direction: 'n' - следующая страница после cursor, 'p' - предыдущая перед cursor.
+        page_number: Номер запрашиваемой страницы (для заголовка).
+        cursor: Ключ (updated_at, id) крайнего предмета текущей страницы.
+        
+    Returns:
+        (текст, клавиатура) или None, если предметов нет.
+    """
+    view = ListViews(view)
+    page_size = config.LIST_PAGE_SIZE
+    page = db.get_items_page(
+        user_id, page_size,
+        after=cursor if direction == 'n' else None,
+        before=cursor if direction == 'p' else None
+    )
+    if not page['items'] and cursor is not None:
+        # Соседние предметы успели измениться или удалиться - показываем начало списка
+        page = db.get_items_page(user_id, page_size)
+    if not page['items']:
+        return None
+    if not page['has_prev']:
+        page_number = 1
+    # Просмотренные предметы планировщик проверит в ближайшее время
+    get_refresh_scheduler(db).record_views([item['id'] for item in page['items']])
+
+    summary = db.portfolio_summary(user_id)
+    total_pages = max(page_number, math.ceil(summary['count'] / page_size))
+    position = f"стр. {page_number} из {total_pages}"
+    first_number = (page_number - 1) * page_size + 1
+
+    if view == ListViews.STATS:
+        report_parts = [f"<b>📊 Статистика по предметам</b> ({position})\n"]
+        for item in page['items']:
+            purchase_price = item['purchase_price'] or 0
+            current_price = item['current_price'] or 0
+            absolute_profit, percent_profit = db.aggregator.item_profit(item['id'])
+            sign = "🟢" if absolute_profit >= 0 else "🔴"
+            report_parts.append(
+                f"\n<b>{html.escape(item['title'])}</b>\n"
+                f"  - Цена покупки: ${purchase_price:.2f}\n"
+                f"  - Текущая цена: ${current_price:.2f}\n"
+                f"  - Прибыль: {sign} ${absolute_profit:.2f} ({percent_profit:.2f}%)"
+            )
+        # Итоги по всему портфелю берутся из агрегатора и не требуют обхода всех предметов
+        total_sign = "🟢" if summary['total_profit'] >= 0 else "🔴"
+        report_parts.append(
+            f"\n\n<b>📈 Итого ({summary['count']} предм.):</b>\n"
+            f"  - Общая сумма закупки: ${summary['total_purchase']:.2f}\n"
+            f"  - Общая текущая стоимость: ${summary['total_current']:.2f}\n"
+            f"  - В плюсе: {summary['winners']}, в минусе: {summary['losers']}\n"
+            f"  - <b>Общая прибыль: {total_sign} ${summary['total_profit']:.2f} ({summary['total_profit_percent']:.2f}%)</b>"
+        )
+    else:
+        header = {
+            ListViews.EDIT: "Какой предмет вы хотите отредактировать?",
+            ListViews.DELETE: "Какой предмет вы хотите удалить?",
+            ListViews.ALERTS: "Для какого предмета настроить уведомления?",
+        }[view]
+        report_parts = [f"<b>{header}</b>\nНажмите на предмет ниже ({position}).\n"]
+        for number, item in enumerate(page['items'], first_number):
+            if view == ListViews.EDIT:
+                report_parts.append(f"<b>{number}</b>. {html.escape(item['title'])} (цена закупки: ${item['purchase_price'] or 0:.2f})")
+            else:
+                report_parts.append(f"<b>{number}</b>. {html.escape(item['title'])}")
+
+    markup = items_page_keyboard(view.value, page, page_number, selectable=view != ListViews.STATS)
+    return "\n".join(report_parts), markup
+
+
+def parse_items_callback(data: str) -> Optional[dict]:
+    """
+    Разбирает callback_data inline-кнопок списков предметов.
+    
+    Returns:
+        {'action', 'view', ...} или None, если данные не от этих кнопок.
+        Для PAGE: 'direction', 'page_number', 'cursor'; для SELECT: 'item_id'.
+    """
+    parts = (data or '').split('|')
+    if len(parts) < 3 or parts[1] not in {view.value for view in ListViews}:
+        return None
+    try:
+        if parts[0] == CallbackActions.PAGE and len(parts) == 6:
+            return {
+                'action': CallbackActions.PAGE, 'view': parts[1], 'direction': parts[2],
+                'page_number': int(parts[3]), 'cursor': (parts[4], int(parts[5])),
+            }
+        if parts[0] == CallbackActions.SELECT and len(parts) == 3:
+            return {'action': CallbackActions.SELECT, 'view': parts[1], 'item_id': int(parts[2])}
+    except ValueError:
+        pass
+    return None
+
+
+def fetch_item_data(url: str) -> dict:
+    """
+    Загружает данные предмета (блокирующий вызов: HTTP или вкладка из общего пула).
+    Если за предметом уже следят и каталог проверял страницу недавно, данные берутся из каталога.
+    """
+    entry = db.catalog.get(url)
+    if entry and entry['checked_at'] and time.time() - entry['checked_at'] < config.CATALOG_FRESH_MINUTES * 60:
+        return {'url': url, 'title': entry['title'], 'price': entry['current_price']}
+
+    # Используем парсер как контекстный менеджер (вкладка берется из общего пула)
+    with CSMarketParser(
+        wait_time=config.PARSER_WAIT_TIME, pool=browser_pool,
+        http_first=config.PARSER_HTTP_FIRST, http=http_fetcher,
+        rate_limiter=rate_limiter, extraction_mode=config.PARSER_EXTRACTION_MODE,
+        recorder=page_recorder
+    ) as parser:
+        return parser.parse_item_page(url)
+
+
+def save_new_item(item_data: dict, url: str, purchase_price: float, user_id: int) -> None:
+    """Сохраняет новый предмет в портфель пользователя и его цену закупки."""
+    # 1. Добавляем предмет в БД (с ценой закупки 0)
+    db.add_item({**item_data, 'user_id': user_id})
+    
+    # 2. Устанавливаем цену закупки (и пересчитываем прибыль)
+    db.set_purchase_price(url, purchase_price, user_id)
+
+
+def alerts_prompt(item: dict) -> str:
+    """Текущие уведомления предмета и формат нового правила (HTML, блокирующий вызов)."""
+    alerts = db.alerts.for_item(item['id'])
+    current = "\n".join(f"  - {describe_alert(alert)}" for alert in alerts) or "  - нет"
+    return (
+        f"<b>🔔 {html.escape(item['title'])}</b> (текущая цена: ${item['current_price'] or 0:.2f})\n"
+        f"Уведомления:\n{current}\n\n"
+        "Отправь правило:\n"
+        "  <code>&gt;25</code> - цена выше $25, <code>&lt;10</code> - ниже $10\n"
+        "  <code>+20%</code> / <code>-10%</code> - прибыль от закупки выше 20% / ниже -10%\n"
+        "  <code>~5%</code> - цена изменилась на 5% и больше за одну проверку\n"
+        "  <code>удалить</code> - убрать все уведомления предмета"
+    )
+
+
+def apply_alert_rule(item_id: int, user_id: int, text: str) -> Optional[str]:
+    """
+    Применяет правило уведомления, введенное пользователем (блокирующий вызов).
+    
+    Returns:
+        Ответ пользователю или None, если правило не распознано.
+    """
+    if text.strip().lower() in ('удалить', 'сброс'):
+        removed = alert_engine.remove_for_item(item_id)
+        return f"🔕 Удалено уведомлений: {removed}."
+    rule = parse_alert_rule(text)
+    if rule is None:
+        return None
+    alert = alert_engine.add(item_id, user_id, *rule)
+    if not alert['armed']:
+        return f"🔔 Уведомление сохранено: {describe_alert(alert)}. Текущая цена уже за порогом."
+    return f"🔔 Уведомление сохранено: {describe_alert(alert)}."
+
+
+def get_own_item(item_id: int, user_id: int) -> Optional[dict]:
+    """Возвращает предмет, только если он принадлежит пользователю."""
+    item = db.get_item_by_id(item_id)
+    return item if item and item['user_id'] == user_id else None
+
+
+# Фоновая очередь добавления предметов (задания хранятся в БД и переживают перезапуск)
+add_jobs = AddItemJobs(
+    db, outbox, fetch_item_data, save_new_item,
+    workers=config.ADD_JOB_WORKERS, max_attempts=config.ADD_JOB_MAX_ATTEMPTS,
+    retry_delay=config.ADD_JOB_RETRY_SECONDS
+)
+
+
 def register_handlers(bot: telebot.TeleBot):
     """
     Регистрирует все обработчики команд для бота.
@@ -44,6 +283,9 @@ def register_handlers(bot: telebot.TeleBot):
     Args:
         bot (telebot.TeleBot): Экземпляр бота.
     """
+    # Продолжаем задания на добавление, прерванные перезапуском
+    add_jobs.start()
+
     # Оборачиваем вызовы в lambda, чтобы передать экземпляр `bot`
     bot.register_message_handler(
         lambda message: cancel_handler(message, bot),
@@ -69,6 +311,14 @@ def register_handlers(bot: telebot.TeleBot):
         lambda message: edit_price_start(message, bot),
         func=lambda message: message.text == MainMenuCommands.EDIT_PRICE
     )
+    bot.register_message_handler(
+        lambda message: alerts_start(message, bot),
+        func=lambda message: message.text == MainMenuCommands.ALERTS
+    )
+    bot.register_callback_query_handler(
+        lambda call: items_callback_handler(call, bot),
+        func=lambda call: parse_items_callback(call.data) is not None
+    )
     # Здесь будут регистрироваться другие обработчики
 
 
@@ -78,7 +328,7 @@ def start_handler(message: Message, bot: telebot.TeleBot):
     Обработчик команд /start и /help.
     Отправляет приветственное сообщение и главное меню.
     """
-    bot.send_message(
+    outbox.send_message(
         message.chat.id,
         "Привет! Я бот для отслеживания цен на предметы. Выбери действие:",
         reply_markup=main_menu_keyboard()
@@ -91,56 +341,10 @@ def start_handler(message: Message, bot: telebot.TeleBot):
 def edit_price_start(message: Message, bot: telebot.TeleBot):
     """
     Начало сценария редактирования цены.
-    Показывает нумерованный список предметов и клавиатуру с цифрами.
-    """
-    items = db.get_all_items()
-    if not items:
-        bot.send_message(message.chat.id, "У вас пока нет предметов для редактирования.")
-        return
-
-    report_parts = ["*Какой предмет вы хотите отредактировать?*\nОтправьте его номер (для первых 10 можно использовать клавиатуру).\n"]
-    for i, item in enumerate(items, 1):
-        report_parts.append(f"*{i}*. {item['title']} (текущая цена: ${item['purchase_price']:.2f})")
-    
-    report = "\n".join(report_parts)
-    
-    bot.send_message(
-        message.chat.id,
-        report,
-        reply_markup=numeric_keyboard(len(items)),
-        parse_mode="Markdown"
-    )
-    bot.register_next_step_handler(message, process_item_choice_for_edit, bot, items)
-
-
-def process_item_choice_for_edit(message: Message, bot: telebot.TeleBot, items: list):
+    Показывает первую страницу списка предметов с inline-кнопками выбора.
     """
-    Обрабатывает выбор номера предмета для редактирования.
-    """
-    if message.text == ActionCommands.CANCEL:
-        return cancel_handler(message, bot)
-
-    if not message.text or not message.text.isdigit():
-        bot.send_message(message.chat.id, "Пожалуйста, введите номер предмета из списка.", reply_markup=numeric_keyboard(len(items)))
-        bot.register_next_step_handler(message, process_item_choice_for_edit, bot, items)
-        return
-        
-    choice = int(message.text)
-    if not (1 <= choice <= len(items)):
-        bot.send_message(message.chat.id, f"Неверный номер. Введите число от 1 до {len(items)}.", reply_markup=numeric_keyboard(len(items)))
-        bot.register_next_step_handler(message, process_item_choice_for_edit, bot, items)
-        return
-
-    selected_item = items[choice - 1]
-    item_id = selected_item['id']
-    item_title = selected_item['title']
-
-    bot.send_message(
-        message.chat.id,
-        f"Введите новую закупочную цену для '{item_title}':",
-        reply_markup=cancel_keyboard()
-    )
-    bot.register_next_step_handler(message, process_new_price_step, bot, item_id)
+    bot.clear_step_handler_by_chat_id(chat_id=message.chat.id)
+    send_items_page(message, bot, ListViews.EDIT, "У вас пока нет предметов для редактирования.")
 
 
 def process_new_price_step(message: Message, bot: telebot.TeleBot, item_id: int):
@@ -151,25 +355,24 @@ def process_new_price_step(message: Message, bot: telebot.TeleBot, item_id: int)
         return cancel_handler(message, bot)
 
     if not message.text:
-        bot.send_message(message.chat.id, "Пожалуйста, отправь цену в виде текстового сообщения.", reply_markup=cancel_keyboard())
+        outbox.send_message(message.chat.id, "Пожалуйста, отправь цену в виде текстового сообщения.", reply_markup=cancel_keyboard())
         bot.register_next_step_handler(message, process_new_price_step, bot, item_id)
         return
 
-    try:
-        new_price = float(message.text.replace(',', '.'))
-    except (ValueError, TypeError):
-        bot.send_message(message.chat.id, "Неверный формат цены. Попробуй еще раз, например: 15.55", reply_markup=cancel_keyboard())
+    new_price = parse_price_text(message.text)
+    if new_price is None:
+        outbox.send_message(message.chat.id, "Неверный формат цены. Попробуй еще раз, например: 15.55", reply_markup=cancel_keyboard())
         bot.register_next_step_handler(message, process_new_price_step, bot, item_id)
         return
     
     if db.set_purchase_price_by_id(item_id, new_price):
-        bot.send_message(
+        outbox.send_message(
             message.chat.id, 
             f"✅ Цена закупки для предмета успешно изменена на ${new_price:.2f}.",
             reply_markup=main_menu_keyboard()
         )
     else:
-        bot.send_message(
+        outbox.send_message(
             message.chat.id, 
             "❌ Не удалось изменить цену. Предмет не найден.",
             reply_markup=main_menu_keyboard()
@@ -182,54 +385,10 @@ def process_new_price_step(message: Message, bot: telebot.TeleBot, item_id: int)
 def delete_item_start(message: Message, bot: telebot.TeleBot):
     """
     Начало сценария удаления предмета.
-    Показывает нумерованный список предметов и клавиатуру с цифрами.
+    Показывает первую страницу списка предметов с inline-кнопками выбора.
     """
-    items = db.get_all_items()
-    if not items:
-        bot.send_message(message.chat.id, "У вас пока нет отслеживаемых предметов.")
-        return
-
-    report_parts = ["*Какой предмет вы хотите удалить?*\nОтправьте его номер (для первых 10 можно использовать клавиатуру).\n"]
-    for i, item in enumerate(items, 1):
-        report_parts.append(f"*{i}*. {item['title']}")
-
-    report = "\n".join(report_parts)
-    bot.send_message(
-        message.chat.id,
-        report,
-        reply_markup=numeric_keyboard(len(items)),
-        parse_mode="Markdown"
-    )
-    bot.register_next_step_handler(message, process_item_choice_for_delete, bot, items)
-
-
-def process_item_choice_for_delete(message: Message, bot: telebot.TeleBot, items: list):
-    """Обрабатывает выбор номера предмета для удаления."""
-    if message.text == ActionCommands.CANCEL:
-        return cancel_handler(message, bot)
-
-    if not message.text or not message.text.isdigit():
-        bot.send_message(message.chat.id, "Пожалуйста, введите номер предмета из списка.", reply_markup=numeric_keyboard(len(items)))
-        bot.register_next_step_handler(message, process_item_choice_for_delete, bot, items)
-        return
-
-    choice = int(message.text)
-    if not (1 <= choice <= len(items)):
-        bot.send_message(message.chat.id, f"Неверный номер. Введите число от 1 до {len(items)}.", reply_markup=numeric_keyboard(len(items)))
-        bot.register_next_step_handler(message, process_item_choice_for_delete, bot, items)
-        return
-
-    selected_item = items[choice - 1]
-    item_id = selected_item['id']
-    item_title = selected_item['title']
-
-    # Запрашиваем подтверждение
-    bot.send_message(
-        message.chat.id,
-        f"Вы уверены, что хотите удалить '{item_title}'?",
-        reply_markup=confirm_delete_keyboard()
-    )
-    bot.register_next_step_handler(message, confirm_delete_step, bot, item_id, item_title)
+    bot.clear_step_handler_by_chat_id(chat_id=message.chat.id)
+    send_items_page(message, bot, ListViews.DELETE, "У вас пока нет отслеживаемых предметов.")
 
 
 def confirm_delete_step(message: Message, bot: telebot.TeleBot, item_id: int, item_title: str):
@@ -239,18 +398,18 @@ def confirm_delete_step(message: Message, bot: telebot.TeleBot, item_id: int, it
 
     if message.text != ActionCommands.CONFIRM_DELETE:
         # Если что-то другое, повторяем запрос
-        bot.send_message(message.chat.id, "Нажмите '✅ Да' для удаления или '❌ Отмена' для отмены.", reply_markup=confirm_delete_keyboard())
+        outbox.send_message(message.chat.id, "Нажмите '✅ Да' для удаления или '❌ Отмена' для отмены.", reply_markup=confirm_delete_keyboard())
         bot.register_next_step_handler(message, confirm_delete_step, bot, item_id, item_title)
         return
 
     if db.remove_item(item_id):
-        bot.send_message(
+        outbox.send_message(
             message.chat.id,
             f"✅ Предмет '{item_title}' был успешно удалён.",
             reply_markup=main_menu_keyboard()
         )
     else:
-        bot.send_message(
+        outbox.send_message(
             message.chat.id,
             "❌ Не удалось удалить предмет.",
             reply_markup=main_menu_keyboard()
@@ -262,61 +421,92 @@ def confirm_delete_step(message: Message, bot: telebot.TeleBot, item_id: int, it
 @access_checker
 def show_statistics(message: Message, bot: telebot.TeleBot):
     """
-    Показывает статистику по всем отслеживаемым предметам.
+    Показывает первую страницу статистики; остальные открываются кнопками навигации.
     """
-    items_data = db.get_all_items()
+    send_items_page(message, bot, ListViews.STATS, "У вас пока нет отслеживаемых предметов для статистики.")
 
-    if not items_data:
-        bot.send_message(message.chat.id, "У вас пока нет отслеживаемых предметов для статистики.")
+
+def send_items_page(message: Message, bot: telebot.TeleBot, view: str, empty_text: str):
+    """Отправляет первую страницу списка предметов."""
+    rendered = render_items_page(message.from_user.id, view)
+    if not rendered:
+        outbox.send_message(message.chat.id, empty_text)
         return
+    text, markup = rendered
+    outbox.send_message(message.chat.id, text, reply_markup=markup)
 
-    total_purchase_price = 0
-    total_current_price = 0
-    
-    report_parts = ["<b>📊 Статистика по предметам:</b>\n"]
 
-    for item_data in items_data:
-        item = Item.from_dict(item_data)
-        
-        purchase_price = item.purchase_price or 0
-        current_price = item.current_price or 0
+# --- Inline-кнопки списков: навигация и выбор предмета ---
 
-        total_purchase_price += purchase_price
-        total_current_price += current_price
+@access_checker
+def items_callback_handler(call: CallbackQuery, bot: telebot.TeleBot):
+    """
+    Обрабатывает нажатия inline-кнопок: листает страницу (редактирует то же сообщение)
+    или начинает редактирование/удаление выбранного предмета.
+    """
+    data = parse_items_callback(call.data)
+    outbox.answer_callback_query(call.message.chat.id, call.id)
+    if not data:
+        return
 
-        absolute_profit, percent_profit = item.calculate_profit()
+    if data['action'] == CallbackActions.PAGE:
+        rendered = render_items_page(call.from_user.id, data['view'], data['direction'], data['page_number'], data['cursor'])
+        text, markup = rendered or ("Список предметов пуст.", None)
+        # Повторное нажатие (страница не изменилась) очередь считает успешной правкой
+        outbox.edit_message_text(call.message.chat.id, call.message.message_id, text, reply_markup=markup)
+        return
 
-        sign = "🟢" if absolute_profit >= 0 else "🔴"
-        
-        report_parts.append(
-            f"\n<b>{item.title}</b>\n"
-            f"  - Цена покупки: ${purchase_price:.2f}\n"
-            f"  - Текущая цена: ${current_price:.2f}\n"
-            f"  - Прибыль: {sign} ${absolute_profit:.2f} ({percent_profit:.2f}%)"
+    # Кнопка могла прийти с чужим ID предмета - выбирать можно только свои предметы
+    item = get_own_item(data['item_id'], call.from_user.id)
+    if not item:
+        outbox.send_message(call.message.chat.id, "❌ Предмет не найден. Возможно, он уже удален.", reply_markup=main_menu_keyboard())
+        return
+
+    if data['view'] == ListViews.EDIT:
+        outbox.send_message(
+            call.message.chat.id,
+            f"Введите новую закупочную цену для '{item['title']}':",
+            reply_markup=cancel_keyboard()
         )
-    
-    # Расчет общей прибыли
-    total_profit = total_current_price - total_purchase_price
-    total_profit_percent = (total_profit / total_purchase_price * 100) if total_purchase_price > 0 else 0
-    total_sign = "🟢" if total_profit >= 0 else "🔴"
-
-    # Итоговая сводка
-    summary = (
-        f"\n\n\n<b>📈 Итого:</b>\n"
-        f"  - Общая сумма закупки: ${total_purchase_price:.2f}\n"
-        f"  - Общая текущая стоимость: ${total_current_price:.2f}\n"
-        f"  - <b>Общая прибыль: {total_sign} ${total_profit:.2f} ({total_profit_percent:.2f}%)</b>"
-    )
-    report_parts.append(summary)
-
-    # Отправляем отчет
-    # Разделяем на части, если он слишком длинный
-    full_report = "\n".join(report_parts)
-    if len(full_report) > 4096:
-        for i in range(0, len(full_report), 4096):
-            bot.send_message(message.chat.id, full_report[i:i + 4096])
-    else:
-        bot.send_message(message.chat.id, full_report)
+        bot.register_next_step_handler(call.message, process_new_price_step, bot, item['id'])
+    elif data['view'] == ListViews.DELETE:
+        # Запрашиваем подтверждение
+        outbox.send_message(
+            call.message.chat.id,
+            f"Вы уверены, что хотите удалить '{item['title']}'?",
+            reply_markup=confirm_delete_keyboard()
+        )
+        bot.register_next_step_handler(call.message, confirm_delete_step, bot, item['id'], item['title'])
+    elif data['view'] == ListViews.ALERTS:
+        outbox.send_message(call.message.chat.id, alerts_prompt(item), reply_markup=cancel_keyboard())
+        bot.register_next_step_handler(call.message, process_alert_step, bot, item['id'])
+
+
+# --- Логика уведомлений о цене ---
+
+@access_checker
+def alerts_start(message: Message, bot: telebot.TeleBot):
+    """
+    Начало сценария настройки уведомлений.
+    Показывает первую страницу списка предметов с inline-кнопками выбора.
+    """
+    bot.clear_step_handler_by_chat_id(chat_id=message.chat.id)
+    send_items_page(message, bot, ListViews.ALERTS, "У вас пока нет предметов для уведомлений.")
+
+
+def process_alert_step(message: Message, bot: telebot.TeleBot, item_id: int):
+    """
+    Сохраняет правило уведомления для выбранного предмета.
+    """
+    if message.text == ActionCommands.CANCEL:
+        return cancel_handler(message, bot)
+
+    reply = apply_alert_rule(item_id, message.from_user.id, message.text) if message.text else None
+    if reply is None:
+        outbox.send_message(message.chat.id, "Не понял правило. Пример: >25, <10, +20%, -10% или ~5%", reply_markup=cancel_keyboard())
+        bot.register_next_step_handler(message, process_alert_step, bot, item_id)
+        return
+    outbox.send_message(message.chat.id, reply, reply_markup=main_menu_keyboard())
 
 
 # --- Логика добавления предмета ---
@@ -327,7 +517,7 @@ def add_item_start(message: Message, bot: telebot.TeleBot):
     Начало сценария добавления предмета.
     Запрашивает у пользователя URL.
     """
-    bot.send_message(
+    outbox.send_message(
         message.chat.id, 
         "Пожалуйста, отправь мне ссылку на предмет:", 
         reply_markup=cancel_keyboard()
@@ -343,17 +533,17 @@ def process_url_step(message: Message, bot: telebot.TeleBot):
         return cancel_handler(message, bot)
 
     if not message.text:
-        bot.send_message(message.chat.id, "Пожалуйста, отправь ссылку в виде текстового сообщения.", reply_markup=cancel_keyboard())
+        outbox.send_message(message.chat.id, "Пожалуйста, отправь ссылку в виде текстового сообщения.", reply_markup=cancel_keyboard())
         bot.register_next_step_handler(message, process_url_step, bot)
         return
 
     url = message.text
     if not config.is_valid_url(url):
-        bot.send_message(message.chat.id, "Этот домен не поддерживается. Пожалуйста, отправь ссылку с одного из разрешенных доменов.", reply_markup=cancel_keyboard())
+        outbox.send_message(message.chat.id, "Этот домен не поддерживается. Пожалуйста, отправь ссылку с одного из разрешенных доменов.", reply_markup=cancel_keyboard())
         bot.register_next_step_handler(message, process_url_step, bot)
         return
         
-    bot.send_message(
+    outbox.send_message(
         message.chat.id, 
         "Отлично! Теперь введи цену закупки (например: 15.55):",
         reply_markup=cancel_keyboard()
@@ -363,47 +553,29 @@ def process_url_step(message: Message, bot: telebot.TeleBot):
 
 def process_price_step(message: Message, bot: telebot.TeleBot, url: str):
     """
-    Обрабатывает цену закупки, парсит данные и сохраняет предмет в БД.
+    Обрабатывает цену закупки и ставит добавление предмета в фоновую очередь
+    (загрузка страницы не задерживает ответы на другие команды).
     """
     if message.text == ActionCommands.CANCEL:
         return cancel_handler(message, bot)
 
     if not message.text:
-        bot.send_message(message.chat.id, "Пожалуйста, отправь цену в виде текстового сообщения.", reply_markup=cancel_keyboard())
+        outbox.send_message(message.chat.id, "Пожалуйста, отправь цену в виде текстового сообщения.", reply_markup=cancel_keyboard())
         bot.register_next_step_handler(message, process_price_step, bot, url)
         return
 
-    try:
-        purchase_price = float(message.text.replace(',', '.'))
-    except (ValueError, TypeError):
-        bot.send_message(message.chat.id, "Неверный формат цены. Попробуй еще раз, например: 15.55", reply_markup=cancel_keyboard())
+    purchase_price = parse_price_text(message.text)
+    if purchase_price is None:
+        outbox.send_message(message.chat.id, "Неверный формат цены. Попробуй еще раз, например: 15.55", reply_markup=cancel_keyboard())
         bot.register_next_step_handler(message, process_price_step, bot, url)
         return
 
-    bot.send_message(message.chat.id, "⏳ Начинаю обработку, это может занять некоторое время...", reply_markup=main_menu_keyboard())
+    outbox.send_message(message.chat.id, "👌 Принято! Предмет добавляется в фоне, ход выполнения - в следующем сообщении.", reply_markup=main_menu_keyboard())
 
     try:
-        # Используем парсер как контекстный менеджер
-        with CSMarketParser() as parser:
-            item_data = parser.parse_item_page(url)
-
-        if not item_data or not item_data.get('title'):
-            bot.send_message(message.chat.id, "Не удалось получить данные о предмете. Проверь ссылку и попробуй снова.")
-            return
-
-        # 1. Добавляем предмет в БД (с ценой закупки 0)
-        db.add_item(item_data)
-        
-        # 2. Устанавливаем цену закупки (и пересчитываем прибыль)
-        db.set_purchase_price(url, purchase_price)
-
-        bot.send_message(
-            message.chat.id,
-            f"✅ Предмет '{item_data['title']}' успешно добавлен с ценой закупки ${purchase_price:.2f}."
-        )
-
+        add_jobs.submit(message.chat.id, url, purchase_price, message.from_user.id)
     except Exception as e:
-        bot.send_message(
+        outbox.send_message(
             message.chat.id,
             f"Произошла ошибка при обработке: {e}. Попробуй еще раз."
         )
@@ -414,7 +586,7 @@ def cancel_handler(message: Message, bot: telebot.TeleBot):
     Обрабатывает команду отмены, сбрасывает состояние и возвращает в главное меню.
     """
     bot.clear_step_handler_by_chat_id(chat_id=message.chat.id)
-    bot.send_message(
+    outbox.send_message(
         message.chat.id, 
         "Действие отменено.", 
         reply_markup=main_menu_keyboard()
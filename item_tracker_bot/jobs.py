@@ -0,0 +1,197 @@
+# -*- coding: utf-8 -*-
+"""
+Фоновая очередь добавления предметов.
+
+Обработчик только сохраняет задание и сразу отвечает пользователю; загрузка
+страницы и сохранение предмета выполняются в отдельных потоках. Ход задания
+показывается в одном сообщении, которое правится по мере выполнения
+("в очереди", "загружаю", "сохранено"). Задания хранятся в базе (таблица
+add_jobs), поэтому после перезапуска незавершенные задания продолжаются.
+"""
+import html
+import logging
+import queue
+import threading
+import time
+from typing import Any, Callable, Dict, Optional
+
+from db.connector import CSMarketDatabase
+from item_tracker_bot.outbox import OutboundDispatcher
+
+
+class AddItemJobs:
+    """Очередь заданий на добавление предметов с отображением хода выполнения"""
+
+    def __init__(self, db: CSMarketDatabase, outbox: OutboundDispatcher,
+                 fetch: Callable[[str], Optional[dict]], save: Callable[[dict, str, float, int], None],
+                 workers: int = 1, max_attempts: int = 2, retry_delay: float = 15):
+        """
+        Args:
+            db (CSMarketDatabase): Коннектор к базе данных (задания хранятся в db.jobs).
+            outbox (OutboundDispatcher): Очередь исходящих сообщений.
+            fetch: Загрузка данных предмета по URL (блокирующая).
+            save: Сохранение предмета: save(item_data, url, purchase_price, user_id).
+            workers (int): Сколько заданий выполняется одновременно.
+            max_attempts (int): Сколько раз пробовать загрузить страницу.
+            retry_delay (float): Пауза перед повтором загрузки (сек), удваивается с каждой попыткой.
+        """
+        self.db = db
+        self.store = db.jobs
+        self.outbox = outbox
+        self.fetch = fetch
+        self.save = save
+        self.workers = max(1, workers)
+        self.max_attempts = max(1, max_attempts)
+        self.retry_delay = retry_delay
+        self._queue: 'queue.Queue[int]' = queue.Queue()
+        self._lock = threading.RLock()
+        self._threads = []
+        # ID сообщений с ходом заданий; функция-резолвер одна на задание, чтобы правки склеивались.
+        # Записи удаляются, когда доставлена последняя правка задания
+        self._message_ids: Dict[int, Optional[int]] = {}
+        self._resolvers: Dict[int, Callable[[], Optional[int]]] = {}
+
+    def start(self):
+        """Продолжает незавершенные задания и запускает потоки (повторный вызов ничего не делает)"""
+        with self._lock:
+            if self._threads:
+                return
+            for job in self.store.unfinished():
+                self._message_ids[job['id']] = job['message_id']
+                self._progress(job, "⏳ Задание восстановлено после перезапуска, жду очереди...")
+                self._schedule(job['id'], job['not_before'])
+                logging.info(f"Задание на добавление {job['id']} восстановлено: {job['url']}")
+            for number in range(self.workers):
+                thread = threading.Thread(target=self._run, name=f"add-jobs-{number}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def submit(self, chat_id: int, url: str, purchase_price: float, user_id: Optional[int] = None) -> int:
+        """
+        Сохраняет задание, отправляет сообщение о постановке в очередь и возвращается сразу.
+
+        Args:
+            user_id: Владелец предмета (None - совпадает с chat_id).
+
+        Returns:
+            ID задания.
+        """
+        # Потоки (и восстановление старых заданий) запускаются до сохранения нового задания
+        self.start()
+        job_id = self.store.enqueue(chat_id, url, purchase_price, user_id)
+        with self._lock:
+            self._message_ids[job_id] = None
+        position = self._queue.qsize() + 1
+        self.outbox.send_message(
+            chat_id,
+            f"🕒 Предмет поставлен в очередь на добавление (позиция {position}). Можно продолжать пользоваться ботом.",
+            on_sent=lambda sent: self._remember_message(job_id, sent),
+        )
+        self._queue.put(job_id)
+        return job_id
+
+    def _remember_message(self, job_id: int, sent: Any):
+        message_id = getattr(sent, 'message_id', None)
+        if message_id is None:
+            return
+        with self._lock:
+            self._message_ids[job_id] = message_id
+        self.store.set_message_id(job_id, message_id)
+
+    def _resolver(self, job_id: int) -> Callable[[], Optional[int]]:
+        with self._lock:
+            if job_id not in self._resolvers:
+                self._resolvers[job_id] = lambda: self._message_ids.get(job_id)
+            return self._resolvers[job_id]
+
+    def _progress(self, job: Dict[str, Any], text: str, final: bool = False):
+        """
+        Показывает ход задания в его сообщении
+
+        Args:
+            final: Последняя правка задания - после ее доставки задание забывается
+        """
+        def on_sent(sent):
+            self._remember_message(job['id'], sent)
+            if final:
+                self._forget(job['id'])
+
+        self.outbox.edit_message_text(job['chat_id'], self._resolver(job['id']), text, on_sent=on_sent)
+
+    def _forget(self, job_id: int):
+        # Вызывается после доставки последней правки: больше правок этого задания не будет
+        with self._lock:
+            self._resolvers.pop(job_id, None)
+            self._message_ids.pop(job_id, None)
+
+    def _schedule(self, job_id: int, not_before: Optional[float]):
+        """Ставит задание в очередь потоков сразу или по истечении паузы перед повтором"""
+        delay = (not_before or 0) - time.time()
+        if delay <= 0:
+            self._queue.put(job_id)
+            return
+        timer = threading.Timer(delay, self._queue.put, args=(job_id,))
+        timer.daemon = True
+        timer.start()
+
+    def _run(self):
+        while True:
+            job_id = self._queue.get()
+            try:
+                self._process(job_id)
+            except Exception as e:
+                logging.error(f"Ошибка в задании на добавление {job_id}: {e}")
+            finally:
+                self._queue.task_done()
+
+    def _process(self, job_id: int):
+        job = self.store.get(job_id)
+        if job is None or job['status'] not in (self.store.QUEUED, self.store.FETCHING):
+            return
+        attempt = self.store.mark_started(job_id)
+        self._progress(job, "🔎 Загружаю данные предмета..." + (f" (попытка {attempt})" if attempt > 1 else ""))
+
+        try:
+            item_data = self.fetch(job['url'])
+            if not item_data or not item_data.get('title'):
+                raise ValueError("не удалось получить данные о предмете")
+        except Exception as e:
+            retry = attempt < self.max_attempts
+            delay = self.retry_delay * 2 ** (attempt - 1)
+            not_before = self.store.mark_failed(job_id, str(e), retry=retry, delay=delay)
+            if retry:
+                self._progress(job, f"⚠️ Не удалось загрузить страницу, попробую еще раз через {delay:.0f} сек...")
+                self._schedule(job_id, not_before)
+            else:
+                self._progress(job, "❌ Не удалось получить данные о предмете. Проверь ссылку и попробуй снова.",
+                               final=True)
+            logging.warning(f"Задание на добавление {job_id}, попытка {attempt}: {e}")
+            return
+
+        try:
+            owner = job['chat_id'] if job['user_id'] is None else job['user_id']
+            self.save(item_data, job['url'], job['purchase_price'], owner)
+            item = self.db.get_item_by_url(job['url'], owner)
+            self.store.mark_done(job_id, item['id'] if item else None)
+        except Exception as e:
+            self.store.mark_failed(job_id, str(e), retry=False)
+            self._progress(job, f"❌ Ошибка при сохранении предмета: {html.escape(str(e))}", final=True)
+            return
+
+        price = item.get('current_price') if item else None
+        self._progress(
+            job,
+            f"✅ Предмет '{html.escape(item_data['title'])}' сохранен: цена закупки ${job['purchase_price']:.2f}"
+            + (f", текущая цена ${price:.2f}." if price is not None else "."),
+            final=True
+        )
+        logging.info(f"Задание на добавление {job_id} выполнено за {time.time() - job['created_at']:.1f} сек")
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Метрики очереди
+
+        Returns:
+            {'depth', 'queued', 'fetching', 'done', 'failed', 'latency_avg', 'latency_p95'}
+        """
+        return {'depth': self._queue.qsize(), **self.store.stats()}
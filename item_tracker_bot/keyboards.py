@@ -2,8 +2,8 @@
 """
 Модуль для создания клавиатур телеграм-бота.
 """
-from telebot.types import ReplyKeyboardMarkup, KeyboardButton
-from item_tracker_bot.constants import MainMenuCommands, ActionCommands
+from telebot.types import ReplyKeyboardMarkup, KeyboardButton, InlineKeyboardMarkup, InlineKeyboardButton
+from item_tracker_bot.constants import MainMenuCommands, ActionCommands, CallbackActions
 
 
 def main_menu_keyboard() -> ReplyKeyboardMarkup:
@@ -18,9 +18,11 @@ def main_menu_keyboard() -> ReplyKeyboardMarkup:
     remove_item_btn = KeyboardButton(MainMenuCommands.REMOVE_ITEM)
     stats_btn = KeyboardButton(MainMenuCommands.GET_STATS)
     edit_price_btn = KeyboardButton(MainMenuCommands.EDIT_PRICE)
+    alerts_btn = KeyboardButton(MainMenuCommands.ALERTS)
     
     markup.add(add_item_btn, remove_item_btn)
     markup.add(stats_btn, edit_price_btn)
+    markup.add(alerts_btn)
     
     return markup
 
@@ -38,28 +40,43 @@ def cancel_keyboard() -> ReplyKeyboardMarkup:
     return markup
 
 
-def numeric_keyboard(count: int) -> ReplyKeyboardMarkup:
+def items_page_keyboard(view: str, page: dict, page_number: int, selectable: bool = False) -> InlineKeyboardMarkup:
     """
-    Создает клавиатуру с цифрами от 1 до `count` и кнопкой 'Отмена'.
+    Создает inline-клавиатуру страницы списка предметов.
     
     Args:
-        count (int): Максимальное число для кнопок.
+        view (str): Код списка (ListViews).
+        page (dict): Страница из CSMarketDatabase.get_items_page.
+        page_number (int): Номер текущей страницы (с 1).
+        selectable (bool): Добавить кнопку выбора для каждого предмета.
         
     Returns:
-        ReplyKeyboardMarkup: Объект клавиатуры.
+        InlineKeyboardMarkup: Объект клавиатуры.
     """
-    markup = ReplyKeyboardMarkup(resize_keyboard=True, one_time_keyboard=False)
-    
-    # Ограничиваем количество кнопок, чтобы не перегружать клавиатуру
-    limit = min(count, 10)
-    buttons = [KeyboardButton(str(i)) for i in range(1, limit + 1)]
+    markup = InlineKeyboardMarkup()
+    items = page['items']
     
-    # Расставляем кнопки по 5 в ряд
-    for i in range(0, len(buttons), 5):
-        markup.add(*buttons[i:i+5])
+    if selectable:
+        for item in items:
+            title = item['title'] if len(item['title']) <= 40 else item['title'][:37] + '...'
+            markup.add(InlineKeyboardButton(title, callback_data=f"{CallbackActions.SELECT.value}|{view}|{item['id']}"))
     
-    # Добавляем кнопку отмены в самый низ
-    markup.add(KeyboardButton(ActionCommands.CANCEL))
+    # Кнопки навигации несут ключ (updated_at, id) крайнего предмета страницы
+    nav = []
+    if items and page['has_prev']:
+        first = items[0]
+        nav.append(InlineKeyboardButton(
+            "◀️ Назад",
+            callback_data=f"{CallbackActions.PAGE.value}|{view}|p|{page_number - 1}|{first['updated_at']}|{first['id']}"
+        ))
+    if items and page['has_next']:
+        last = items[-1]
+        nav.append(InlineKeyboardButton(
+            "Вперед ▶️",
+            callback_data=f"{CallbackActions.PAGE.value}|{view}|n|{page_number + 1}|{last['updated_at']}|{last['id']}"
+        ))
+    if nav:
+        markup.row(*nav)
     return markup
 
 
@@ -0,0 +1,474 @@
+# -*- coding: utf-8 -*-
+"""
+Очередь исходящих сообщений Telegram.
+
+Обработчики и фоновое обновление не вызывают send_message напрямую, а ставят
+сообщение в очередь и сразу продолжают работу. Отдельный поток отправляет
+сообщения с учетом ограничений Telegram: общее ведро токенов на бота и свое
+ведро на каждый чат. Ответ 429 откладывает чат на retry_after секунд, сетевые
+ошибки и 5xx повторяются с экспоненциальной паузой и случайным разбросом.
+Несколько ожидающих сообщений в один чат с одинаковыми параметрами
+склеиваются в одно (не длиннее лимита Telegram), а несколько ожидающих правок
+одного сообщения - в последнюю. Ответы на нажатия inline-кнопок отправляются
+раньше сообщений и расходуют только общее ведро.
+"""
+import logging
+import random
+import threading
+import time
+from collections import OrderedDict, deque
+from typing import Any, Callable, Deque, Dict, List, Optional, Union
+
+import requests
+import telebot
+from telebot.apihelper import ApiHTTPException, ApiTelegramException
+
+from parser.rate_limiter import TokenBucket
+from config import config
+from metrics import counter, histogram
+
+# Максимальная длина текста одного сообщения Telegram
+MESSAGE_LIMIT = 4096
+# Как часто забывать простаивающие чаты (сек)
+PRUNE_INTERVAL = 60
+
+# Запросы к Bot API (method: send, edit или answer); error - код ответа Telegram, http или network
+TELEGRAM_SEND_SECONDS = histogram('tracker_telegram_send_seconds', 'Время запроса к Bot API (сек)', ['method'])
+TELEGRAM_ERRORS = counter('tracker_telegram_errors', 'Ошибки запросов к Bot API', ['method', 'error'])
+
+
+def split_text(text: str, limit: int = MESSAGE_LIMIT) -> List[str]:
+    """
+    Делит длинный текст на части не длиннее limit, по возможности по границам строк.
+
+    Args:
+        text (str): Текст сообщения.
+        limit (int): Максимальная длина части.
+
+    Returns:
+        list: Части текста по порядку.
+    """
+    if len(text) <= limit:
+        return [text]
+    chunks = []
+    current = ''
+    for line in text.split('\n'):
+        # Слишком длинная строка режется как есть
+        while len(line) > limit:
+            if current:
+                chunks.append(current)
+                current = ''
+            chunks.append(line[:limit])
+            line = line[limit:]
+        candidate = f"{current}\n{line}" if current else line
+        if len(candidate) > limit:
+            chunks.append(current)
+            current = line
+        else:
+            current = candidate
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+def _merge_key(kwargs: Dict[str, Any]) -> tuple:
+    """Параметры, которые должны совпадать, чтобы сообщения можно было склеить"""
+    key = []
+    for name, value in sorted(kwargs.items()):
+        if hasattr(value, 'to_json'):
+            value = value.to_json()
+        key.append((name, repr(value)))
+    return tuple(key)
+
+
+class _Outgoing:
+    """Сообщение (правка сообщения или ответ на нажатие кнопки) в очереди"""
+    __slots__ = ('chat_id', 'text', 'kwargs', 'key', 'enqueued_at', 'attempts', 'parts', 'message_id', 'on_sent',
+                 'callback_query_id')
+
+    def __init__(self, chat_id: int, text: str, kwargs: Dict[str, Any], message_id=None,
+                 on_sent: Optional[Callable] = None, callback_query_id: Optional[str] = None):
+        self.chat_id = chat_id
+        self.text = text
+        self.kwargs = kwargs
+        # Сообщения с обратным вызовом не склеиваются: вызов относится к конкретному сообщению
+        self.key = None if on_sent else _merge_key(kwargs)
+        self.enqueued_at = time.monotonic()
+        self.attempts = 0
+        self.parts = 1
+        # Для правки: ID сообщения или функция, возвращающая его в момент отправки
+        self.message_id = message_id
+        self.on_sent = on_sent
+        # Для ответа на нажатие inline-кнопки: ID запроса
+        self.callback_query_id = callback_query_id
+
+    @property
+    def is_edit(self) -> bool:
+        return self.message_id is not None
+
+    @property
+    def is_answer(self) -> bool:
+        return self.callback_query_id is not None
+
+    @property
+    def method(self) -> str:
+        return 'answer' if self.is_answer else 'edit' if self.is_edit else 'send'
+
+
+class _ChatQueue:
+    """Ожидающие сообщения одного чата и его ограничение частоты"""
+    __slots__ = ('pending', 'bucket', 'ready_at')
+
+    def __init__(self, rate: float, burst: float):
+        self.pending: Deque[_Outgoing] = deque()
+        self.bucket = TokenBucket(rate, burst)
+        # До этого момента (monotonic) чат не трогаем: retry_after или пауза перед повтором
+        self.ready_at = 0.0
+
+
+class OutboundDispatcher:
+    """
+    Отправляет сообщения из очереди в отдельном потоке.
+
+    Порядок сообщений внутри одного чата сохраняется; между чатами первым
+    отправляется сообщение, ждущее дольше всех, если его чат не ограничен.
+    """
+
+    def __init__(self, sender, global_rate: float = 25, chat_rate: float = 1, chat_burst: float = 3,
+                 max_retries: int = 5, retry_base: float = 1.0, retry_cap: float = 60.0,
+                 limit: int = MESSAGE_LIMIT):
+        """
+        Args:
+            sender: Объект с методом send_message(chat_id, text, **kwargs) (telebot.TeleBot).
+            global_rate (float): Сообщений в секунду на весь бот.
+            chat_rate (float): Сообщений в секунду в один чат.
+            chat_burst (float): Допустимый всплеск сообщений в один чат.
+            max_retries (int): Сколько раз повторять при сетевых ошибках и 5xx.
+            retry_base (float): Начальная пауза перед повтором (сек), растет вдвое.
+            retry_cap (float): Максимальная пауза перед повтором (сек).
+            limit (int): Максимальная длина текста одного сообщения.
+        """
+        self.sender = sender
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.max_retries = max_retries
+        self.retry_base = retry_base
+        self.retry_cap = retry_cap
+        self.limit = limit
+        self._global = TokenBucket(global_rate, max(1, global_rate))
+        self._cond = threading.Condition()
+        self._chats: 'OrderedDict[int, _ChatQueue]' = OrderedDict()
+        # Ответы на нажатия inline-кнопок: без ограничения чата, раньше сообщений
+        self._answers: Deque[_Outgoing] = deque()
+        self._in_flight = 0
+        self._thread: Optional[threading.Thread] = None
+        self._stopping = False
+        self._pruned_at = time.monotonic()
+        # Метрики
+        self._enqueued = 0
+        self._sent = 0
+        self._merged = 0
+        self._retries = 0
+        self._rate_limited = 0
+        self._dropped = 0
+        self._latencies: Deque[float] = deque(maxlen=1000)
+
+    def start(self):
+        """Запускает поток отправки (вызывается автоматически при первой постановке в очередь)"""
+        with self._cond:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._stopping = False
+            self._thread = threading.Thread(target=self._run, name="outbox", daemon=True)
+            self._thread.start()
+
+    def _chat_queue(self, chat_id: int) -> _ChatQueue:
+        # Вызывается под self._cond
+        queue = self._chats.get(chat_id)
+        if queue is None:
+            queue = self._chats[chat_id] = _ChatQueue(self.chat_rate, self.chat_burst)
+        return queue
+
+    def send_message(self, chat_id: int, text: str, on_sent: Optional[Callable] = None, **kwargs):
+        """
+        Ставит сообщение в очередь (не блокирует и не бросает ошибок Telegram).
+        Длинный текст делится на части; параметры те же, что у TeleBot.send_message.
+
+        Args:
+            on_sent: Вызывается с отправленным Message (для длинного текста - с последней частью).
+        """
+        chunks = split_text(text, self.limit)
+        with self._cond:
+            queue = self._chat_queue(chat_id)
+            for number, chunk in enumerate(chunks, 1):
+                message = _Outgoing(chat_id, chunk, kwargs, on_sent=on_sent if number == len(chunks) else None)
+                self._enqueued += 1
+                last = queue.pending[-1] if queue.pending else None
+                # Склеиваем с последним ожидающим сообщением, если параметры совпадают и лимит позволяет
+                if (last is not None and not last.is_edit and message.key is not None and last.key == message.key
+                        and len(last.text) + 2 + len(chunk) <= self.limit):
+                    last.text = f"{last.text}\n\n{chunk}"
+                    last.parts += 1
+                    self._merged += 1
+                    continue
+                queue.pending.append(message)
+            self._cond.notify()
+        self.start()
+
+    def edit_message_text(self, chat_id: int, message_id: Union[int, Callable[[], Optional[int]]], text: str,
+                          on_sent: Optional[Callable] = None, **kwargs):
+        """
+        Ставит в очередь правку текста сообщения (в порядке остальных сообщений чата).
+
+        Args:
+            message_id: ID сообщения или функция, возвращающая его в момент отправки
+                (так можно править сообщение, которое само еще ждет в очереди).
+                Если ID нет, текст отправляется новым сообщением.
+            on_sent: Вызывается с результатом (Message), в том числе для нового сообщения.
+        """
+        text = text[:self.limit]
+        with self._cond:
+            queue = self._chat_queue(chat_id)
+            self._enqueued += 1
+            last = queue.pending[-1] if queue.pending else None
+            # Несколько ожидающих правок одного сообщения: важна только последняя
+            if last is not None and last.is_edit and last.message_id == message_id and last.key == _merge_key(kwargs):
+                last.text = text
+                last.on_sent = on_sent or last.on_sent
+                self._merged += 1
+            else:
+                message = _Outgoing(chat_id, text, kwargs, message_id=message_id, on_sent=on_sent)
+                message.key = _merge_key(kwargs)
+                queue.pending.append(message)
+            self._cond.notify()
+        self.start()
+
+    def answer_callback_query(self, chat_id: int, callback_query_id: str, **kwargs):
+        """
+        Ставит в очередь ответ на нажатие inline-кнопки (параметры те же, что у
+        TeleBot.answer_callback_query). Ответы идут раньше сообщений и не повторяются
+        при ошибке: Telegram принимает ответ только вскоре после нажатия.
+        """
+        with self._cond:
+            self._enqueued += 1
+            self._answers.append(_Outgoing(chat_id, '', kwargs, callback_query_id=callback_query_id))
+            self._cond.notify()
+        self.start()
+
+    def _next_message(self) -> Optional[_Outgoing]:
+        """Выбирает сообщение, которое можно отправить сейчас (вызывается под self._cond)"""
+        if self._answers:
+            return self._answers.popleft()
+        now = time.monotonic()
+        candidates = sorted(
+            (queue for queue in self._chats.values() if queue.pending and queue.ready_at <= now),
+            key=lambda queue: queue.pending[0].enqueued_at,
+        )
+        for queue in candidates:
+            if queue.bucket.try_acquire():
+                return queue.pending.popleft()
+        return None
+
+    def _next_wait(self) -> Optional[float]:
+        """
+        Через сколько секунд освободится ограничение хотя бы одного чата с сообщениями
+        (вызывается под self._cond; None - очередь пуста)
+        """
+        now = time.monotonic()
+        waits = [max(queue.ready_at - now, queue.bucket.wait_time()) for queue in self._chats.values() if queue.pending]
+        if not waits or min(waits) == float('inf'):
+            return None
+        return max(0.001, min(waits))
+
+    def _prune_chats(self):
+        """
+        Забывает чаты без сообщений, у которых восстановился запас и нет паузы
+        (новое ведро для такого чата ничем не отличается). Вызывается под self._cond.
+        """
+        now = time.monotonic()
+        if now - self._pruned_at < PRUNE_INTERVAL:
+            return
+        self._pruned_at = now
+        for chat_id in [chat_id for chat_id, queue in self._chats.items()
+                        if not queue.pending and queue.ready_at <= now and queue.bucket.is_full()]:
+            del self._chats[chat_id]
+
+    def _run(self):
+        while True:
+            with self._cond:
+                message = self._next_message()
+                while message is None:
+                    if self._stopping:
+                        return
+                    self._prune_chats()
+                    # Ждем новых сообщений (notify) или освобождения ограничения ближайшего чата
+                    self._cond.wait(timeout=self._next_wait())
+                    message = self._next_message()
+                self._in_flight += 1
+            try:
+                self._global.acquire()
+                self._deliver(message)
+            finally:
+                with self._cond:
+                    self._in_flight -= 1
+                    self._cond.notify_all()
+
+    def _retry_later(self, message: _Outgoing, delay: float):
+        with self._cond:
+            queue = self._chat_queue(message.chat_id)
+            queue.pending.appendleft(message)
+            queue.ready_at = max(queue.ready_at, time.monotonic() + delay)
+
+    def _deliver(self, message: _Outgoing):
+        """Отправляет одно сообщение и решает, что делать при ошибке"""
+        method = message.method
+        try:
+            with TELEGRAM_SEND_SECONDS.time(method=method):
+                result = self._send(message)
+        except ApiTelegramException as e:
+            if message.is_edit and 'message is not modified' in e.description:
+                # Текст уже такой (повторное нажатие кнопки) - правка не нужна, это успех
+                self._delivered(message, None)
+                return
+            TELEGRAM_ERRORS.inc(method=method, error=str(e.error_code))
+            if message.is_answer:
+                self._drop(message, e)
+            elif e.error_code == 429:
+                # Telegram сам говорит, сколько ждать; повтор не расходует попытки
+                retry_after = (e.result_json.get('parameters') or {}).get('retry_after', 1)
+                with self._cond:
+                    self._rate_limited += 1
+                logging.warning(f"Telegram ограничил отправку в чат {message.chat_id}, повтор через {retry_after} сек")
+                self._retry_later(message, retry_after)
+            elif e.error_code >= 500:
+                self._retry_or_drop(message, e)
+            else:
+                # 400/403 и т.п.: повтор не поможет
+                self._drop(message, e)
+        except (ApiHTTPException, requests.RequestException) as e:
+            TELEGRAM_ERRORS.inc(method=method, error='http' if isinstance(e, ApiHTTPException) else 'network')
+            if message.is_answer:
+                self._drop(message, e)
+            else:
+                self._retry_or_drop(message, e)
+        except Exception as e:
+            TELEGRAM_ERRORS.inc(method=method, error=type(e).__name__)
+            self._drop(message, e)
+        else:
+            self._delivered(message, result)
+
+    def _delivered(self, message: _Outgoing, result: Any):
+        with self._cond:
+            self._sent += 1
+            self._latencies.append(time.monotonic() - message.enqueued_at)
+        if message.on_sent is not None:
+            try:
+                message.on_sent(result)
+            except Exception as e:
+                logging.error(f"Ошибка в обработчике отправки сообщения: {e}")
+
+    def _send(self, message: _Outgoing):
+        if message.is_answer:
+            return self.sender.answer_callback_query(message.callback_query_id, **message.kwargs)
+        if not message.is_edit:
+            return self.sender.send_message(message.chat_id, message.text, **message.kwargs)
+        message_id = message.message_id() if callable(message.message_id) else message.message_id
+        if message_id is None:
+            # Исходное сообщение так и не было отправлено - показываем текст новым сообщением
+            return self.sender.send_message(message.chat_id, message.text, **message.kwargs)
+        return self.sender.edit_message_text(message.text, message.chat_id, message_id, **message.kwargs)
+
+    def _retry_or_drop(self, message: _Outgoing, error: Exception):
+        message.attempts += 1
+        if message.attempts > self.max_retries:
+            self._drop(message, error)
+            return
+        # Экспоненциальная пауза со случайным разбросом, чтобы повторы не совпадали
+        delay = min(self.retry_cap, self.retry_base * 2 ** (message.attempts - 1)) * random.uniform(0.5, 1.5)
+        with self._cond:
+            self._retries += 1
+        logging.warning(f"Ошибка отправки в чат {message.chat_id} (попытка {message.attempts}): {error}. "
+                        f"Повтор через {delay:.1f} сек")
+        self._retry_later(message, delay)
+
+    def _drop(self, message: _Outgoing, error: Exception):
+        with self._cond:
+            self._dropped += 1
+        logging.error(f"Сообщение в чат {message.chat_id} не отправлено: {error}")
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """
+        Ждет, пока очередь опустеет.
+
+        Returns:
+            True, если все сообщения обработаны до истечения timeout.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            while self._in_flight or self._answers or any(queue.pending for queue in self._chats.values()):
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._cond.wait(timeout=0.1 if remaining is None else min(remaining, 0.1))
+        return True
+
+    def stop(self, timeout: float = 10.0):
+        """Отправляет оставшиеся сообщения (не дольше timeout) и останавливает поток"""
+        self.flush(timeout)
+        with self._cond:
+            self._stopping = True
+            self._cond.notify_all()
+        if self._thread is not None:
+            self._thread.join(timeout=1)
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Метрики очереди
+
+        Returns:
+            {'depth', 'oldest_wait', 'enqueued', 'sent', 'merged', 'retries', 'rate_limited', 'dropped',
+            'latency_avg', 'latency_p95', 'latency_max'} (время в секундах)
+        """
+        with self._cond:
+            now = time.monotonic()
+            heads = [queue.pending[0].enqueued_at for queue in self._chats.values() if queue.pending]
+            latencies = sorted(self._latencies)
+            return {
+                'depth': len(self._answers) + sum(len(queue.pending) for queue in self._chats.values()),
+                'oldest_wait': round(now - min(heads), 3) if heads else 0.0,
+                'enqueued': self._enqueued,
+                'sent': self._sent,
+                'merged': self._merged,
+                'retries': self._retries,
+                'rate_limited': self._rate_limited,
+                'dropped': self._dropped,
+                'latency_avg': round(sum(latencies) / len(latencies), 3) if latencies else 0.0,
+                'latency_p95': round(latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))], 3) if latencies else 0.0,
+                'latency_max': round(latencies[-1], 3) if latencies else 0.0,
+            }
+
+
+_shared_outbox: Optional[OutboundDispatcher] = None
+_shared_lock = threading.Lock()
+
+
+def get_outbox() -> OutboundDispatcher:
+    """
+    Возвращает общую для процесса очередь исходящих сообщений, создавая ее при первом вызове.
+    Отправка идет через собственный синхронный TeleBot, поэтому очередь одинаково
+    работает в режимах threaded и asyncio.
+    """
+    global _shared_outbox
+    with _shared_lock:
+        if _shared_outbox is None:
+            sender = telebot.TeleBot(config.BOT_TOKEN, parse_mode="HTML", threaded=False)
+            _shared_outbox = OutboundDispatcher(
+                sender,
+                global_rate=config.OUTBOX_GLOBAL_RATE,
+                chat_rate=config.OUTBOX_CHAT_RATE,
+                chat_burst=config.OUTBOX_CHAT_BURST,
+                max_retries=config.OUTBOX_MAX_RETRIES,
+            )
+            logging.info(f"Очередь исходящих сообщений: {config.OUTBOX_GLOBAL_RATE} сообщений/сек, "
+                         f"{config.OUTBOX_CHAT_RATE} в чат")
+        return _shared_outbox
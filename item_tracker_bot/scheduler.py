@@ -0,0 +1,244 @@
+# -*- coding: utf-8 -*-
+"""
+Адаптивное расписание обновления цен.
+
+У каждого предмета свой интервал проверки и время следующей проверки
+(next_check_at, хранится в таблице refresh_schedule). Предметы, цена которых
+меняется, которые недавно смотрели или цена которых близка к порогу
+уведомления, проверяются чаще; стабильные постепенно откладываются до
+потолка. Общий бюджет запросов в час ограничивает число проверок.
+"""
+import heapq
+import logging
+import threading
+import time
+from typing import Callable, Dict, List, Optional
+
+from db.connector import CSMarketDatabase
+from parser.rate_limiter import TokenBucket
+from config import config
+
+
+class RefreshScheduler:
+    """Очередь с приоритетом по времени следующей проверки и общий бюджет запросов."""
+
+    def __init__(self, db: CSMarketDatabase, requests_per_hour: int, base_interval: int,
+                 min_interval: int, max_interval: int, backoff: float = 1.5, view_interval: int = 1800):
+        """
+        Args:
+            db (CSMarketDatabase): Коннектор к базе данных.
+            requests_per_hour (int): Глобальный бюджет проверок в час.
+            base_interval (int): Интервал для новых предметов (сек).
+            min_interval (int): Нижняя граница интервала (сек).
+            max_interval (int): Потолок интервала для стабильных предметов (сек).
+            backoff (float): Во сколько раз растет интервал, если цена не изменилась.
+            view_interval (int): Не позже чем через сколько секунд проверить просмотренный предмет.
+        """
+        self.db = db
+        self.base_interval = base_interval
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.backoff = backoff
+        self.view_interval = view_interval
+        # Бюджет: пополнение requests_per_hour в час, запас - на 10 минут
+        self.budget = TokenBucket(requests_per_hour / 3600, max(1, requests_per_hour / 6))
+        # Оценка близости цены к порогу уведомления: 0 - на пороге, 1 - далеко (None - порогов нет)
+        self.proximity: Optional[Callable[[int, float], Optional[float]]] = None
+        self._lock = threading.Lock()
+        self._heap: list = []
+        self._schedule: Dict[int, Dict[str, Optional[int]]] = {}
+        # Запись каталога каждого предмета: позиции одной страницы рынка тратят бюджет один раз
+        self._pages: Dict[int, Optional[int]] = {}
+        self._portfolio_version = None
+        self._loaded = False
+
+    def _load(self):
+        # Вызывается под self._lock
+        self._schedule = self.db.get_refresh_schedule()
+        self._heap = [(entry['next_check_at'], item_id) for item_id, entry in self._schedule.items()]
+        heapq.heapify(self._heap)
+        self._loaded = True
+
+    def _push(self, item_id: int, next_check_at: int):
+        # Вызывается под self._lock; старые записи в куче пропускаются при извлечении
+        self._schedule[item_id]['next_check_at'] = next_check_at
+        heapq.heappush(self._heap, (next_check_at, item_id))
+
+    def sync(self, now: Optional[int] = None) -> List[int]:
+        """
+        Сверяет расписание с портфелем, удаленные предметы забываются. Выполняется
+        только при изменении версии портфеля. Предметы без расписания при первой
+        сверке ставятся в очередь сразу; добавленные позже только что загружены
+        заданием добавления и проверяются через base_interval.
+
+        Returns:
+            ID предметов, добавленных в расписание.
+        """
+        now = int(time.time()) if now is None else now
+        snapshot = self.db.portfolio_snapshot()
+        added = []
+        with self._lock:
+            if not self._loaded:
+                self._load()
+            if snapshot.version == self._portfolio_version:
+                return added
+            next_check_at = now if self._portfolio_version is None else now + self.base_interval
+            self._pages = {item['id']: item.get('catalog_id') for item in snapshot.items}
+            ids = self._pages.keys()
+            for item_id in list(self._schedule):
+                if item_id not in ids:
+                    del self._schedule[item_id]
+            for item_id in ids - self._schedule.keys():
+                self._schedule[item_id] = {'next_check_at': next_check_at, 'check_interval': self.base_interval, 'last_change_at': None}
+                heapq.heappush(self._heap, (next_check_at, item_id))
+                added.append(item_id)
+            self._portfolio_version = snapshot.version
+        if added:
+            self.db.save_refresh_schedule([self._entry(item_id) for item_id in added])
+        return added
+
+    def _entry(self, item_id: int) -> tuple:
+        entry = self._schedule[item_id]
+        return item_id, entry['next_check_at'], entry['check_interval'], entry['last_change_at']
+
+    def next_batch(self, now: Optional[int] = None) -> List[int]:
+        """
+        Забирает из очереди предметы, срок проверки которых наступил, пока позволяет бюджет.
+        Бюджет расходуется на страницы рынка: позиции с той же записью каталога, что и уже
+        взятый предмет, загружаются вместе с ним и бюджет не тратят.
+
+        Returns:
+            ID предметов для проверки (сначала самые просроченные).
+        """
+        now = int(time.time()) if now is None else now
+        self.sync(now)
+        due = []
+        pages = set()
+        with self._lock:
+            while self._heap and self._heap[0][0] <= now:
+                next_check_at, item_id = self._heap[0]
+                entry = self._schedule.get(item_id)
+                if entry is None or entry['next_check_at'] != next_check_at:
+                    heapq.heappop(self._heap)
+                    continue
+                page = self._pages.get(item_id)
+                if (page is None or page not in pages) and not self.budget.try_acquire():
+                    break
+                heapq.heappop(self._heap)
+                due.append(item_id)
+                if page is not None:
+                    pages.add(page)
+        return due
+
+    def requeue(self, item_ids: List[int], now: Optional[int] = None):
+        """
+        Возвращает в очередь предметы, взятые next_batch, если цикл обновления
+        не завершился (иначе у них не осталось бы записи в куче до перезапуска).
+        Повторная попытка ограничена общим бюджетом запросов.
+        """
+        now = int(time.time()) if now is None else now
+        with self._lock:
+            for item_id in item_ids:
+                if item_id in self._schedule:
+                    self._push(item_id, now)
+
+    def record_results(self, results: List[dict], now: Optional[int] = None):
+        """
+        Пересчитывает интервалы после проверки и сохраняет расписание.
+
+        Args:
+            results (list): {'id', 'ok', 'old_price', 'new_price'} для каждого проверенного предмета.
+        """
+        now = int(time.time()) if now is None else now
+        updated = []
+        with self._lock:
+            for result in results:
+                entry = self._schedule.get(result['id'])
+                if entry is None:
+                    continue
+                interval = entry['check_interval']
+                old_price, new_price = result.get('old_price'), result.get('new_price')
+                if result.get('ok') and old_price and new_price is not None and new_price != old_price:
+                    # Цена меняется - проверяем чаще; при сильном скачке - с минимальным интервалом
+                    change = abs(new_price - old_price) / old_price
+                    interval = self.min_interval if change >= 0.05 else interval // 2
+                    entry['last_change_at'] = now
+                else:
+                    # Цена стабильна (или загрузка не удалась) - отодвигаем проверку
+                    interval = int(interval * self.backoff)
+                interval = max(self.min_interval, min(self.max_interval, interval))
+
+                # Цена близко к порогу уведомления - не ждем дольше двух минимальных интервалов
+                if self.proximity and new_price is not None:
+                    distance = self.proximity(result['id'], new_price)
+                    if distance is not None and distance < 0.05:
+                        interval = min(interval, self.min_interval * 2)
+
+                entry['check_interval'] = interval
+                self._push(result['id'], now + interval)
+                updated.append(self._entry(result['id']))
+        self.db.save_refresh_schedule(updated)
+
+    def record_views(self, item_ids: List[int], now: Optional[int] = None):
+        """Пользователь смотрел предметы: проверить их не позже чем через view_interval."""
+        now = int(time.time()) if now is None else now
+        with self._lock:
+            for item_id in item_ids:
+                entry = self._schedule.get(item_id)
+                if entry is not None and entry['next_check_at'] > now + self.view_interval:
+                    self._push(item_id, now + self.view_interval)
+
+    def seconds_until_due(self, now: Optional[float] = None) -> Optional[float]:
+        """
+        Через сколько секунд наступит ближайшая проверка (None - очередь пуста).
+        Если бюджет исчерпан, проверка наступает не раньше пополнения токена:
+        next_batch до этого ничего не вернет.
+        """
+        now = time.time() if now is None else now
+        with self._lock:
+            while self._heap:
+                next_check_at, item_id = self._heap[0]
+                entry = self._schedule.get(item_id)
+                if entry is None or entry['next_check_at'] != next_check_at:
+                    heapq.heappop(self._heap)
+                    continue
+                return max(0.0, next_check_at - now, self.budget.wait_time())
+        return None
+
+    def stats(self) -> Dict[str, float]:
+        """Размер расписания и распределение интервалов."""
+        with self._lock:
+            intervals = sorted(entry['check_interval'] for entry in self._schedule.values())
+        if not intervals:
+            return {'items': 0}
+        return {
+            'items': len(intervals),
+            'min_interval_min': round(intervals[0] / 60, 1),
+            'median_interval_min': round(intervals[len(intervals) // 2] / 60, 1),
+            'max_interval_min': round(intervals[-1] / 60, 1),
+        }
+
+
+_shared_scheduler: Optional[RefreshScheduler] = None
+_shared_lock = threading.Lock()
+
+
+def get_refresh_scheduler(db: CSMarketDatabase) -> RefreshScheduler:
+    """
+    Возвращает общий для процесса планировщик (обработчики отмечают просмотры,
+    фоновое обновление берет из него предметы), создавая его при первом вызове.
+    """
+    global _shared_scheduler
+    with _shared_lock:
+        if _shared_scheduler is None:
+            _shared_scheduler = RefreshScheduler(
+                db,
+                requests_per_hour=config.REFRESH_REQUESTS_PER_HOUR,
+                base_interval=int(config.REFRESH_BASE_INTERVAL_HOURS * 3600),
+                min_interval=int(config.REFRESH_MIN_INTERVAL_MINUTES * 60),
+                max_interval=int(config.REFRESH_MAX_INTERVAL_HOURS * 3600),
+                backoff=config.REFRESH_BACKOFF,
+                view_interval=int(config.REFRESH_VIEW_INTERVAL_MINUTES * 60),
+            )
+            logging.info(f"Планировщик обновления: бюджет {config.REFRESH_REQUESTS_PER_HOUR} запросов/час")
+        return _shared_scheduler
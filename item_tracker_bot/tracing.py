@@ -0,0 +1,301 @@
+# -*- coding: utf-8 -*-
+"""
+Трассировка циклов обновления.
+
+По каждой загруженной странице пишется запись с этапами (ожидание потока,
+ограничитель частоты, вкладка браузера, загрузка, ожидание готовности,
+извлечение, запись в базу), их длительностью и исходом; в конце цикла -
+сводка с этапами цикла, суммарным временем по этапам и списками самых
+медленных и неудачных предметов. Записи - JSON-строки в каталоге TRACE_DIR.
+
+Файлы каталога:
+    traces.jsonl                        - текущий файл
+    traces-<время>.jsonl.gz             - ротированный (по размеру или смене суток)
+    traces-<время>.cycles.jsonl.gz      - свернутый до сводок циклов (старше TRACE_RAW_DAYS)
+Файлы старше TRACE_KEEP_DAYS удаляются.
+"""
+import gzip
+import itertools
+import json
+import logging
+import os
+import threading
+import time
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+from datetime import date
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+ACTIVE_FILE = 'traces.jsonl'
+ROTATED_SUFFIX = '.jsonl.gz'
+COMPACTED_SUFFIX = '.cycles.jsonl.gz'
+
+# Исходы загрузки страницы
+CHANGED = 'changed'
+UNCHANGED = 'unchanged'
+NO_DATA = 'no_data'          # парсер не получил название
+ERROR = 'error'              # исключение при загрузке
+WRITE_ERROR = 'write_error'  # данные получены, но не сохранены
+FAILED_OUTCOMES = (NO_DATA, ERROR, WRITE_ERROR)
+
+_cycle_numbers = itertools.count(1)
+
+
+def _ms(seconds: float) -> float:
+    return round(seconds * 1000, 1)
+
+
+class CycleTrace:
+    """Этапы одного цикла обновления и загрузки каждой его страницы"""
+
+    def __init__(self, slowest: int = 10):
+        """
+        Args:
+            slowest: Сколько самых медленных предметов включать в сводку
+        """
+        self.cycle_id = f"{time.strftime('%Y%m%d-%H%M%S')}-{next(_cycle_numbers)}"
+        self.started_at = time.time()
+        self.slowest = slowest
+        self._started = time.perf_counter()
+        self._lock = threading.Lock()
+        self.items: Dict[Any, Dict[str, Any]] = {}
+        self.spans: List[Dict[str, Any]] = []
+
+    def item(self, key, item_data: dict, positions: int = 1) -> Dict[str, Any]:
+        """
+        Создает запись загрузки страницы (заполняется рабочим потоком и циклом)
+
+        Args:
+            key: Ключ записи каталога
+            item_data: Позиция, по адресу которой загружается страница
+            positions: Сколько позиций получают результат этой загрузки
+        """
+        record = {
+            'type': 'item', 'cycle': self.cycle_id, 'item_id': item_data['id'], 'url': item_data['url'],
+            'title': item_data.get('title'), 'positions': positions,
+            'outcome': None, 'path': None, 'ms': None, 'spans': [],
+            '_submitted': time.perf_counter(),
+        }
+        with self._lock:
+            self.items[key] = record
+        return record
+
+    @staticmethod
+    def start_item(record: Dict[str, Any]) -> None:
+        """Отмечает начало загрузки в рабочем потоке (время в очереди пула - этап queue)"""
+        record['_started'] = time.perf_counter()
+        record['spans'].append({'name': 'queue', 'ms': _ms(record['_started'] - record['_submitted'])})
+
+    @staticmethod
+    def finish_item(record: Dict[str, Any], spans: List[Dict[str, Any]], path: Optional[str]) -> None:
+        """Сохраняет этапы парсера и общее время загрузки"""
+        record['spans'].extend(spans)
+        record['path'] = path
+        record['ms'] = _ms(time.perf_counter() - record['_started'])
+
+    @contextmanager
+    def span(self, name: str, **fields):
+        """Замеряет этап цикла (загрузка страниц, запись, уведомления, сжатие истории)"""
+        span = {'name': name, **fields}
+        started = time.perf_counter()
+        try:
+            yield span
+        finally:
+            span['ms'] = _ms(time.perf_counter() - started)
+            self.spans.append(span)
+
+    def finish(self, stats: dict) -> Dict[str, Any]:
+        """
+        Формирует сводку цикла
+
+        Args:
+            stats: Статистика run_update_cycle (позиции, страницы, исходы)
+
+        Returns:
+            dict: Запись сводки ('type': 'cycle')
+        """
+        items = list(self.items.values())
+        stage_totals = defaultdict(float)
+        paths = Counter()
+        readiness = Counter()
+        for record in items:
+            paths[record['path'] or 'none'] += 1
+            for span in record['spans']:
+                if not span.get('shared'):
+                    stage_totals[span['name']] += span['ms']
+                if span['name'] == 'ready_wait' and span.get('outcome'):
+                    readiness[span['outcome']] += 1
+
+        def brief(record):
+            fetch_spans = [span for span in record['spans'] if not span.get('shared')]
+            worst = max(fetch_spans, key=lambda span: span['ms'], default=None)
+            entry = {'item_id': record['item_id'], 'url': record['url'], 'title': record['title'],
+                     'outcome': record['outcome'], 'ms': record['ms']}
+            if worst:
+                entry['slowest_span'] = worst['name']
+                entry['slowest_span_ms'] = worst['ms']
+            errors = [span['error'] for span in record['spans'] if span.get('error')]
+            if record.get('error') or errors:
+                entry['error'] = record.get('error') or errors[-1]
+            return entry
+
+        timed = [record for record in items if record['ms'] is not None]
+        timed.sort(key=lambda record: record['ms'], reverse=True)
+        return {
+            'type': 'cycle', 'cycle': self.cycle_id,
+            'started_at': round(self.started_at, 3),
+            'ms': _ms(time.perf_counter() - self._started),
+            'items': stats.get('items'), 'pages': stats.get('pages'),
+            'changed': stats.get('changed'), 'unchanged': stats.get('unchanged'), 'failed': stats.get('failed'),
+            'spans': self.spans,
+            'stage_totals_ms': {name: round(total, 1) for name, total in sorted(stage_totals.items())},
+            'paths': dict(paths),
+            'readiness': dict(readiness),
+            'slowest': [brief(record) for record in timed[:self.slowest]],
+            'failing': [brief(record) for record in items if record['outcome'] in FAILED_OUTCOMES],
+        }
+
+    def records(self, summary: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """Записи для файла трасс: страницы цикла, затем сводка"""
+        return [{key: value for key, value in record.items() if not key.startswith('_')}
+                for record in self.items.values()] + [summary]
+
+
+def format_summary(summary: Dict[str, Any], limit: int = 5) -> str:
+    """Строка лога со сводкой цикла: где ушло время, самые медленные и неудачные предметы"""
+    stages = ', '.join(f"{name} {total / 1000:.1f}" for name, total in
+                       sorted(summary['stage_totals_ms'].items(), key=lambda pair: pair[1], reverse=True))
+    cycle_spans = ', '.join(f"{span['name']} {span['ms'] / 1000:.1f}" for span in summary['spans'])
+    parts = [f"Трасса цикла {summary['cycle']}: этапы цикла (сек) [{cycle_spans}], "
+             f"суммарно по страницам (сек) [{stages}]"]
+    if summary['slowest']:
+        parts.append("самые медленные: " + '; '.join(
+            f"{entry['title'] or entry['url']} {entry['ms'] / 1000:.1f} сек"
+            f" ({entry.get('slowest_span')} {entry.get('slowest_span_ms', 0) / 1000:.1f})"
+            for entry in summary['slowest'][:limit]
+        ))
+    if summary['failing']:
+        parts.append(f"неудачные ({len(summary['failing'])}): " + '; '.join(
+            f"{entry['title'] or entry['url']} - {entry['outcome']}"
+            + (f" ({entry['error']})" if entry.get('error') else '')
+            for entry in summary['failing'][:limit]
+        ))
+    return '; '.join(parts)
+
+
+class TraceLog:
+    """Файлы трасс с ротацией по размеру и суткам и сворачиванием старых файлов"""
+
+    def __init__(self, directory: str, max_bytes: int = 20 * 1024 * 1024, raw_days: int = 3, keep_days: int = 30):
+        """
+        Args:
+            directory: Каталог трасс (создается при первой записи)
+            max_bytes: Размер текущего файла, после которого он ротируется
+            raw_days: Сколько дней хранить полные трассы (затем остаются только сводки циклов)
+            keep_days: Сколько дней хранить трассы вообще
+        """
+        self.directory = Path(directory)
+        self.max_bytes = max_bytes
+        self.raw_days = raw_days
+        self.keep_days = keep_days
+        self._lock = threading.Lock()
+        self._compacted_on: Optional[date] = None
+
+    @property
+    def active_path(self) -> Path:
+        return self.directory / ACTIVE_FILE
+
+    def write(self, records: List[Dict[str, Any]]) -> None:
+        """Дописывает записи в текущий файл (при необходимости сначала ротирует его)"""
+        lines = ''.join(json.dumps(record, ensure_ascii=False, default=str) + '\n' for record in records)
+        with self._lock:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            if self._needs_rotation():
+                self._rotate()
+            with open(self.active_path, 'a', encoding='utf-8') as f:
+                f.write(lines)
+            # Старые файлы проверяются раз в сутки (и при первой записи после запуска)
+            if self._compacted_on != date.today():
+                self._compact()
+                self._compacted_on = date.today()
+
+    def _needs_rotation(self) -> bool:
+        try:
+            stat = self.active_path.stat()
+        except FileNotFoundError:
+            return False
+        return stat.st_size >= self.max_bytes or date.fromtimestamp(stat.st_mtime) != date.today()
+
+    def _rotate(self) -> Path:
+        """Сжимает текущий файл в traces-<время последней записи>.jsonl.gz"""
+        mtime = self.active_path.stat().st_mtime
+        stem = f"traces-{time.strftime('%Y%m%d-%H%M%S', time.localtime(mtime))}"
+        target = self.directory / (stem + ROTATED_SUFFIX)
+        for number in itertools.count(1):
+            if not target.exists():
+                break
+            target = self.directory / f"{stem}-{number}{ROTATED_SUFFIX}"
+        with open(self.active_path, 'rb') as source, gzip.open(target, 'wb') as destination:
+            for chunk in iter(lambda: source.read(1024 * 1024), b''):
+                destination.write(chunk)
+        # Возраст файла считается по последней записи, а не по времени ротации
+        os.utime(target, (mtime, mtime))
+        self.active_path.unlink()
+        return target
+
+    def _compact(self, now: Optional[float] = None) -> Dict[str, int]:
+        """
+        Сворачивает ротированные файлы старше raw_days до сводок циклов и удаляет файлы старше keep_days
+
+        Returns:
+            dict: {'compacted': свернуто файлов, 'removed': удалено файлов}
+        """
+        now = now or time.time()
+        result = {'compacted': 0, 'removed': 0}
+        for path in sorted(self.directory.glob('traces-*.gz')):
+            try:
+                mtime = path.stat().st_mtime
+                age_days = (now - mtime) / 86400
+                if age_days > self.keep_days:
+                    path.unlink()
+                    result['removed'] += 1
+                elif age_days > self.raw_days and not path.name.endswith(COMPACTED_SUFFIX):
+                    target = path.with_name(path.name[:-len(ROTATED_SUFFIX)] + COMPACTED_SUFFIX)
+                    with gzip.open(path, 'rt', encoding='utf-8') as source, \
+                            gzip.open(target, 'wt', encoding='utf-8') as destination:
+                        for line in source:
+                            if line.strip() and json.loads(line).get('type') == 'cycle':
+                                destination.write(line)
+                    os.utime(target, (mtime, mtime))
+                    path.unlink()
+                    result['compacted'] += 1
+            except (OSError, EOFError, ValueError) as e:
+                logging.error(f"Не удалось обработать файл трассы {path}: {e}")
+        if any(result.values()):
+            logging.info(f"Трассы циклов: {result}")
+        return result
+
+    def compact(self, now: Optional[float] = None) -> Dict[str, int]:
+        """Сворачивает и удаляет старые файлы трасс (обычно вызывается из write раз в сутки)"""
+        with self._lock:
+            if not self.directory.exists():
+                return {'compacted': 0, 'removed': 0}
+            return self._compact(now)
+
+
+_shared_trace_log: Optional[TraceLog] = None
+_shared_lock = threading.Lock()
+
+
+def get_trace_log(directory: str, max_bytes: int = 20 * 1024 * 1024, raw_days: int = 3,
+                  keep_days: int = 30) -> TraceLog:
+    """
+    Возвращает общий для процесса журнал трасс, создавая его при первом вызове.
+    Параметры учитываются только при создании.
+    """
+    global _shared_trace_log
+    with _shared_lock:
+        if _shared_trace_log is None:
+            _shared_trace_log = TraceLog(directory, max_bytes, raw_days, keep_days)
+        return _shared_trace_log
@@ -0,0 +1,40 @@
+# -*- coding: utf-8 -*-
+"""
+Источник страниц для парсера: рынок и браузер, запись ответов в кассету или
+воспроизведение кассеты (config.PARSER_TRANSPORT).
+"""
+import logging
+from typing import Any, Optional, Tuple
+
+from parser.browser_pool import get_browser_pool
+from parser.http_fetcher import get_http_fetcher
+from parser.replay import CassetteWriter, RecordingFetcher, get_cassette_writer, get_replay_transport
+from config import config
+
+
+def get_parser_transport() -> Tuple[Any, Any, Optional[CassetteWriter]]:
+    """
+    Возвращает общие для процесса пул вкладок, HTTP-клиент и кассету записи
+    (обработчики и фоновое обновление получают одни и те же экземпляры).
+
+    Returns:
+        (пул браузеров, HTTP-клиент, кассета для отрендеренных страниц или None)
+    """
+    if config.PARSER_TRANSPORT == 'replay':
+        replay = get_replay_transport(
+            config.PARSER_CASSETTE, config.REPLAY_LATENCY_MS, config.REPLAY_JITTER_MS,
+            config.REPLAY_ERROR_RATE, config.REPLAY_SEED,
+            tabs=config.BROWSER_POOL_SIZE * config.BROWSER_TABS_PER_BROWSER
+        )
+        logging.info(f"Страницы воспроизводятся из кассеты {config.PARSER_CASSETTE}")
+        return replay.pool, replay, None
+
+    browser_pool = get_browser_pool(
+        config.BROWSER_POOL_SIZE, config.BROWSER_TABS_PER_BROWSER, config.BROWSER_ACQUIRE_TIMEOUT
+    )
+    http_fetcher = get_http_fetcher(config.HTTP_TIMEOUT, config.HTTP_POOL_SIZE)
+    if config.PARSER_TRANSPORT == 'record':
+        recorder = get_cassette_writer(config.PARSER_CASSETTE)
+        logging.info(f"Ответы рынка записываются в кассету {config.PARSER_CASSETTE}")
+        return browser_pool, RecordingFetcher(http_fetcher, recorder), recorder
+    return browser_pool, http_fetcher, None
@@ -3,98 +3,454 @@
 Модуль для периодического обновления данных о предметах и отправки отчетов.
 """
 import time
+import asyncio
 import logging
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Dict, Iterable, List, Optional
 import telebot
 
 from db.connector import CSMarketDatabase
-from db.models import Item
 from parser.parser import CSMarketParser
+from parser.http_fetcher import fetch_path_stats
+from parser.readiness import readiness_stats
+from parser.rate_limiter import get_rate_limiter
+from item_tracker_bot.executors import run_db, run_scrape
+from item_tracker_bot.scheduler import get_refresh_scheduler
+from item_tracker_bot.transport import get_parser_transport
+from item_tracker_bot.outbox import get_outbox
+from item_tracker_bot.alerts import get_alert_engine
+from item_tracker_bot import tracing
 from config import config
+from metrics import histogram
 
 # Инициализируем коннектор к базе данных
-db = CSMarketDatabase(db_path=config.DATABASE_PATH)
+db = CSMarketDatabase(db_path=config.DATABASE_PATH, busy_timeout_ms=config.DB_BUSY_TIMEOUT_MS,
+                      default_user_id=config.ADMIN_ID)
 
-def _generate_report() -> str:
+# Общий пул браузеров и HTTP-клиент (те же экземпляры использует сценарий добавления предмета)
+# либо воспроизведение кассеты вместо них (config.PARSER_TRANSPORT)
+browser_pool, http_fetcher, page_recorder = get_parser_transport()
+# Ограничитель частоты запросов: у каждого домена свой бюджет
+rate_limiter = get_rate_limiter(config.DOMAIN_RATE_LIMITS)
+# Расписание проверок (общее с обработчиками, которые отмечают просмотры)
+scheduler = get_refresh_scheduler(db)
+# Отчеты отправляются через общую очередь исходящих сообщений
+outbox = get_outbox()
+# Уведомления о цене проверяются сразу после сохранения каждого цикла;
+# предметы с ценой у порога планировщик проверяет чаще
+alert_engine = get_alert_engine(db)
+scheduler.proximity = alert_engine.proximity
+# Трассы циклов (этапы загрузки каждого предмета) в каталоге логов
+trace_log = tracing.get_trace_log(
+    config.TRACE_DIR, int(config.TRACE_MAX_MB * 1024 * 1024), config.TRACE_RAW_DAYS, config.TRACE_KEEP_DAYS
+) if config.TRACE_ENABLED else None
+
+# Метрики цикла обновления (отдаются по HTTP, см. metrics.py)
+UPDATE_CYCLE_SECONDS = histogram('tracker_update_cycle_seconds', 'Длительность цикла обновления (сек)',
+                                 buckets=(1, 5, 10, 30, 60, 120, 300, 600, 1200, 3600))
+UPDATE_CYCLE_ITEMS = histogram('tracker_update_cycle_items', 'Позиций в цикле обновления',
+                               buckets=(1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000))
+UPDATE_CYCLE_SUCCESS_RATIO = histogram('tracker_update_cycle_success_ratio',
+                                       'Доля позиций цикла, получивших цену',
+                                       buckets=(0.5, 0.75, 0.9, 0.95, 0.99, 1))
+
+def _generate_report(user_id: int, items: List[dict]) -> str:
     """
-    Генерирует текстовый отчет на основе текущих данных из БД.
+    Генерирует текстовый отчет по портфелю пользователя.
+    Прибыль, итоги и рейтинги пользователя берутся из агрегатора портфеля (db.aggregator).
+    
+    Args:
+        user_id (int): Владелец портфеля.
+        items (list): Предметы пользователя из снимка портфеля.
     """
-    items_data = db.get_all_items()
-    if not items_data:
+    if not items:
         return ""
 
-    total_purchase_price = 0
-    total_current_price = 0
+    summary = db.portfolio_summary(user_id)
     report_parts = ["<b>📊 Сводка по прибыли:</b>\n"]
 
-    for item_data in items_data:
-        item = Item.from_dict(item_data)
-        purchase_price = item.purchase_price or 0
-        current_price = item.current_price or 0
-        total_purchase_price += purchase_price
-        total_current_price += current_price
-        absolute_profit, percent_profit = item.calculate_profit()
+    for item_data in items:
+        absolute_profit, percent_profit = db.aggregator.item_profit(item_data['id'])
         sign = "🟢" if absolute_profit >= 0 else "🔴"
         
         report_parts.append(
-            f"\n<b>{item.title}</b>: {sign} ${absolute_profit:.2f} ({percent_profit:.2f}%)"
+            f"\n<b>{item_data['title']}</b>: {sign} ${absolute_profit:.2f} ({percent_profit:.2f}%)"
         )
-    
-    total_profit = total_current_price - total_purchase_price
-    total_profit_percent = (total_profit / total_purchase_price * 100) if total_purchase_price > 0 else 0
-    total_sign = "🟢" if total_profit >= 0 else "🔴"
 
-    summary = (
-        f"\n\n<b>📈 Общая прибыль: {total_sign} ${total_profit:.2f} ({total_profit_percent:.2f}%)</b>"
+    movers = db.aggregator.rankings(user_id)['top_movers']
+    if movers:
+        report_parts.append("\n\n<b>🚀 Главные изменения цены:</b>")
+        for mover in movers:
+            report_parts.append(f"\n{mover['title']}: {mover['percent']:+.2f}%")
+    
+    total_sign = "🟢" if summary['total_profit'] >= 0 else "🔴"
+    summary_line = (
+        f"\n\n<b>📈 Общая прибыль: {total_sign} ${summary['total_profit']:.2f} "
+        f"({summary['total_profit_percent']:.2f}%)</b>"
     )
-    report_parts.append(summary)
+    report_parts.append(summary_line)
     
     return "\n".join(report_parts)
 
 
+def send_reports(user_ids: Iterable[int]) -> int:
+    """
+    Готовит отчеты пользователям и ставит их в очередь отправки.
+    Предметы группируются по владельцам за один проход по снимку портфеля, а
+    отчеты строятся в ограниченном пуле потоков (REPORT_WORKERS) - без
+    отдельных запросов к базе на каждого пользователя.
+    
+    Args:
+        user_ids: Пользователи, которым нужен отчет.
+        
+    Returns:
+        int: Сколько отчетов поставлено в очередь.
+    """
+    user_ids = set(user_ids)
+    if not user_ids:
+        return 0
+    items_by_user: Dict[int, List[dict]] = defaultdict(list)
+    for item_data in db.portfolio_snapshot().items:
+        if item_data['user_id'] in user_ids:
+            items_by_user[item_data['user_id']].append(item_data)
+    users = db.get_users(active_only=False)
+
+    def deliver(user_id: int) -> bool:
+        user = users.get(user_id)
+        if user is not None and not user['active']:
+            return False
+        report = _generate_report(user_id, items_by_user[user_id])
+        if not report:
+            return False
+        # Пользователь, еще не писавший боту (например, администратор после переноса), получает отчет в личный чат
+        outbox.send_message(user['chat_id'] if user else user_id, report, disable_notification=True)
+        return True
+
+    sent = 0
+    with ThreadPoolExecutor(max_workers=max(1, config.REPORT_WORKERS), thread_name_prefix="reports") as executor:
+        for future in as_completed([executor.submit(deliver, user_id) for user_id in items_by_user]):
+            try:
+                sent += future.result()
+            except Exception as e:
+                logging.error(f"Ошибка при подготовке отчета: {e}")
+    logging.info(f"Отчеты поставлены в очередь отправки: {sent} из {len(user_ids)} пользователей.")
+    return sent
+
+
+def _fetch_item(item_data: dict, trace_record: Optional[dict] = None) -> Optional[dict]:
+    """
+    Загружает страницу одного предмета. Выполняется в рабочем потоке цикла обновления.
+    
+    Args:
+        item_data (dict): Позиция, страницу которой нужно загрузить.
+        trace_record (dict): Запись трассы цикла, в которую сохраняются этапы загрузки.
+    """
+    if trace_record is not None:
+        tracing.CycleTrace.start_item(trace_record)
+    logging.info(f"Обновляю {item_data['title']}...")
+    with CSMarketParser(
+        wait_time=config.PARSER_WAIT_TIME, pool=browser_pool,
+        http_first=config.PARSER_HTTP_FIRST, http=http_fetcher,
+        rate_limiter=rate_limiter, extraction_mode=config.PARSER_EXTRACTION_MODE,
+        recorder=page_recorder
+    ) as parser:
+        try:
+            return parser.parse_item_page(item_data['url'])
+        finally:
+            if trace_record is not None:
+                tracing.CycleTrace.finish_item(trace_record, parser.last_spans, parser.last_path)
+
+
+# Время последнего применения политики хранения истории цен (time.monotonic)
+_last_history_compact: Optional[float] = None
+
+
+def _compact_history() -> None:
+    """
+    Сворачивает старую историю цен, но не чаще раза в PRICE_HISTORY_COMPACT_HOURS:
+    агрегаты часовые, поэтому запуск на каждом цикле только зря читал бы таблицы истории.
+    """
+    global _last_history_compact
+    if (_last_history_compact is not None
+            and time.monotonic() - _last_history_compact < config.PRICE_HISTORY_COMPACT_HOURS * 3600):
+        return
+    _last_history_compact = time.monotonic()
+    try:
+        compacted = db.history.compact(config.PRICE_HISTORY_RAW_DAYS, config.PRICE_HISTORY_HOURLY_DAYS)
+        if any(compacted.values()):
+            logging.info(f"История цен свернута: {compacted}")
+    except Exception as e:
+        logging.error(f"Ошибка при сжатии истории цен: {e}")
+
+
+_last_health_check: Optional[float] = None
+
+
+def _check_browsers() -> None:
+    """
+    Перезапускает упавшие браузеры, но не чаще раза в BROWSER_HEALTH_CHECK_SECONDS:
+    на время проверки свободные браузеры зарезервированы и не выдаются заданиям добавления.
+    """
+    global _last_health_check
+    if (_last_health_check is not None
+            and time.monotonic() - _last_health_check < config.BROWSER_HEALTH_CHECK_SECONDS):
+        return
+    _last_health_check = time.monotonic()
+    browser_pool.health_check()
+
+
+def _catalog_key(item_data: dict):
+    """Запись каталога, к которой относится позиция (позиция без записи загружается отдельно)."""
+    return item_data.get('catalog_id') or ('item', item_data['id'])
+
+
+def run_update_cycle(items_to_update: list) -> dict:
+    """
+    Загружает предметы параллельно (не более UPDATER_CONCURRENCY одновременно) и сохраняет результаты.
+    Частоту запросов к каждому домену ограничивает общий ограничитель.
+    
+    Страница рынка загружается один раз на запись каталога, даже если за предметом
+    следят несколько пользователей: цена сохраняется во все позиции этой записи
+    (в том числе в те, срок проверки которых еще не наступил).
+    
+    Args:
+        items_to_update (list): Предметы из БД, срок проверки которых наступил.
+        
+    Returns:
+        dict: Статистика цикла (позиции, загруженные страницы, изменившиеся/неизменные
+        позиции, время, количество запросов, ожидание ограничителя), 'results' -
+        {'id', 'user_id', 'ok', 'changed', 'old_price', 'new_price'} по каждой позиции
+        и 'trace' - сводка трассы цикла (см. tracing.CycleTrace.finish).
+        Неизменные предметы не перезаписываются, у них обновляется только отметка проверки.
+    """
+    started = time.monotonic()
+    trace = tracing.CycleTrace(config.TRACE_SLOWEST)
+    limiter_before = rate_limiter.stats()
+    failed = 0
+    parsed_results = []
+    parsed_items = []
+
+    # Одна загрузка на запись каталога; позиции каждой записи - за один проход по снимку
+    targets = {}
+    for item_data in items_to_update:
+        targets.setdefault(_catalog_key(item_data), item_data)
+    watchers = defaultdict(list)
+    for item_data in db.portfolio_snapshot().items:
+        if _catalog_key(item_data) in targets:
+            watchers[_catalog_key(item_data)].append(item_data)
+    positions = {key: watchers.get(key) or [item_data] for key, item_data in targets.items()}
+    results = {item_data['id']: {'id': item_data['id'], 'user_id': item_data['user_id'], 'ok': False, 'changed': False,
+                                 'old_price': item_data.get('current_price'), 'new_price': None}
+               for group in positions.values() for item_data in group}
+
+    item_traces = {key: trace.item(key, item_data, len(positions[key])) for key, item_data in targets.items()}
+
+    with trace.span('fetch', pages=len(targets), concurrency=config.UPDATER_CONCURRENCY), \
+            ThreadPoolExecutor(max_workers=max(1, config.UPDATER_CONCURRENCY), thread_name_prefix="updater") as executor:
+        futures = {executor.submit(_fetch_item, item_data, item_traces[key]): key for key, item_data in targets.items()}
+        for future in as_completed(futures):
+            key = futures[future]
+            item_data = targets[key]
+            try:
+                parsed_data = future.result()
+                if parsed_data and parsed_data.get('title'):
+                    # Цена сохраняется во все позиции записи каталога, каждая - своему владельцу
+                    for position in positions[key]:
+                        parsed_results.append({**parsed_data, 'url': position['url'], 'user_id': position['user_id']})
+                        parsed_items.append(position)
+                else:
+                    failed += len(positions[key])
+                    item_traces[key]['outcome'] = tracing.NO_DATA
+                    logging.warning(f"Не удалось получить данные для {item_data['url']}")
+            except Exception as e:
+                failed += len(positions[key])
+                item_traces[key].update(outcome=tracing.ERROR, error=f"{type(e).__name__}: {e}")
+                logging.error(f"Ошибка при обновлении предмета {item_data.get('title')}: {e}")
+
+    # Все результаты цикла сохраняются одной транзакцией; совпавшие с сохраненными
+    # значениями строки не перезаписываются и не пересчитывают итоги портфеля
+    with trace.span('write', rows=len(parsed_results)) as write_span:
+        outcomes = db.upsert_items(parsed_results)
+    changed = unchanged = 0
+    write_outcomes = defaultdict(set)
+    for item_data, outcome in zip(parsed_items, outcomes):
+        key = _catalog_key(item_data)
+        if outcome['outcome'] == db.UPSERT_ERROR:
+            failed += 1
+            write_outcomes[key].add(tracing.WRITE_ERROR)
+            logging.error(f"Не удалось сохранить {outcome['url']}: {outcome['error']}")
+            continue
+        is_changed = outcome['outcome'] != db.UPSERT_UNCHANGED
+        changed += is_changed
+        unchanged += not is_changed
+        write_outcomes[key].add(tracing.CHANGED if is_changed else tracing.UNCHANGED)
+        results[item_data['id']].update(ok=True, changed=is_changed, new_price=outcome['current_price'])
+    # Запись общая для всего цикла: у страницы отмечается время всей транзакции (shared) и исход ее позиций
+    for key, item_outcomes in write_outcomes.items():
+        outcome = next(o for o in (tracing.WRITE_ERROR, tracing.CHANGED, tracing.UNCHANGED) if o in item_outcomes)
+        item_traces[key]['outcome'] = outcome
+        item_traces[key]['spans'].append({'name': 'write', 'ms': write_span['ms'], 'shared': True, 'outcome': outcome})
+
+    # Уведомления проверяются по каждой изменившейся цене (не дожидаясь отчета)
+    with trace.span('alerts'):
+        try:
+            alert_engine.observe([(result['id'], result['old_price'], result['new_price'])
+                                  for result in results.values() if result['changed']])
+        except Exception as e:
+            logging.error(f"Ошибка при проверке уведомлений о цене: {e}")
+    with trace.span('history_compact'):
+        _compact_history()
+
+    wall_time = time.monotonic() - started
+    UPDATE_CYCLE_SECONDS.observe(wall_time)
+    UPDATE_CYCLE_ITEMS.observe(len(results))
+    if results:
+        UPDATE_CYCLE_SUCCESS_RATIO.observe((changed + unchanged) / len(results))
+    limiter_after = rate_limiter.stats()
+    requests_made = sum(v['requests'] for v in limiter_after.values()) - sum(v['requests'] for v in limiter_before.values())
+    limiter_wait = sum(v['waited'] for v in limiter_after.values()) - sum(v['waited'] for v in limiter_before.values())
+    stats = {
+        'items': len(results),
+        'pages': len(targets),
+        'changed': changed,
+        'unchanged': unchanged,
+        'failed': failed,
+        'wall_time': round(wall_time, 2),
+        'requests': requests_made,
+        'rps': round(requests_made / wall_time, 3) if wall_time > 0 else 0.0,
+        'limiter_wait': round(limiter_wait, 2),
+        'results': list(results.values()),
+    }
+    logging.info(
+        f"Цикл обновления: {len(results)} позиций, {len(targets)} страниц (изменились {changed}, без изменений {unchanged}, "
+        f"ошибок {failed}) за {stats['wall_time']} сек, "
+        f"{stats['rps']} запросов/сек, ожидание ограничителя {stats['limiter_wait']} сек"
+    )
+    stats['trace'] = trace.finish(stats)
+    logging.info(tracing.format_summary(stats['trace']))
+    if trace_log:
+        try:
+            trace_log.write(trace.records(stats['trace']))
+        except OSError as e:
+            logging.error(f"Не удалось записать трассу цикла: {e}")
+    return stats
+
+
+def run_scheduled_cycle() -> Optional[dict]:
+    """
+    Проверяет предметы, срок проверки которых наступил (в пределах бюджета запросов),
+    и пересчитывает их интервалы.
+    
+    Returns:
+        dict: Статистика цикла или None, если проверять нечего.
+    """
+    due_ids = set(scheduler.next_batch())
+    if not due_ids:
+        return None
+    items_to_update = [item for item in db.portfolio_snapshot().items if item['id'] in due_ids]
+    logging.info(f"Начинаю цикл обновления цен: {len(items_to_update)} предметов по расписанию...")
+    try:
+        stats = run_update_cycle(items_to_update)
+    except Exception:
+        # Предметы уже сняты с очереди - без возврата они не проверялись бы до перезапуска
+        scheduler.requeue(list(due_ids))
+        raise
+    scheduler.record_results(stats['results'])
+
+    logging.info(f"Обновление цен завершено. Пул браузеров: {browser_pool.stats()}")
+    logging.info(f"Время до готовности страниц: {readiness_stats.summary()}")
+    logging.info(f"Способы загрузки (http/browser/failed): {fetch_path_stats.summary()}")
+    logging.info(f"Соединения SQLite: {db.connection_stats()}, кэш портфеля: {db.cache_stats()}")
+    logging.info(f"Каталог предметов: {db.catalog.stats()}")
+    logging.info(f"Расписание: {scheduler.stats()}")
+    logging.info(f"Уведомления о цене: {alert_engine.stats()}")
+    logging.info(f"Очередь сообщений: {outbox.stats()}")
+    logging.info(f"Задания на добавление: {db.jobs.stats()}")
+    return stats
+
+
+def _seconds_until_next_cycle() -> float:
+    """Пауза до ближайшей проверки по расписанию (не дольше SCHEDULER_TICK_SECONDS)."""
+    until_due = scheduler.seconds_until_due()
+    if until_due is None:
+        return config.SCHEDULER_TICK_SECONDS
+    return max(1.0, min(until_due, config.SCHEDULER_TICK_SECONDS))
+
+
 def periodic_updater(bot: telebot.TeleBot, interval_hours: int):
     """
     Основная функция для фонового потока.
-    Обновляет данные и отправляет отчет.
+    Обновляет предметы по адаптивному расписанию и раз в interval_hours отправляет отчеты
+    (только тем пользователям, у которых с прошлого отчета цены действительно изменились).
     
     Args:
         bot (telebot.TeleBot): Экземпляр бота.
-        interval_hours (int): Интервал между обновлениями в часах.
+        interval_hours (int): Интервал между отчетами в часах.
     """
     logging.info("🚀 Фоновый обработчик запущен.")
+    try:
+        # Запускаем браузеры заранее, чтобы первое добавление предмета не ждало старта
+        browser_pool.warm_up()
+    except Exception as e:
+        logging.error(f"Не удалось прогреть пул браузеров: {e}")
+
+    last_report = None
+    # Пользователи, у которых изменились цены с прошлого отчета
+    updated_users = set()
     while True:
         try:
-            logging.info("Начинаю цикл обновления цен...")
-            items_to_update = db.get_all_items()
-
-            if not items_to_update:
-                logging.info("Нет предметов для обновления. Следующая проверка через 4 часа.")
-            else:
-                with CSMarketParser() as parser:
-                    for item_data in items_to_update:
-                        try:
-                            logging.info(f"Обновляю {item_data['title']}...")
-                            parsed_data = parser.parse_item_page(item_data['url'])
-                            if parsed_data and parsed_data.get('title'):
-                                db.upsert_item(parsed_data)
-                                time.sleep(5) # Небольшая задержка между запросами
-                            else:
-                                logging.warning(f"Не удалось получить данные для {item_data['url']}")
-                        except Exception as e:
-                            logging.error(f"Ошибка при обновлении предмета {item_data.get('title')}: {e}")
-                
-                logging.info("Обновление цен завершено. Генерирую отчет...")
-                report = _generate_report()
-                if report and config.ADMIN_ID:
-                    bot.send_message(
-                        config.ADMIN_ID,
-                        report,
-                        disable_notification=True
-                    )
-                    logging.info("Отчет отправлен.")
+            _check_browsers()
+            stats = run_scheduled_cycle()
+            if stats and stats['changed']:
+                updated_users.update(result['user_id'] for result in stats['results'] if result['changed'])
+
+            if updated_users and (last_report is None or time.monotonic() - last_report >= interval_hours * 3600):
+                logging.info(f"Генерирую отчеты для {len(updated_users)} пользователей...")
+                send_reports(updated_users)
+                last_report = time.monotonic()
+                updated_users = set()
 
         except Exception as e:
             logging.error(f"Критическая ошибка в фоновом обработчике: {e}")
 
-        # Пауза
-        logging.info(f"Следующее обновление через {interval_hours} час(а/ов).")
-        time.sleep(interval_hours * 60 * 60) 
\ No newline at end of file
+        # Пауза до ближайшей проверки по расписанию
+        time.sleep(_seconds_until_next_cycle())
+
+
+async def periodic_updater_async(bot, interval_hours: int):
+    """
+    Фоновая задача для режима asyncio.
+    Цикл обновления и подготовка отчетов выполняются в пулах потоков, отчеты
+    отправляются через общую очередь исходящих сообщений.
+    
+    Args:
+        bot (AsyncTeleBot): Экземпляр асинхронного бота.
+        interval_hours (int): Интервал между отчетами в часах.
+    """
+    logging.info("🚀 Фоновая задача обновления запущена (asyncio).")
+    try:
+        await run_scrape(browser_pool.warm_up)
+    except Exception as e:
+        logging.error(f"Не удалось прогреть пул браузеров: {e}")
+
+    last_report = None
+    updated_users = set()
+    while True:
+        try:
+            await run_scrape(_check_browsers)
+            stats = await run_scrape(run_scheduled_cycle)
+            if stats and stats['changed']:
+                updated_users.update(result['user_id'] for result in stats['results'] if result['changed'])
+
+            if updated_users and (last_report is None or time.monotonic() - last_report >= interval_hours * 3600):
+                await run_db(send_reports, updated_users)
+                last_report = time.monotonic()
+                updated_users = set()
+
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logging.error(f"Критическая ошибка в фоновой задаче: {e}")
+
+        await asyncio.sleep(_seconds_until_next_cycle())
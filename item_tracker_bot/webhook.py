@@ -0,0 +1,228 @@
+# -*- coding: utf-8 -*-
+"""
+Прием обновлений Telegram через webhook.
+
+Встроенный HTTP-сервер принимает POST от Telegram, проверяет секретный токен
+(заголовок X-Telegram-Bot-Api-Secret-Token) и передает обновление в
+ограниченный пул потоков. Обновления разных чатов обрабатываются параллельно,
+обновления одного чата - строго по очереди. Если очередь переполнена, сервер
+отвечает 503 и Telegram повторит доставку позже.
+"""
+import hmac
+import json
+import logging
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Deque, Dict, Optional
+
+from telebot.types import Update
+
+SECRET_HEADER = 'X-Telegram-Bot-Api-Secret-Token'
+
+
+def update_chat_id(update: Update) -> Optional[int]:
+    """Чат, к которому относится обновление (None - обновление без чата)"""
+    for message in (update.message, update.edited_message, update.channel_post, update.edited_channel_post):
+        if message is not None:
+            return message.chat.id
+    if update.callback_query is not None and update.callback_query.message is not None:
+        return update.callback_query.message.chat.id
+    return None
+
+
+class KeyedExecutor:
+    """
+    Пул потоков с последовательной обработкой задач одного ключа.
+
+    Для каждого ключа (чата) одновременно выполняется не больше одной задачи,
+    остальные ждут в его очереди; разные ключи занимают разные потоки пула.
+    Общее число ожидающих задач ограничено.
+    """
+
+    def __init__(self, workers: int, max_pending: int):
+        """
+        Args:
+            workers (int): Количество потоков.
+            max_pending (int): Сколько задач может ждать обработки (включая выполняемые).
+        """
+        self.max_pending = max_pending
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="webhook")
+        self._lock = threading.Lock()
+        self._queues: Dict[Any, Deque[Callable]] = {}
+        self._pending = 0
+
+    def submit(self, key: Any, task: Callable) -> bool:
+        """
+        Ставит задачу в очередь ключа.
+
+        Returns:
+            False, если очередь переполнена (задача не принята).
+        """
+        with self._lock:
+            if self._pending >= self.max_pending:
+                return False
+            self._pending += 1
+            queue = self._queues.get(key)
+            if queue is not None:
+                # Ключ уже обрабатывается - задача выполнится после предыдущих
+                queue.append(task)
+                return True
+            self._queues[key] = deque()
+        self._executor.submit(self._drain, key, task)
+        return True
+
+    def _drain(self, key: Any, task: Callable):
+        while task is not None:
+            try:
+                task()
+            except Exception as e:
+                logging.error(f"Ошибка при обработке обновления: {e}")
+            with self._lock:
+                self._pending -= 1
+                queue = self._queues[key]
+                if queue:
+                    task = queue.popleft()
+                else:
+                    del self._queues[key]
+                    task = None
+
+    @property
+    def pending(self) -> int:
+        with self._lock:
+            return self._pending
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+class WebhookServer:
+    """HTTP-сервер для приема обновлений Telegram"""
+
+    def __init__(self, process: Callable[[Update], None], listen: str, port: int, path: str,
+                 secret: Optional[str], workers: int = 4, max_pending: int = 1000):
+        """
+        Args:
+            process: Обработка одного обновления (например, lambda u: bot.process_new_updates([u])).
+            listen (str): Адрес, на котором слушать.
+            port (int): Порт (0 - любой свободный).
+            path (str): Путь, на который Telegram отправляет обновления.
+            secret (str): Секретный токен из setWebhook (None - без проверки).
+            workers (int): Потоков обработки.
+            max_pending (int): Предел очереди обновлений.
+        """
+        self.process = process
+        self.path = path
+        self.secret = secret
+        self.executor = KeyedExecutor(workers, max_pending)
+        self._lock = threading.Lock()
+        self._received = 0
+        self._processed = 0
+        self._forbidden = 0
+        self._overloaded = 0
+        self._latencies: Deque[float] = deque(maxlen=1000)
+        self._server = ThreadingHTTPServer((listen, port), self._handler_class())
+        self._server.daemon_threads = True
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def address(self) -> tuple:
+        return self._server.server_address[:2]
+
+    def _handler_class(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                self.send_response(server.accept(self.path, self.headers.get(SECRET_HEADER), self._read_body()))
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+
+            def _read_body(self) -> bytes:
+                length = int(self.headers.get('Content-Length') or 0)
+                return self.rfile.read(length) if length else b''
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def accept(self, path: str, secret: Optional[str], body: bytes) -> int:
+        """
+        Проверяет и ставит в очередь одно обновление.
+
+        Returns:
+            HTTP-статус ответа Telegram.
+        """
+        if path != self.path:
+            return 404
+        if self.secret and not hmac.compare_digest((secret or '').encode(), self.secret.encode()):
+            with self._lock:
+                self._forbidden += 1
+            return 403
+        try:
+            update = Update.de_json(json.loads(body))
+        except Exception as e:
+            logging.warning(f"Некорректное обновление webhook: {e}")
+            return 400
+        received_at = time.monotonic()
+        chat_id = update_chat_id(update)
+
+        def task():
+            self.process(update)
+            with self._lock:
+                self._processed += 1
+                self._latencies.append(time.monotonic() - received_at)
+
+        # Обновления без чата не связаны порядком - ключ по их собственному ID
+        key = chat_id if chat_id is not None else ('update', update.update_id)
+        with self._lock:
+            self._received += 1
+        if not self.executor.submit(key, task):
+            with self._lock:
+                self._overloaded += 1
+            return 503
+        return 200
+
+    def start(self) -> 'WebhookServer':
+        """Запускает сервер в фоновом потоке"""
+        self._thread = threading.Thread(target=self._server.serve_forever, name="webhook-server", daemon=True)
+        self._thread.start()
+        host, port = self.address
+        logging.info(f"Webhook слушает http://{host}:{port}{self.path}")
+        return self
+
+    def serve_forever(self):
+        """Запускает сервер в текущем потоке"""
+        host, port = self.address
+        logging.info(f"Webhook слушает http://{host}:{port}{self.path}")
+        self._server.serve_forever()
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+        self.executor.shutdown()
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Метрики приема
+
+        Returns:
+            {'received', 'processed', 'forbidden', 'overloaded', 'pending',
+            'latency_avg', 'latency_p95', 'latency_max'} (время в секундах)
+        """
+        with self._lock:
+            latencies = sorted(self._latencies)
+            stats = {
+                'received': self._received,
+                'processed': self._processed,
+                'forbidden': self._forbidden,
+                'overloaded': self._overloaded,
+            }
+        stats['pending'] = self.executor.pending
+        stats['latency_avg'] = round(sum(latencies) / len(latencies), 4) if latencies else 0.0
+        stats['latency_p95'] = round(latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))], 4) if latencies else 0.0
+        stats['latency_max'] = round(latencies[-1], 4) if latencies else 0.0
+        return stats
@@ -0,0 +1,419 @@
+import atexit
+import os
+import shutil
+import subprocess
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from typing import Optional, Dict, Any, List
+
+from DrissionPage import ChromiumPage, ChromiumOptions
+
+from metrics import histogram
+
+BROWSER_LAUNCH_SECONDS = histogram(
+    'tracker_browser_launch_seconds', 'Время запуска браузера (сек)', buckets=(0.5, 1, 2, 3, 5, 10, 20, 30, 60)
+)
+
+
+def find_browser_path() -> Optional[str]:
+    """
+    Находит путь к установленному браузеру Chromium/Chrome
+
+    Returns:
+        Путь к исполняемому файлу браузера или None, если не найден
+    """
+    # Список возможных путей и команд для поиска браузера
+    possible_paths = [
+        '/usr/bin/chromium-browser',
+        '/usr/bin/chromium',
+        '/usr/bin/google-chrome',
+        '/snap/bin/chromium',
+    ]
+
+    # Проверяем стандартные пути
+    for path in possible_paths:
+        if shutil.which(path.split('/')[-1]) or os.path.exists(path):
+            # Проверяем, что это действительно исполняемый файл браузера
+            try:
+                result = subprocess.run(
+                    [path, '--version'],
+                    capture_output=True,
+                    timeout=5,
+                    text=True
+                )
+                if result.returncode == 0 or 'Chromium' in result.stdout or 'Chrome' in result.stdout:
+                    return path
+            except (subprocess.TimeoutExpired, FileNotFoundError, PermissionError):
+                continue
+
+    # Пробуем найти через which
+    for cmd in ['chromium-browser', 'chromium', 'google-chrome']:
+        path = shutil.which(cmd)
+        if path:
+            return path
+
+    return None
+
+
+def build_chromium_options(profile_dir: str) -> ChromiumOptions:
+    """
+    Собирает опции запуска headless-браузера для сервера
+
+    Args:
+        profile_dir: Каталог профиля, выделенный под этот экземпляр браузера
+    """
+    co = ChromiumOptions()
+    # Устанавливаем headless режим (новый формат для Chrome/Chromium)
+    co.set_argument('--headless=new')
+    # Параметры для Linux систем без GUI (решают проблему подключения к браузеру)
+    co.set_argument('--no-sandbox')
+    co.set_argument('--disable-dev-shm-usage')
+    co.set_argument('--disable-gpu')
+    co.set_argument('--disable-software-rasterizer')
+    # Автоматически находим путь к браузеру
+    browser_path = find_browser_path()
+    if browser_path:
+        co.set_browser_path(path=browser_path)
+        print(f"Используется браузер: {browser_path}")
+    else:
+        print("⚠️  Браузер не найден автоматически. Установите Chromium: sudo snap install chromium")
+        # Пробуем без указания пути - DrissionPage может найти сам
+    # Выделяем отдельный профиль и порт, чтобы избежать конфликтов подключения
+    os.makedirs(profile_dir, exist_ok=True)
+    co.set_user_data_path(profile_dir)
+    co.auto_port()
+    return co
+
+
+class _BrowserSlot:
+    """Один запущенный браузер пула и его вкладки"""
+
+    def __init__(self, index: int):
+        self.index = index
+        self.page: Optional[ChromiumPage] = None
+        self.idle_tabs: List[Any] = []
+        self.busy = 0
+        self.restarts = 0
+        # Вкладки, которые сейчас открываются или проверяются при возврате
+        # (учитываются в лимите вкладок браузера)
+        self.opening = 0
+        # Слот зарезервирован потоком, который проверяет, запускает браузер или открывает
+        # вкладку без блокировки пула; остальные потоки слот пропускают
+        self.launching = False
+
+    @property
+    def tab_count(self) -> int:
+        return len(self.idle_tabs) + self.busy + self.opening
+
+
+class BrowserPool:
+    """
+    Общий для процесса пул headless-браузеров.
+
+    Браузеры запускаются один раз и живут всё время работы бота, а вызывающий
+    код получает из пула вкладку и возвращает её после использования.
+    Перед выдачей вкладка проверяется, упавший браузер перезапускается.
+    """
+
+    def __init__(self, browsers: int = 1, tabs_per_browser: int = 2, acquire_timeout: float = 60):
+        """
+        Инициализация пула
+
+        Args:
+            browsers: Количество экземпляров браузера
+            tabs_per_browser: Максимальное количество вкладок в одном браузере
+            acquire_timeout: Сколько секунд ждать свободную вкладку
+        """
+        self.tabs_per_browser = max(1, tabs_per_browser)
+        self.acquire_timeout = acquire_timeout
+        self._slots = [_BrowserSlot(i) for i in range(max(1, browsers))]
+        self._tab_owner: Dict[int, _BrowserSlot] = {}
+        self._cond = threading.Condition()
+        self._closed = False
+        self.launches = 0
+        self.tab_reuses = 0
+
+    def _profile_dir(self, slot: _BrowserSlot) -> str:
+        return os.path.join(tempfile.gettempdir(), f"drission_profile_{os.getpid()}_{slot.index}")
+
+    def _launch(self, slot: _BrowserSlot) -> ChromiumPage:
+        """Запускает браузер для слота (несколько секунд, вызывается без блокировки пула)"""
+        started = time.perf_counter()
+        page = ChromiumPage(addr_or_opts=build_chromium_options(self._profile_dir(slot)))
+        elapsed = time.perf_counter() - started
+        BROWSER_LAUNCH_SECONDS.observe(elapsed)
+        print(f"Браузер #{slot.index} запущен за {elapsed:.2f} сек")
+        return page
+
+    @staticmethod
+    def _quit(index: int, page: ChromiumPage) -> None:
+        try:
+            page.quit()
+        except Exception as e:
+            print(f"Ошибка при закрытии браузера #{index}: {e}")
+
+    def _detach_slot(self, slot: _BrowserSlot) -> Optional[ChromiumPage]:
+        """Забывает браузер слота и его свободные вкладки. Вызывается под блокировкой."""
+        for tab in slot.idle_tabs:
+            self._tab_owner.pop(id(tab), None)
+        slot.idle_tabs.clear()
+        page, slot.page = slot.page, None
+        return page
+
+    def _shutdown_slot(self, slot: _BrowserSlot) -> None:
+        """Закрывает браузер слота и забывает его вкладки"""
+        page = self._detach_slot(slot)
+        if page is not None:
+            self._quit(slot.index, page)
+
+    def _ensure_browser(self, slot: _BrowserSlot) -> bool:
+        """
+        Проверяет браузер слота и запускает (перезапускает) его, если он не отвечает.
+        Вызывается без блокировки пула потоком, зарезервировавшим слот (slot.launching):
+        запуск и запросы к браузеру не задерживают acquire/release/stats других потоков.
+
+        Returns:
+            True, если браузер был запущен
+        """
+        if self._browser_alive(slot):
+            return False
+        with self._cond:
+            old_page = self._detach_slot(slot)
+            if old_page is not None:
+                slot.restarts += 1
+        if old_page is not None:
+            print(f"⚠️  Браузер #{slot.index} не отвечает, перезапускаем")
+            self._quit(slot.index, old_page)
+        page = self._launch(slot)
+        with self._cond:
+            closed = self._closed
+            if not closed:
+                slot.page = page
+                self.launches += 1
+        if closed:
+            self._quit(slot.index, page)
+            raise RuntimeError("Пул браузеров закрыт")
+        return True
+
+    def _ensure_reserved(self, slots: List[_BrowserSlot]) -> int:
+        """Проверяет (при необходимости запускает) браузеры зарезервированных слотов и снимает резерв"""
+        launched = 0
+        try:
+            for slot in slots:
+                launched += self._ensure_browser(slot)
+        finally:
+            with self._cond:
+                for slot in slots:
+                    slot.launching = False
+                self._cond.notify_all()
+        return launched
+
+    @staticmethod
+    def _browser_alive(slot: _BrowserSlot) -> bool:
+        try:
+            return slot.page is not None and slot.page.browser.states.is_alive
+        except Exception:
+            return False
+
+    @staticmethod
+    def _tab_alive(tab) -> bool:
+        try:
+            return tab.states.is_alive
+        except Exception:
+            return False
+
+    def _take_tab(self):
+        """
+        Резервирует вкладку без ожидания. Вызывается под блокировкой.
+
+        Returns:
+            (слот, свободная вкладка) - вкладку нужно проверить перед выдачей;
+            (слот, None) - в слоте нужно открыть новую вкладку (слот зарезервирован);
+            None - мест нет
+        """
+        # Сначала переиспользуем уже открытые вкладки
+        for slot in self._slots:
+            if slot.idle_tabs and not slot.launching:
+                tab = slot.idle_tabs.pop()
+                slot.busy += 1
+                return slot, tab
+
+        # Затем открываем новую вкладку в наименее загруженном браузере
+        candidates = [s for s in self._slots if not s.launching and s.tab_count < self.tabs_per_browser]
+        if not candidates:
+            return None
+        slot = min(candidates, key=lambda s: (s.page is None, s.tab_count))
+        slot.launching = True
+        slot.opening += 1
+        return slot, None
+
+    def _open_tab(self, slot: _BrowserSlot):
+        """Открывает вкладку в зарезервированном слоте (при необходимости запуская браузер) без блокировки пула"""
+        tab = None
+        try:
+            self._ensure_browser(slot)
+            tab = slot.page.new_tab()
+        finally:
+            with self._cond:
+                slot.opening -= 1
+                slot.launching = False
+                if tab is not None:
+                    slot.busy += 1
+                    self._tab_owner[id(tab)] = slot
+                self._cond.notify_all()
+        return tab
+
+    def acquire(self, timeout: Optional[float] = None):
+        """
+        Выдает вкладку браузера
+
+        Args:
+            timeout: Сколько секунд ждать свободную вкладку (по умолчанию acquire_timeout)
+
+        Returns:
+            Вкладка DrissionPage, которую нужно вернуть через release()
+        """
+        deadline = time.monotonic() + (self.acquire_timeout if timeout is None else timeout)
+        while True:
+            with self._cond:
+                while True:
+                    if self._closed:
+                        raise RuntimeError("Пул браузеров закрыт")
+                    reserved = self._take_tab()
+                    if reserved is not None:
+                        break
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        raise TimeoutError("Нет свободных вкладок в пуле браузеров")
+                    self._cond.wait(remaining)
+
+            slot, tab = reserved
+            if tab is None:
+                return self._open_tab(slot)
+            # Проверка вкладки - запросы к браузеру, поэтому без блокировки пула
+            if self._browser_alive(slot) and self._tab_alive(tab):
+                with self._cond:
+                    self.tab_reuses += 1
+                return tab
+            with self._cond:
+                slot.busy -= 1
+                self._tab_owner.pop(id(tab), None)
+                self._cond.notify()
+
+    def release(self, tab, discard: bool = False) -> None:
+        """
+        Возвращает вкладку в пул
+
+        Args:
+            tab: Вкладка, полученная через acquire()
+            discard: Закрыть вкладку вместо переиспользования (например, после ошибки)
+        """
+        with self._cond:
+            slot = self._tab_owner.pop(id(tab), None)
+            if slot is None:
+                return
+            slot.busy -= 1
+            slot.opening += 1
+            page = slot.page
+            discard = discard or self._closed
+        # Проверка и закрытие вкладки - запросы к браузеру, поэтому без блокировки пула
+        keep = not discard and self._tab_alive(tab)
+        with self._cond:
+            slot.opening -= 1
+            # Браузер могли перезапустить или пул закрыть, пока вкладка проверялась
+            keep = keep and not self._closed and slot.page is page
+            if keep:
+                slot.idle_tabs.append(tab)
+                self._tab_owner[id(tab)] = slot
+            self._cond.notify()
+        if not keep:
+            try:
+                tab.close()
+            except Exception:
+                pass
+
+    @contextmanager
+    def tab(self, timeout: Optional[float] = None):
+        """Контекстный менеджер: выдает вкладку и возвращает её в пул"""
+        tab = self.acquire(timeout)
+        failed = False
+        try:
+            yield tab
+        except Exception:
+            failed = True
+            raise
+        finally:
+            self.release(tab, discard=failed)
+
+    def warm_up(self) -> None:
+        """Заранее запускает все браузеры пула, чтобы первый запрос не ждал старта"""
+        with self._cond:
+            if self._closed:
+                return
+            slots = [slot for slot in self._slots if not slot.launching]
+            for slot in slots:
+                slot.launching = True
+        self._ensure_reserved(slots)
+
+    def health_check(self) -> int:
+        """
+        Перезапускает упавшие браузеры, у которых нет занятых вкладок
+
+        Returns:
+            Количество перезапущенных браузеров
+        """
+        with self._cond:
+            if self._closed:
+                return 0
+            # Проверка и перезапуск идут без блокировки пула: слоты на это время резервируются
+            slots = [slot for slot in self._slots if slot.page is not None and slot.busy == 0 and not slot.launching]
+            for slot in slots:
+                slot.launching = True
+        return self._ensure_reserved(slots)
+
+    def stats(self) -> Dict[str, int]:
+        """
+        Возвращает текущее состояние пула для подбора его размера
+
+        Returns:
+            Словарь: warm - запущенные браузеры, idle/busy - свободные и занятые вкладки
+        """
+        with self._cond:
+            return {
+                'browsers': len(self._slots),
+                'warm': sum(1 for s in self._slots if s.page is not None),
+                'idle': sum(len(s.idle_tabs) for s in self._slots),
+                'busy': sum(s.busy for s in self._slots),
+                'capacity': len(self._slots) * self.tabs_per_browser,
+                'launches': self.launches,
+                'restarts': sum(s.restarts for s in self._slots),
+                'tab_reuses': self.tab_reuses,
+            }
+
+    def close(self) -> None:
+        """Закрывает все браузеры пула"""
+        with self._cond:
+            self._closed = True
+            for slot in self._slots:
+                self._shutdown_slot(slot)
+            self._tab_owner.clear()
+            self._cond.notify_all()
+
+
+_shared_pool: Optional[BrowserPool] = None
+_shared_lock = threading.Lock()
+
+
+def get_browser_pool(browsers: int = 1, tabs_per_browser: int = 2, acquire_timeout: float = 60) -> BrowserPool:
+    """
+    Возвращает общий для процесса пул браузеров, создавая его при первом вызове.
+    Параметры учитываются только при создании пула.
+    """
+    global _shared_pool
+    with _shared_lock:
+        if _shared_pool is None:
+            _shared_pool = BrowserPool(browsers, tabs_per_browser, acquire_timeout)
+            atexit.register(_shared_pool.close)
+        return _shared_pool
@@ -0,0 +1,343 @@
+import re
+import json
+import threading
+from typing import Optional, Dict, Any, List, Callable, Pattern
+from urllib.parse import urlparse
+
+import soupsieve
+from bs4 import BeautifulSoup, SoupStrainer
+
+from metrics import counter
+
+# Быстрый парсер на C (lxml), если установлен; иначе встроенный html.parser
+try:
+    import lxml  # noqa: F401
+    DEFAULT_FEATURES = 'lxml'
+except ImportError:
+    DEFAULT_FEATURES = 'html.parser'
+
+
+# Поля, которые основной селектор не нашел: selector - селектор, который их дал
+# ('json-ld' - разметка schema.org, 'none' - никакой)
+PARSE_FALLTHROUGH = counter(
+    'tracker_parse_fallthrough', 'Поля, не найденные основным селектором (selector - давший значение, json-ld, none - ни один)',
+    ['domain', 'field', 'selector']
+)
+
+# Селекторы и шаблоны цены, общие для CSMarketParser
+TITLE_SELECTORS = [
+    'h1.name span',
+    'h1.name',
+    'h1 span[data-title]',
+    '.name span',
+    'h1'
+]
+PRICE_SELECTORS = [
+    '.best-offer',
+    '[class*="best-offer"]',
+    '.price',
+    '[class*="price"]'
+]
+PRICE_PATTERNS = [
+    re.compile(r'\$(\d+(?:\.\d+)?)'),
+    re.compile(r'(\d+(?:\.\d+)?)\s*\$'),
+]
+
+
+def _class_string(attrs) -> str:
+    value = attrs.get('class', '') if attrs else ''
+    return ' '.join(value) if isinstance(value, (list, tuple)) else (value or '')
+
+
+def _quick_check(selector: str) -> Callable:
+    """
+    Дешевая предварительная проверка по последнему составному селектору:
+    имя тега и фрагменты класса. Полная проверка soupsieve выполняется,
+    только если элемент прошел эту.
+    """
+    last = selector.split()[-1]
+    name_match = re.match(r'^([a-zA-Z][\w-]*)', last)
+    name = name_match.group(1) if name_match else None
+    class_parts = re.findall(r'\.([\w-]+)', last) + re.findall(r'\[class\*="([^"]+)"\]', last)
+
+    def check(tag) -> bool:
+        if name and tag.name != name:
+            return False
+        if class_parts:
+            classes = _class_string(tag.attrs)
+            return all(part in classes for part in class_parts)
+        return True
+    return check
+
+
+def make_relevance_filter(tags: List[str], class_parts: List[str]) -> Callable:
+    """
+    Возвращает функцию для SoupStrainer: в дерево попадают только элементы
+    с нужными тегами или классами (вместе со всеми потомками).
+    """
+    tags = set(tags)
+
+    def is_relevant(name, attrs) -> bool:
+        if name in tags:
+            return True
+        classes = _class_string(attrs)
+        return bool(classes) and any(part in classes for part in class_parts)
+    return is_relevant
+
+
+class ExtractionPlan:
+    """
+    Заранее скомпилированный план извлечения полей для домена.
+
+    Разбирается только нужная часть документа (через SoupStrainer), а название
+    и цена извлекаются за один обход дерева. Приоритет селекторов тот же,
+    что и в CSMarketParser._extract_title / _extract_best_offer_price.
+
+    Сначала документ разбирается с узким фильтром (название и приоритетные
+    селекторы цены). Более общие селекторы цены вроде '[class*="price"]'
+    совпадают с сотнями элементов, поэтому широкий разбор выполняется,
+    только если приоритетные селекторы цену не дали.
+    """
+
+    def __init__(self, title_selectors: List[str], price_selectors: List[str],
+                 price_patterns: List[Pattern], relevant_tags: List[str], relevant_class_parts: List[str],
+                 priority_price_selectors: int = 0, priority_class_parts: Optional[List[str]] = None,
+                 features: str = DEFAULT_FEATURES):
+        """
+        Args:
+            title_selectors: Селекторы названия в порядке приоритета
+            price_selectors: Селекторы блока цены в порядке приоритета
+            price_patterns: Регулярные выражения цены (первая группа - число)
+            relevant_tags: Теги, которые нужно сохранить при разборе
+            relevant_class_parts: Фрагменты классов, которые нужно сохранить при разборе
+            priority_price_selectors: Сколько первых селекторов цены проверять на узком разборе (0 - без него)
+            priority_class_parts: Фрагменты классов для узкого разбора
+            features: Парсер BeautifulSoup
+        """
+        self.title_selectors = title_selectors
+        self.price_selectors = price_selectors
+        self.title_matchers = [(_quick_check(sel), soupsieve.compile(sel)) for sel in title_selectors]
+        self.price_matchers = [(_quick_check(sel), soupsieve.compile(sel)) for sel in price_selectors]
+        self.price_patterns = price_patterns
+        self.strainer = SoupStrainer(make_relevance_filter(relevant_tags, relevant_class_parts))
+        self.priority_price_selectors = priority_price_selectors
+        self.priority_strainer = SoupStrainer(make_relevance_filter(relevant_tags, priority_class_parts or []))
+        self.features = features
+
+    def parse(self, html_content: str, narrow: bool = False) -> BeautifulSoup:
+        """Разбирает только релевантные части документа"""
+        strainer = self.priority_strainer if narrow else self.strainer
+        return BeautifulSoup(html_content, self.features, parse_only=strainer)
+
+    def _price_from_text(self, text: str) -> Optional[str]:
+        for pattern in self.price_patterns:
+            price_match = pattern.search(text)
+            if price_match:
+                return f"${price_match.group(1)}"
+        return None
+
+    def extract_fields(self, soup: BeautifulSoup, price_selectors: Optional[int] = None) -> Dict[str, Optional[str]]:
+        """
+        Извлекает название и цену за один обход дерева
+
+        Args:
+            soup: Разобранный документ
+            price_selectors: Сколько первых селекторов цены учитывать (по умолчанию все)
+
+        Returns:
+            Словарь {'title', 'price'}
+        """
+        return self._extract_ranked(soup, price_selectors)[0]
+
+    def _extract_ranked(self, soup: BeautifulSoup, price_selectors: Optional[int] = None) -> tuple:
+        """
+        То же, что extract_fields, плюс номера селекторов, давших значения
+
+        Returns:
+            ({'title', 'price'}, номер селектора названия или None, номер селектора цены или None)
+        """
+        titles: List[Optional[str]] = [None] * len(self.title_matchers)
+        title_done = [False] * len(self.title_matchers)
+        price_matchers = self.price_matchers[:price_selectors] if price_selectors else self.price_matchers
+        prices: List[Optional[str]] = [None] * len(price_matchers)
+
+        for tag in soup.find_all(True):
+            text = None
+            # Для названия важен только первый элемент каждого селектора
+            for i, (quick, matcher) in enumerate(self.title_matchers):
+                if not title_done[i] and quick(tag) and matcher.match(tag):
+                    title_done[i] = True
+                    titles[i] = tag.get_text(strip=True) or None
+            # Для цены - первый элемент селектора, в тексте которого есть цена
+            for i, (quick, matcher) in enumerate(price_matchers):
+                if prices[i] is None and quick(tag) and matcher.match(tag):
+                    if text is None:
+                        text = tag.get_text()
+                    prices[i] = self._price_from_text(text)
+            # Лучшие по приоритету значения уже найдены - дальше можно не идти
+            if titles[0] and prices[0] is not None:
+                break
+
+        title_index = next((i for i, t in enumerate(titles) if t), None)
+        price_index = next((i for i, p in enumerate(prices) if p), None)
+        return {
+            'title': titles[title_index] if title_index is not None else None,
+            'price': prices[price_index] if price_index is not None else None,
+        }, title_index, price_index
+
+    def extract_ranked(self, html_content: str, url: str) -> tuple:
+        """
+        Разбирает страницу, не учитывая смену селекторов (вызывающий код может
+        дополнить поля из других источников и учесть итог через record_fallthrough)
+
+        Returns:
+            ({'url', 'title', 'price'}, номер селектора названия или None, номер селектора цены или None)
+        """
+        fields = None
+        if self.priority_price_selectors:
+            fields, title_index, price_index = self._extract_ranked(
+                self.parse(html_content, narrow=True), self.priority_price_selectors
+            )
+        if not fields or (not fields['price'] and self.priority_price_selectors < len(self.price_matchers)):
+            fields, title_index, price_index = self._extract_ranked(self.parse(html_content))
+        return {'url': url, 'title': fields['title'], 'price': fields['price']}, title_index, price_index
+
+    def extract(self, html_content: str, url: str) -> Dict[str, Any]:
+        """
+        Разбирает страницу и возвращает данные в формате CSMarketParser.parse_item_page
+
+        Returns:
+            Словарь {'url', 'title', 'price'}
+        """
+        result, title_index, price_index = self.extract_ranked(html_content, url)
+        self.record_fallthrough(url, self.field_source('title', title_index), self.field_source('price', price_index))
+        return result
+
+    def field_source(self, field: str, index: Optional[int]) -> Optional[str]:
+        """
+        Источник поля для tracker_parse_fallthrough
+
+        Returns:
+            None - основной селектор, иначе селектор, давший значение, или 'none'
+        """
+        if index == 0:
+            return None
+        selectors = self.title_selectors if field == 'title' else self.price_selectors
+        return selectors[index] if index is not None else 'none'
+
+    @staticmethod
+    def record_fallthrough(url: str, title_source: Optional[str], price_source: Optional[str]):
+        """
+        Учитывает поля, которые не дал основной селектор (рост - признак смены разметки)
+
+        Args:
+            title_source, price_source: Источник поля (см. field_source; 'json-ld' - разметка schema.org)
+        """
+        domain = urlparse(url).hostname or ''
+        for field, source in (('title', title_source), ('price', price_source)):
+            if source is not None:
+                PARSE_FALLTHROUGH.inc(domain=domain, field=field, selector=source)
+
+
+def build_default_plan(price_selectors: Optional[List[str]] = None) -> ExtractionPlan:
+    """План с селекторами CSMarketParser (по умолчанию полный список селекторов цены)"""
+    return ExtractionPlan(
+        title_selectors=TITLE_SELECTORS,
+        price_selectors=price_selectors or PRICE_SELECTORS,
+        price_patterns=PRICE_PATTERNS,
+        relevant_tags=['h1'],
+        relevant_class_parts=['name', 'price', 'best-offer'],
+        # '.best-offer' и '[class*="best-offer"]' ищутся на узком разборе
+        priority_price_selectors=2,
+        priority_class_parts=['name', 'best-offer'],
+    )
+
+
+# Фабрики планов по доменам (план компилируется один раз при первом обращении)
+PLAN_FACTORIES: Dict[str, Callable[[], ExtractionPlan]] = {
+    'market.csgo.com': build_default_plan,
+    'steamcommunity.com': build_default_plan,
+}
+
+_plans: Dict[str, ExtractionPlan] = {}
+_plans_lock = threading.Lock()
+
+
+def get_extraction_plan(url: str) -> ExtractionPlan:
+    """Возвращает скомпилированный план извлечения для домена url"""
+    host = urlparse(url).hostname or ''
+    domain = next((d for d in PLAN_FACTORIES if host == d or host.endswith('.' + d)), '')
+    with _plans_lock:
+        if domain not in _plans:
+            _plans[domain] = PLAN_FACTORIES.get(domain, build_default_plan)()
+        return _plans[domain]
+
+
+# Версия скрипта извлечения в браузере: меняется при любом изменении логики,
+# чтобы ответы старой версии не принимались за актуальные
+JS_EXTRACTION_VERSION = 1
+
+
+def _js_regex(pattern: Pattern) -> str:
+    """Переводит регулярное выражение Python в литерал JS (используемые конструкции совпадают)"""
+    return '/' + pattern.pattern.replace('/', '\\/') + '/'
+
+
+def build_js_extractor(plan: ExtractionPlan) -> str:
+    """
+    Собирает скрипт, который выполняется на странице и возвращает только нужные поля.
+    Повторяет логику ExtractionPlan: порядок селекторов, get_text(strip=True) для названия
+    и поиск цены по тем же шаблонам; текст внутри script/style/template не учитывается.
+    """
+    return '''
+        const VERSION = %d;
+        const titleSelectors = %s;
+        const priceSelectors = %s;
+        const pricePatterns = [%s];
+        const strings = (el) => {
+            const out = [];
+            const walker = document.createTreeWalker(el, NodeFilter.SHOW_TEXT);
+            for (let node = walker.nextNode(); node; node = walker.nextNode()) {
+                const parent = node.parentElement;
+                if (parent && parent.closest('script, style, template')) continue;
+                out.push(node.data);
+            }
+            return out;
+        };
+        let title = null;
+        for (const sel of titleSelectors) {
+            const el = document.querySelector(sel);
+            if (!el) continue;
+            const text = strings(el).map(s => s.trim()).filter(Boolean).join('');
+            if (text) { title = text; break; }
+        }
+        let price = null;
+        outer:
+        for (const sel of priceSelectors) {
+            for (const el of document.querySelectorAll(sel)) {
+                const text = strings(el).join('');
+                for (const re of pricePatterns) {
+                    const m = text.match(re);
+                    if (m) { price = '$' + m[1]; break outer; }
+                }
+            }
+        }
+        return {v: VERSION, title: title, price: price};
+    ''' % (
+        JS_EXTRACTION_VERSION,
+        json.dumps(plan.title_selectors),
+        json.dumps(plan.price_selectors),
+        ', '.join(_js_regex(p) for p in plan.price_patterns),
+    )
+
+
+_js_scripts: Dict[int, str] = {}
+
+
+def get_js_extractor(url: str) -> str:
+    """Возвращает скрипт извлечения для домена url (собирается один раз на план)"""
+    plan = get_extraction_plan(url)
+    with _plans_lock:
+        if id(plan) not in _js_scripts:
+            _js_scripts[id(plan)] = build_js_extractor(plan)
+        return _js_scripts[id(plan)]
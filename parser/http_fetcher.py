@@ -0,0 +1,167 @@
+import threading
+from typing import Optional, Dict, Any
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+
+# Заголовки обычного браузера: без них часть страниц отдается в урезанном виде
+DEFAULT_HEADERS = {
+    'User-Agent': ('Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 '
+                   '(KHTML, like Gecko) Chrome/126.0 Safari/537.36'),
+    'Accept': 'text/html,application/xhtml+xml,application/json;q=0.9,*/*;q=0.8',
+    'Accept-Language': 'en-US,en;q=0.9',
+}
+
+
+class HttpFetcher:
+    """Легкая загрузка страниц через общую keep-alive сессию requests"""
+
+    def __init__(self, timeout: float = 10, pool_size: int = 10, session: Optional[requests.Session] = None):
+        """
+        Args:
+            timeout: Таймаут одного запроса в секундах
+            pool_size: Размер пула keep-alive соединений на хост
+            session: Готовая сессия (по умолчанию создается новая)
+        """
+        self.timeout = timeout
+        self.session = session or requests.Session()
+        if session is None:
+            retry = Retry(total=1, backoff_factor=0.5, status_forcelist=(502, 503, 504),
+                          allowed_methods=('GET',))
+            adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+            self.session.mount('https://', adapter)
+            self.session.mount('http://', adapter)
+            self.session.headers.update(DEFAULT_HEADERS)
+
+    def get_text(self, url: str) -> Optional[str]:
+        """
+        Загружает страницу и возвращает её HTML
+
+        Returns:
+            Текст ответа или None при ошибке/неуспешном статусе
+        """
+        try:
+            response = self.session.get(url, timeout=self.timeout)
+            if response.status_code != 200:
+                print(f"HTTP {response.status_code} для {url}")
+                return None
+            return response.text
+        except requests.RequestException as e:
+            print(f"Ошибка HTTP-загрузки {url}: {e}")
+            return None
+
+    def get_json(self, url: str, params: Optional[Dict[str, Any]] = None) -> Optional[Any]:
+        """
+        Выполняет GET-запрос к JSON-эндпоинту
+
+        Returns:
+            Разобранный JSON или None при ошибке
+        """
+        try:
+            response = self.session.get(url, params=params, timeout=self.timeout)
+            if response.status_code != 200:
+                print(f"HTTP {response.status_code} для {response.url}")
+                return None
+            return response.json()
+        except (requests.RequestException, ValueError) as e:
+            print(f"Ошибка загрузки JSON {url}: {e}")
+            return None
+
+    def close(self) -> None:
+        self.session.close()
+
+
+class FetchPathStats:
+    """
+    Статистика по предметам: каким способом удалось получить цену.
+
+    По ней же решается, стоит ли пробовать легкую загрузку: предметы, цену
+    которых несколько раз подряд удалось получить только в браузере, сразу
+    открываются в браузере, а HTTP пробуется лишь изредка (вдруг разметка изменилась).
+    """
+
+    HTTP = 'http'
+    BROWSER = 'browser'
+    FAILED = 'failed'
+
+    def __init__(self, skip_http_after: int = 3, retry_http_every: int = 10):
+        """
+        Args:
+            skip_http_after: После скольких загрузок подряд только через браузер перестать пробовать HTTP
+            retry_http_every: Раз в сколько загрузок без HTTP все же пробовать его снова
+        """
+        self._lock = threading.Lock()
+        self._by_url: Dict[str, Dict[str, Any]] = {}
+        self.skip_http_after = skip_http_after
+        self.retry_http_every = retry_http_every
+        # Загрузки, при которых HTTP не пробовался
+        self.http_skipped = 0
+
+    def record(self, url: str, path: str, http_tried: bool = True) -> None:
+        """
+        Записывает, каким способом получена цена предмета
+
+        Args:
+            http_tried: Перед браузером была попытка легкой загрузки
+        """
+        with self._lock:
+            entry = self._by_url.setdefault(url, {
+                self.HTTP: 0, self.BROWSER: 0, self.FAILED: 0, 'last': None,
+                'browser_streak': 0, 'since_http': 0,
+            })
+            entry[path] += 1
+            entry['last'] = path
+            if not http_tried:
+                entry['since_http'] += 1
+                self.http_skipped += 1
+                return
+            entry['since_http'] = 0
+            if path == self.HTTP:
+                entry['browser_streak'] = 0
+            elif path == self.BROWSER:
+                # HTTP снова не дал цену, а браузер дал
+                entry['browser_streak'] += 1
+
+    def should_try_http(self, url: str) -> bool:
+        """Пробовать ли легкую загрузку перед браузером"""
+        with self._lock:
+            entry = self._by_url.get(url)
+            return (entry is None or entry['browser_streak'] < self.skip_http_after
+                    or entry['since_http'] + 1 >= self.retry_http_every)
+
+    def for_url(self, url: str) -> Optional[Dict[str, Any]]:
+        """Счетчики способов загрузки для одного предмета"""
+        with self._lock:
+            entry = self._by_url.get(url)
+            return dict(entry) if entry else None
+
+    def summary(self) -> Dict[str, int]:
+        """Суммарные счетчики по всем предметам (http_skipped - загрузки сразу через браузер)"""
+        with self._lock:
+            totals = {self.HTTP: 0, self.BROWSER: 0, self.FAILED: 0}
+            for entry in self._by_url.values():
+                for path in totals:
+                    totals[path] += entry[path]
+            totals['http_skipped'] = self.http_skipped
+            return totals
+
+
+# Общая статистика процесса
+fetch_path_stats = FetchPathStats()
+
+_shared_fetcher: Optional[HttpFetcher] = None
+_shared_lock = threading.Lock()
+
+
+def get_http_fetcher(timeout: float = 10, pool_size: int = 10) -> HttpFetcher:
+    """
+    Возвращает общий для процесса HttpFetcher, создавая его при первом вызове.
+    Параметры учитываются только при создании.
+    """
+    global _shared_fetcher
+    with _shared_lock:
+        if _shared_fetcher is None:
+            _shared_fetcher = HttpFetcher(timeout, pool_size)
+        return _shared_fetcher
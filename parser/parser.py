@@ -1,25 +1,76 @@
-from DrissionPage import ChromiumPage, ChromiumOptions
-import time
 import re
-import subprocess
-import shutil
-import os
-import tempfile
-from typing import Optional, Dict, Any
-from bs4 import BeautifulSoup
+import json
+import time
+from contextlib import contextmanager
+from typing import Optional, Dict, Any, List
+from urllib.parse import unquote, urlparse
+from bs4 import BeautifulSoup, SoupStrainer
+
+from parser.browser_pool import BrowserPool, find_browser_path, get_browser_pool
+from parser.http_fetcher import HttpFetcher, FetchPathStats, fetch_path_stats, get_http_fetcher
+from parser.rate_limiter import DomainRateLimiter
+from parser.extraction import (
+    DEFAULT_FEATURES, JS_EXTRACTION_VERSION, build_default_plan, get_extraction_plan, get_js_extractor,
+)
+from parser.readiness import PageReadiness, ReadinessResult
+from parser.replay import PAGE, CassetteWriter
+from metrics import histogram
+
+
+# Адрес страницы лота Steam: /market/listings/<appid>/<market_hash_name>
+STEAM_LISTING_RE = re.compile(r'steamcommunity\.com/market/listings/(\d+)/([^/?#]+)')
+STEAM_PRICE_OVERVIEW_URL = 'https://steamcommunity.com/market/priceoverview/'
+
+# Селекторы, которым можно доверять в серверном HTML (без общего '[class*="price"]')
+HTTP_PRICE_SELECTORS = ['.best-offer', '[class*="best-offer"]']
+HTTP_EXTRACTION_PLAN = build_default_plan(HTTP_PRICE_SELECTORS)
+JSON_LD_STRAINER = SoupStrainer('script', attrs={'type': 'application/ld+json'})
+
+# method: http - серверный HTML, js - скрипт в браузере, html - разбор отрендеренного page.html
+EXTRACTION_SECONDS = histogram(
+    'tracker_extraction_seconds', 'Время извлечения названия и цены (сек) по доменам и способам',
+    ['domain', 'method']
+)
 
 
 class CSMarketParser:
-    """Парсер для CS:GO маркета с использованием DrissionPage + BeautifulSoup4"""
+    """Парсер для CS:GO маркета: HTTP-запрос, а при необходимости DrissionPage + BeautifulSoup4"""
     
-    def __init__(self, wait_time: int = 5):
+    def __init__(self, wait_time: int = 5, pool: Optional[BrowserPool] = None,
+                 readiness: Optional[PageReadiness] = None,
+                 http_first: bool = True, http: Optional[HttpFetcher] = None,
+                 rate_limiter: Optional[DomainRateLimiter] = None,
+                 extraction_mode: str = 'js', recorder: Optional[CassetteWriter] = None):
         """
         Инициализация парсера
         
         Args:
-            wait_time: Время ожидания загрузки страницы в секундах
+            wait_time: Максимальное время ожидания готовности страницы в секундах
+            pool: Пул браузеров (по умолчанию общий пул процесса)
+            readiness: Условия готовности страниц (по умолчанию правила для поддерживаемых доменов)
+            http_first: Сначала пробовать легкую загрузку без браузера
+            http: HTTP-клиент (по умолчанию общий для процесса)
+            rate_limiter: Ограничитель частоты запросов по доменам (None - без ограничений)
+            extraction_mode: 'js' - извлекать поля скриптом в браузере, 'html' - разбирать page.html
+            recorder: Кассета, в которую сохраняются отрендеренные страницы (режим записи)
         """
         self.wait_time = wait_time
+        self.pool = pool
+        self.readiness = readiness or PageReadiness()
+        self.last_readiness: Optional[ReadinessResult] = None
+        self.http_first = http_first
+        self.http = http
+        self.last_path: Optional[str] = None
+        self.rate_limiter = rate_limiter
+        self.last_limiter_wait = 0.0
+        self.extraction_mode = extraction_mode
+        self.last_extraction: Optional[str] = None
+        # Этапы последней загрузки: [{'name', 'ms', ...}] (трассировка цикла обновления)
+        self.last_spans: List[Dict[str, Any]] = []
+        self.recorder = recorder
+        self._pool: Optional[BrowserPool] = None
+        self._active = False
+        self._last_html: Optional[str] = None
         self.page = None
         self.soup = None
     
@@ -31,74 +82,58 @@ class CSMarketParser:
         Returns:
             Путь к исполняемому файлу браузера или None, если не найден
         """
-        # Список возможных путей и команд для поиска браузера
-        possible_paths = [
-            '/usr/bin/chromium-browser',
-            '/usr/bin/chromium',
-            '/usr/bin/google-chrome',
-            '/snap/bin/chromium',
-        ]
-        
-        # Проверяем стандартные пути
-        for path in possible_paths:
-            if shutil.which(path.split('/')[-1]) or os.path.exists(path):
-                # Проверяем, что это действительно исполняемый файл браузера
-                try:
-                    result = subprocess.run(
-                        [path, '--version'],
-                        capture_output=True,
-                        timeout=5,
-                        text=True
-                    )
-                    if result.returncode == 0 or 'Chromium' in result.stdout or 'Chrome' in result.stdout:
-                        return path
-                except (subprocess.TimeoutExpired, FileNotFoundError, PermissionError):
-                    continue
-        
-        # Пробуем найти через which
-        for cmd in ['chromium-browser', 'chromium', 'google-chrome']:
-            path = shutil.which(cmd)
-            if path:
-                return path
-        
-        return None
+        return find_browser_path()
     
     def __enter__(self):
         """Контекстный менеджер - вход"""
-        # Создаем опции для запуска в headless-режиме, необходимом для сервера
-        co = ChromiumOptions()
-        # Устанавливаем headless режим (новый формат для Chrome/Chromium)
-        co.set_argument('--headless=new')
-        # Параметры для Linux систем без GUI (решают проблему подключения к браузеру)
-        co.set_argument('--no-sandbox')
-        co.set_argument('--disable-dev-shm-usage')
-        co.set_argument('--disable-gpu')
-        co.set_argument('--disable-software-rasterizer')
-        # Автоматически находим путь к браузеру
-        browser_path = self._find_browser_path()
-        if browser_path:
-            co.set_browser_path(path=browser_path)
-            print(f"Используется браузер: {browser_path}")
-        else:
-            print("⚠️  Браузер не найден автоматически. Установите Chromium: sudo snap install chromium")
-            # Пробуем без указания пути - DrissionPage может найти сам
-        # Выделяем отдельный профиль и порт, чтобы избежать конфликтов подключения
-        profile_dir = os.path.join(tempfile.gettempdir(), f"drission_profile_{os.getpid()}")
-        os.makedirs(profile_dir, exist_ok=True)
-        co.set_user_data_path(profile_dir)
-        co.auto_port()
-        # Инициализируем страницу с опциями (DrissionPage сам управляет портом)
-        self.page = ChromiumPage(addr_or_opts=co)
+        # Вкладку из общего пула берем только когда она действительно понадобится
+        self._pool = self.pool or get_browser_pool()
+        self.http = self.http or get_http_fetcher()
+        self._active = True
         return self
     
     def __exit__(self, exc_type, exc_val, exc_tb):
         """Контекстный менеджер - выход"""
         if self.page:
-            self.page.quit()
+            # Вкладку после ошибки не переиспользуем
+            self._pool.release(self.page, discard=exc_type is not None)
+            self.page = None
+        self._active = False
+    
+    def _ensure_page(self):
+        """Берет вкладку браузера из пула при первом обращении"""
+        if self.page is None:
+            with self._span('tab'):
+                self.page = self._pool.acquire()
+        return self.page
+    
+    @contextmanager
+    def _span(self, name: str, **fields):
+        """
+        Замеряет этап загрузки и добавляет его в last_spans
+        
+        Args:
+            name: Этап (limiter, fetch, tab, ready_wait, parse)
+            **fields: Дополнительные поля этапа; блок with может дополнить их (например, outcome)
+        """
+        span = {'name': name, **fields}
+        started = time.perf_counter()
+        try:
+            yield span
+        except Exception as e:
+            span['outcome'] = 'error'
+            span['error'] = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            span['ms'] = round((time.perf_counter() - started) * 1000, 1)
+            self.last_spans.append(span)
     
     def parse_item_page(self, url: str) -> Dict[str, Any]:
         """
-        Парсит страницу предмета на CS:GO маркете
+        Парсит страницу предмета на CS:GO маркете.
+        Сначала пробует легкую HTTP-загрузку, браузер используется только если цену так получить не удалось.
+        Предметы, которые раз за разом загружаются только браузером, открываются в нем сразу
+        (HTTP пробуется изредка, см. FetchPathStats.should_try_http).
         
         Args:
             url: URL страницы предмета
@@ -106,45 +141,197 @@ class CSMarketParser:
         Returns:
             Словарь с основными данными о предмете
         """
-        if not self.page:
+        if not self._active:
             raise RuntimeError("Парсер не инициализирован. Используйте контекстный менеджер.")
         
+        self.last_limiter_wait = 0.0
+        self.last_spans = []
+        http_tried = self.http_first and fetch_path_stats.should_try_http(url)
+        if http_tried:
+            result = self._parse_via_http(url)
+            if result and result.get('title') and result.get('price'):
+                self.last_path = FetchPathStats.HTTP
+                fetch_path_stats.record(url, self.last_path)
+                return result
+            print("Легкая загрузка не дала цену, открываем страницу в браузере")
+        
+        result = self._parse_via_browser(url)
+        self.last_path = FetchPathStats.BROWSER if result.get('price') else FetchPathStats.FAILED
+        fetch_path_stats.record(url, self.last_path, http_tried)
+        return result
+    
+    def _throttle(self, url: str) -> None:
+        """Ждет разрешения ограничителя частоты на запрос к домену url"""
+        if self.rate_limiter:
+            with self._span('limiter'):
+                self.last_limiter_wait += self.rate_limiter.acquire(url)
+    
+    def _parse_via_http(self, url: str) -> Optional[Dict[str, Any]]:
+        """
+        Получает название и цену без браузера: JSON-эндпоинт Steam или серверный HTML
+        
+        Returns:
+            Словарь {'url', 'title', 'price'} или None, если страницу загрузить не удалось
+        """
+        steam_match = STEAM_LISTING_RE.search(url)
+        if steam_match:
+            app_id, hash_name = steam_match.groups()
+            self._throttle(STEAM_PRICE_OVERVIEW_URL)
+            with self._span('fetch', path='http') as span:
+                data = self.http.get_json(STEAM_PRICE_OVERVIEW_URL, params={
+                    'appid': app_id, 'currency': 1, 'market_hash_name': unquote(hash_name),
+                })
+                span['outcome'] = 'ok' if data else 'empty'
+            if not data or not data.get('success'):
+                return None
+            price_match = re.search(r'\$(\d+(?:\.\d+)?)', str(data.get('lowest_price', '')).replace(',', ''))
+            return {
+                'url': url,
+                'title': unquote(hash_name),
+                'price': f"${price_match.group(1)}" if price_match else None,
+            }
+        
+        self._throttle(url)
+        with self._span('fetch', path='http') as span:
+            html_content = self.http.get_text(url)
+            span['outcome'] = 'ok' if html_content else 'empty'
+        if not html_content:
+            return None
+        self._last_html = html_content
+        
+        with EXTRACTION_SECONDS.time(domain=urlparse(url).hostname or '', method='http'), \
+                self._span('parse', method='http') as span:
+            result, title_index, price_index = HTTP_EXTRACTION_PLAN.extract_ranked(html_content, url)
+            title_source = HTTP_EXTRACTION_PLAN.field_source('title', title_index)
+            price_source = HTTP_EXTRACTION_PLAN.field_source('price', price_index)
+            if not result['title'] or not result['price']:
+                json_ld = self._extract_json_ld_offer(html_content)
+                if not result['title'] and json_ld.get('title'):
+                    result['title'], title_source = json_ld['title'], 'json-ld'
+                if not result['price'] and json_ld.get('price'):
+                    result['price'], price_source = json_ld['price'], 'json-ld'
+            # Смена селектора учитывается по итогу, с учетом JSON-LD
+            HTTP_EXTRACTION_PLAN.record_fallthrough(url, title_source, price_source)
+            span['outcome'] = 'ok' if result['title'] and result['price'] else 'incomplete'
+        return result
+    
+    def _parse_via_browser(self, url: str) -> Dict[str, Any]:
+        """Загружает страницу в браузере и извлекает данные из отрендеренного DOM"""
+        page = self._ensure_page()
         print(f"Переходим на страницу: {url}")
         
         # Переходим на страницу
-        self.page.get(url)
+        self._throttle(url)
+        with self._span('fetch', path='browser'):
+            page.get(url)
         
-        print(f"Ждем загрузки страницы ({self.wait_time} сек)...")
-        # Ждем загрузки JavaScript
-        time.sleep(self.wait_time)
+        # Ждем, пока появятся данные (не дольше wait_time)
+        with self._span('ready_wait') as span:
+            self.last_readiness = self.readiness.wait(page, url, timeout=self.wait_time)
+            span['outcome'] = self.last_readiness.outcome
+        print(f"Страница готова за {self.last_readiness.elapsed:.2f} сек ({self.last_readiness.outcome})")
         
-        # Получаем HTML и создаем soup
-        html_content = self.page.html
-        self.soup = BeautifulSoup(html_content, 'html.parser')
-        print("HTML загружен в BeautifulSoup")
+        if self.recorder:
+            # Для воспроизведения сохраняется DOM в момент готовности (лишняя передача page.html только при записи)
+            error_page = self.last_readiness.outcome == ReadinessResult.ERROR_PAGE
+            self.recorder.record(PAGE, url, page.html, 404 if error_page else 200)
+        
+        if self.last_readiness.outcome == ReadinessResult.ERROR_PAGE:
+            # Со страницы ошибки нечего извлекать
+            return {'url': url, 'title': None, 'price': None}
+        
+        if self.extraction_mode == 'js':
+            with self._span('parse', method='js') as span:
+                result = self._extract_in_page(page, url)
+                span['outcome'] = 'ok' if result else 'fallback'
+            if result:
+                self.last_extraction = 'js'
+                return result
+        
+        # Запасной путь: получаем HTML и извлекаем основные данные за один проход
+        self.last_extraction = 'html'
+        with EXTRACTION_SECONDS.time(domain=urlparse(url).hostname or '', method='html'), \
+                self._span('parse', method='html') as span:
+            html_content = page.html
+            self._last_html = html_content
+            result = get_extraction_plan(url).extract(html_content, url)
+            span['outcome'] = 'ok' if result['title'] and result['price'] else 'incomplete'
+            return result
+    
+    @staticmethod
+    def _extract_in_page(page, url: str) -> Optional[Dict[str, Any]]:
+        """
+        Извлекает название и цену скриптом внутри страницы, чтобы не передавать
+        весь page.html через CDP
         
-        # Извлекаем только основные данные
-        result = {
+        Returns:
+            Словарь {'url', 'title', 'price'} или None, если нужен разбор HTML
+            (скрипт упал, вернул другую версию или не нашел цену)
+        """
+        try:
+            with EXTRACTION_SECONDS.time(domain=urlparse(url).hostname or '', method='js'):
+                data = page.run_js(get_js_extractor(url))
+        except Exception as e:
+            print(f"Скрипт извлечения не выполнен: {e}")
+            return None
+        if not isinstance(data, dict) or data.get('v') != JS_EXTRACTION_VERSION:
+            print(f"Неожиданный ответ скрипта извлечения: {data!r}")
+            return None
+        if not data.get('title') or not data.get('price'):
+            return None
+        return {'url': url, 'title': data['title'], 'price': data['price']}
+    
+    def parse_html(self, html_content: str, url: str) -> Dict[str, Any]:
+        """
+        Прежний способ извлечения: полный разбор BeautifulSoup(html.parser) и отдельные
+        выборки по каждому селектору. Оставлен для сравнения и как запасной вариант.
+        
+        Returns:
+            Словарь {'url', 'title', 'price'}
+        """
+        self.soup = BeautifulSoup(html_content, 'html.parser')
+        return {
             'url': url,
             'title': self._extract_title(),
             'price': self._extract_best_offer_price(),
         }
-        
-        return result
     
     def save_html(self, filename: str = 'parsed_page.html') -> None:
         """
-        Сохраняет текущий HTML в файл
+        Сохраняет HTML последней загруженной страницы в файл
         
         Args:
             filename: Имя файла для сохранения
         """
-        if self.page:
-            html_content = self.page.html
+        html_content = self.page.html if self.page else self._last_html
+        if html_content:
             with open(filename, 'w', encoding='utf-8') as f:
                 f.write(html_content)
             print(f"HTML сохранен в файл: {filename}")
     
+    @staticmethod
+    def _extract_json_ld_offer(html_content: str) -> Dict[str, Optional[str]]:
+        """Извлекает название и цену из разметки schema.org (application/ld+json), если она есть"""
+        result: Dict[str, Optional[str]] = {'title': None, 'price': None}
+        try:
+            soup = BeautifulSoup(html_content, DEFAULT_FEATURES, parse_only=JSON_LD_STRAINER)
+            for script in soup.find_all('script'):
+                data = json.loads(script.string or '{}')
+                for entry in data if isinstance(data, list) else [data]:
+                    if not isinstance(entry, dict):
+                        continue
+                    offers = entry.get('offers') or {}
+                    if isinstance(offers, list):
+                        offers = offers[0] if offers else {}
+                    price = offers.get('lowPrice', offers.get('price'))
+                    price_match = re.search(r'(\d+(?:\.\d+)?)', str(price).replace(',', '')) if price is not None else None
+                    if price_match and offers.get('priceCurrency', 'USD') == 'USD':
+                        result['title'] = result['title'] or entry.get('name')
+                        result['price'] = result['price'] or f"${price_match.group(1)}"
+        except (ValueError, TypeError, AttributeError) as e:
+            print(f"Ошибка при разборе JSON-LD: {e}")
+        return result
+    
     def _extract_title(self) -> Optional[str]:
         """Извлекает название предмета"""
         try:
@@ -166,11 +353,16 @@ class CSMarketParser:
             print(f"Ошибка при извлечении названия: {e}")
         return None
     
-    def _extract_best_offer_price(self) -> Optional[str]:
-        """Извлекает лучшую цену предложения"""
+    def _extract_best_offer_price(self, selectors: Optional[List[str]] = None) -> Optional[str]:
+        """
+        Извлекает лучшую цену предложения
+        
+        Args:
+            selectors: Селекторы для поиска (по умолчанию полный список, включая общие блоки цены)
+        """
         try:
             # Ищем элемент с классом best-offer
-            selectors = [
+            selectors = selectors or [
                 '.best-offer',
                 '[class*="best-offer"]',
                 '.price',
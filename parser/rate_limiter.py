@@ -0,0 +1,140 @@
+import threading
+import time
+from typing import Optional, Dict, Tuple
+from urllib.parse import urlparse
+
+
+class TokenBucket:
+    """Потокобезопасное ведро токенов: rate запросов в секунду с запасом capacity"""
+
+    def __init__(self, rate: float, capacity: float = 1):
+        """
+        Args:
+            rate: Скорость пополнения (токенов в секунду)
+            capacity: Максимальный запас токенов (допустимый всплеск)
+        """
+        self.rate = rate
+        self.capacity = max(1.0, capacity)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self, tokens: float = 1) -> float:
+        """
+        Резервирует токены и возвращает, сколько секунд нужно подождать до их появления.
+        Резерв делается сразу, поэтому параллельные вызовы выстраиваются в очередь.
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= tokens
+            if self._tokens >= 0:
+                return 0.0
+            return -self._tokens / self.rate
+
+    def try_acquire(self, tokens: float = 1) -> bool:
+        """Забирает токены, только если они есть прямо сейчас (без ожидания и резерва)"""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            if self._tokens < tokens:
+                return False
+            self._tokens -= tokens
+            return True
+
+    def wait_time(self, tokens: float = 1) -> float:
+        """Через сколько секунд появятся tokens токенов (без резерва)"""
+        with self._lock:
+            available = min(self.capacity, self._tokens + (time.monotonic() - self._updated) * self.rate)
+            if available >= tokens:
+                return 0.0
+            return (tokens - available) / self.rate if self.rate > 0 else float('inf')
+
+    def is_full(self) -> bool:
+        """Запас восстановлен полностью (такое ведро не отличается от нового)"""
+        return self.wait_time(self.capacity) == 0.0
+
+    def acquire(self, tokens: float = 1) -> float:
+        """
+        Ждет появления токенов
+
+        Returns:
+            Время ожидания в секундах
+        """
+        wait = self.reserve(tokens)
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+
+
+class DomainRateLimiter:
+    """Отдельные ведра токенов для каждого домена"""
+
+    def __init__(self, limits: Dict[str, Tuple[float, float]], default: Optional[Tuple[float, float]] = None):
+        """
+        Args:
+            limits: {домен: (запросов в секунду, запас)}
+            default: Ограничение для прочих доменов (None - без ограничений)
+        """
+        self._buckets = {domain: TokenBucket(rate, burst) for domain, (rate, burst) in limits.items()}
+        self._default = default
+        self._lock = threading.Lock()
+        self._requests: Dict[str, int] = {}
+        self._waited: Dict[str, float] = {}
+
+    def _bucket_for(self, domain: str) -> Optional[TokenBucket]:
+        for name, bucket in self._buckets.items():
+            if domain == name or domain.endswith('.' + name):
+                return bucket
+        if self._default is None:
+            return None
+        with self._lock:
+            if domain not in self._buckets:
+                self._buckets[domain] = TokenBucket(*self._default)
+            return self._buckets[domain]
+
+    def acquire(self, url: str) -> float:
+        """
+        Ждет разрешения на запрос к домену url
+
+        Returns:
+            Время ожидания в секундах
+        """
+        domain = urlparse(url).hostname or ''
+        bucket = self._bucket_for(domain)
+        waited = bucket.acquire() if bucket else 0.0
+        with self._lock:
+            self._requests[domain] = self._requests.get(domain, 0) + 1
+            self._waited[domain] = self._waited.get(domain, 0.0) + waited
+        return waited
+
+    def stats(self) -> Dict[str, Dict[str, float]]:
+        """
+        Накопленные счетчики по доменам
+
+        Returns:
+            {домен: {'requests': количество запросов, 'waited': суммарное ожидание в секундах}}
+        """
+        with self._lock:
+            return {
+                domain: {'requests': count, 'waited': round(self._waited.get(domain, 0.0), 3)}
+                for domain, count in self._requests.items()
+            }
+
+
+_shared_limiter: Optional[DomainRateLimiter] = None
+_shared_lock = threading.Lock()
+
+
+def get_rate_limiter(limits: Optional[Dict[str, Tuple[float, float]]] = None) -> DomainRateLimiter:
+    """
+    Возвращает общий для процесса ограничитель, создавая его при первом вызове.
+    Лимиты учитываются только при создании.
+    """
+    global _shared_limiter
+    with _shared_lock:
+        if _shared_limiter is None:
+            _shared_limiter = DomainRateLimiter(limits or {})
+        return _shared_limiter
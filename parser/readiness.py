@@ -0,0 +1,254 @@
+import json
+import threading
+import time
+from collections import deque, Counter, OrderedDict
+from typing import Optional, Dict, Any, List
+from urllib.parse import urlparse
+
+from metrics import histogram
+
+PAGE_READY_SECONDS = histogram(
+    'tracker_page_ready_seconds', 'Время до готовности страницы в браузере (сек) по доменам и исходам',
+    ['domain', 'outcome']
+)
+
+
+class ReadinessRule:
+    """Условия готовности страницы для одного домена"""
+
+    def __init__(self, price_selectors: List[str], title_selectors: List[str],
+                 error_selectors: Optional[List[str]] = None,
+                 error_texts: Optional[List[str]] = None,
+                 error_text_selectors: Optional[List[str]] = None,
+                 network_idle_ms: int = 800):
+        """
+        Args:
+            price_selectors: CSS-селекторы блока с ценой
+            title_selectors: CSS-селекторы названия предмета
+            error_selectors: CSS-селекторы, по которым узнается страница ошибки
+            error_texts: Фразы страницы ошибки ("page not found" и т.п.) - целые фразы,
+                а не коды вроде "404", которые встречаются в названиях предметов
+            error_text_selectors: CSS-селекторы блоков, в которых ищутся error_texts
+                (по умолчанию заголовок страницы и h1)
+            network_idle_ms: Сколько миллисекунд без новых сетевых запросов считать простоем сети
+        """
+        self.price_selectors = price_selectors
+        self.title_selectors = title_selectors
+        self.error_selectors = error_selectors or []
+        self.error_texts = error_texts or []
+        self.error_text_selectors = error_text_selectors or ['title', 'h1']
+        self.network_idle_ms = network_idle_ms
+
+    def probe_script(self) -> str:
+        """Возвращает JS, который за один вызов проверяет все условия на странице"""
+        config = json.dumps({
+            'price': self.price_selectors,
+            'title': self.title_selectors,
+            'error': self.error_selectors,
+            'errorTexts': [t.lower() for t in self.error_texts],
+            'errorTextIn': self.error_text_selectors,
+        })
+        return '''
+            const cfg = %s;
+            const first = (sels, check) => {
+                for (const sel of sels) {
+                    for (const el of document.querySelectorAll(sel)) {
+                        if (check(el)) return true;
+                    }
+                }
+                return false;
+            };
+            const hasPrice = first(cfg.price, el => /\\$\\s*\\d|\\d\\s*\\$/.test(el.textContent));
+            const hasTitle = first(cfg.title, el => el.textContent.trim().length > 0);
+            const isError = first(cfg.error, el => true) || first(cfg.errorTextIn, el => {
+                const text = el.textContent.toLowerCase();
+                return cfg.errorTexts.some(t => text.includes(t));
+            });
+            return {
+                state: document.readyState,
+                price: hasPrice,
+                title: hasTitle,
+                error: isError,
+                resources: performance.getEntriesByType('resource').length
+            };
+        ''' % config
+
+
+# Условия готовности для поддерживаемых доменов
+DOMAIN_RULES: Dict[str, ReadinessRule] = {
+    'market.csgo.com': ReadinessRule(
+        price_selectors=['.best-offer', '[class*="best-offer"]'],
+        title_selectors=['h1.name', 'h1'],
+        error_selectors=['app-not-found', '.not-found', '.page-404'],
+        error_texts=['404 not found', 'error 404', 'page not found', 'страница не найдена'],
+    ),
+    'steamcommunity.com': ReadinessRule(
+        price_selectors=['.market_listing_price_with_fee', '.market_commodity_orders_header_promote'],
+        title_selectors=['#largeiteminfo_item_name', '.market_listing_item_name', 'h1'],
+        error_selectors=['.market_listing_table_message .error'],
+        # "There are no listings for this item" - предмет без лотов, а не ошибка
+        error_texts=['there was an error'],
+        error_text_selectors=['.market_listing_table_message'],
+    ),
+}
+
+# Условия для прочих доменов: достаточно названия и цены в любом блоке price
+DEFAULT_RULE = ReadinessRule(
+    price_selectors=['.best-offer', '[class*="price"]'],
+    title_selectors=['h1'],
+    error_texts=['404 not found', 'error 404', 'page not found'],
+)
+
+
+class ReadinessResult:
+    """Результат ожидания готовности страницы"""
+
+    READY = 'ready'            # найдены название и цена
+    SETTLED = 'settled'        # сеть затихла, цены на странице нет
+    ERROR_PAGE = 'error_page'  # страница ошибки (404 и т.п.)
+    TIMEOUT = 'timeout'        # истек жесткий таймаут
+
+    def __init__(self, url: str, domain: str, outcome: str, elapsed: float):
+        self.url = url
+        self.domain = domain
+        self.outcome = outcome
+        self.elapsed = elapsed
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {'url': self.url, 'domain': self.domain, 'outcome': self.outcome, 'elapsed': self.elapsed}
+
+
+class ReadinessStats:
+    """Статистика времени до готовности страниц для подбора таймаутов"""
+
+    def __init__(self, max_samples: int = 1000):
+        self._lock = threading.Lock()
+        self._samples: Dict[str, deque] = {}
+        self._outcomes: Dict[str, Counter] = {}
+        # Последние замеры по страницам (не больше max_samples, вытесняются самые старые)
+        self._last_by_url: 'OrderedDict[str, Dict[str, Any]]' = OrderedDict()
+        self.max_samples = max_samples
+
+    def record(self, result: ReadinessResult) -> None:
+        with self._lock:
+            self._samples.setdefault(result.domain, deque(maxlen=self.max_samples)).append(result.elapsed)
+            self._outcomes.setdefault(result.domain, Counter())[result.outcome] += 1
+            self._last_by_url[result.url] = result.to_dict()
+            self._last_by_url.move_to_end(result.url)
+            if len(self._last_by_url) > self.max_samples:
+                self._last_by_url.popitem(last=False)
+
+    def last_for_url(self, url: str) -> Optional[Dict[str, Any]]:
+        """Последний замер времени до готовности для страницы"""
+        with self._lock:
+            return self._last_by_url.get(url)
+
+    def summary(self) -> Dict[str, Dict[str, Any]]:
+        """
+        Сводка по доменам: количество замеров, перцентили времени и исходы
+
+        Returns:
+            Словарь {домен: {'count', 'p50', 'p90', 'p99', 'max', 'outcomes'}}
+        """
+        with self._lock:
+            result = {}
+            for domain, samples in self._samples.items():
+                ordered = sorted(samples)
+                pick = lambda q: ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+                result[domain] = {
+                    'count': len(ordered),
+                    'p50': round(pick(0.5), 3),
+                    'p90': round(pick(0.9), 3),
+                    'p99': round(pick(0.99), 3),
+                    'max': round(ordered[-1], 3),
+                    'outcomes': dict(self._outcomes[domain]),
+                }
+            return result
+
+
+# Общая статистика процесса
+readiness_stats = ReadinessStats()
+
+
+class PageReadiness:
+    """Ожидание готовности страницы по условиям домена вместо фиксированной паузы"""
+
+    def __init__(self, rules: Optional[Dict[str, ReadinessRule]] = None,
+                 poll_interval: float = 0.2, stats: Optional[ReadinessStats] = None):
+        """
+        Args:
+            rules: Условия по доменам (по умолчанию DOMAIN_RULES)
+            poll_interval: Интервал между проверками в секундах
+            stats: Куда записывать время до готовности (по умолчанию общая статистика)
+        """
+        self.rules = rules if rules is not None else DOMAIN_RULES
+        self.poll_interval = poll_interval
+        self.stats = stats if stats is not None else readiness_stats
+        self._scripts: Dict[int, str] = {}
+
+    def rule_for(self, url: str) -> ReadinessRule:
+        host = urlparse(url).hostname or ''
+        for domain, rule in self.rules.items():
+            if host == domain or host.endswith('.' + domain):
+                return rule
+        return DEFAULT_RULE
+
+    def _script(self, rule: ReadinessRule) -> str:
+        key = id(rule)
+        if key not in self._scripts:
+            self._scripts[key] = rule.probe_script()
+        return self._scripts[key]
+
+    def wait(self, page, url: str, timeout: float) -> ReadinessResult:
+        """
+        Ждет, пока на странице появятся данные, страница ошибки или затихнет сеть
+
+        Args:
+            page: Вкладка DrissionPage, на которой уже открыт url
+            url: Адрес страницы (для выбора условий и статистики)
+            timeout: Жесткий таймаут в секундах
+
+        Returns:
+            ReadinessResult с исходом и затраченным временем
+        """
+        rule = self.rule_for(url)
+        script = self._script(rule)
+        domain = urlparse(url).hostname or ''
+        started = time.monotonic()
+        deadline = started + timeout
+        last_resources = -1
+        resources_changed_at = started
+        outcome = ReadinessResult.TIMEOUT
+
+        while True:
+            now = time.monotonic()
+            try:
+                probe = page.run_js(script) or {}
+            except Exception as e:
+                print(f"Ошибка проверки готовности страницы: {e}")
+                probe = {}
+
+            if probe.get('error'):
+                outcome = ReadinessResult.ERROR_PAGE
+                break
+            if probe.get('price') and probe.get('title'):
+                outcome = ReadinessResult.READY
+                break
+
+            resources = probe.get('resources', -1)
+            if resources != last_resources:
+                last_resources = resources
+                resources_changed_at = now
+            elif (probe.get('state') == 'complete' and probe.get('title')
+                  and (now - resources_changed_at) * 1000 >= rule.network_idle_ms):
+                outcome = ReadinessResult.SETTLED
+                break
+
+            if now >= deadline:
+                break
+            time.sleep(min(self.poll_interval, max(0.0, deadline - now)))
+
+        result = ReadinessResult(url, domain, outcome, time.monotonic() - started)
+        self.stats.record(result)
+        PAGE_READY_SECONDS.observe(result.elapsed, domain=domain, outcome=outcome)
+        return result
@@ -0,0 +1,329 @@
+import json
+import random
+import re
+import threading
+import time
+from typing import Optional, Dict, Any, Tuple
+
+from parser.extraction import JS_EXTRACTION_VERSION, get_extraction_plan, get_js_extractor
+from parser.readiness import PageReadiness
+
+
+# Виды записей кассеты: ответ HTTP-загрузки страницы, ответ JSON-эндпоинта
+# и HTML страницы, отрендеренной в браузере
+TEXT = 'text'
+JSON = 'json'
+PAGE = 'page'
+
+# Блоки, в которых проверка готовности ищет фразы страницы ошибки (селекторы title и h1)
+HEAD_RES = {
+    'title': re.compile(r'<title[^>]*>(.*?)</title>', re.S | re.I),
+    'h1': re.compile(r'<h1[^>]*>(.*?)</h1>', re.S | re.I),
+}
+# Простые селекторы блоков ошибки: тег, .класс, #id (составные по HTML не проверяются)
+SIMPLE_SELECTOR_RE = re.compile(r'^([.#]?)([\w-]+)$')
+_selector_res: Dict[str, Optional['re.Pattern']] = {}
+
+
+def _selector_re(selector: str) -> Optional['re.Pattern']:
+    """Регулярное выражение открывающего тега элемента, подходящего под простой селектор"""
+    if selector not in _selector_res:
+        match = SIMPLE_SELECTOR_RE.match(selector)
+        pattern = None
+        if match:
+            kind, name = match.group(1), re.escape(match.group(2))
+            if kind == '.':
+                pattern = re.compile(r'<[^>]+\sclass="[^"]*(?<![\w-])%s(?![\w-])' % name, re.I)
+            elif kind == '#':
+                pattern = re.compile(r'<[^>]+\sid="%s"' % name, re.I)
+            else:
+                pattern = re.compile(r'<%s[\s>/]' % name, re.I)
+        _selector_res[selector] = pattern
+    return _selector_res[selector]
+
+
+def _record_key(kind: str, url: str, params: Optional[Dict[str, Any]] = None) -> Tuple[str, str, str]:
+    return kind, url, json.dumps(params or {}, sort_keys=True, ensure_ascii=False)
+
+
+class CassetteWriter:
+    """
+    Запись ответов рынка в кассету (JSONL, одна запись на ответ):
+    {'kind', 'url', 'params', 'status', 'body', 'recorded_at'}.
+    status=0 - загрузка не удалась (при воспроизведении вернется та же ошибка).
+    """
+
+    def __init__(self, path: str):
+        """
+        Args:
+            path: Файл кассеты (дописывается, каталог должен существовать)
+        """
+        self.path = path
+        self._lock = threading.Lock()
+        self.records = 0
+
+    def record(self, kind: str, url: str, body: Any, status: int = 200,
+               params: Optional[Dict[str, Any]] = None) -> None:
+        line = json.dumps({
+            'kind': kind, 'url': url, 'params': params, 'status': status,
+            'body': body, 'recorded_at': int(time.time()),
+        }, ensure_ascii=False)
+        with self._lock:
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write(line + '\n')
+            self.records += 1
+
+
+class RecordingFetcher:
+    """HttpFetcher, который сохраняет каждый ответ в кассету"""
+
+    def __init__(self, fetcher, writer: CassetteWriter):
+        """
+        Args:
+            fetcher: Настоящий HttpFetcher
+            writer: Кассета для записи ответов
+        """
+        self.fetcher = fetcher
+        self.writer = writer
+
+    def get_text(self, url: str) -> Optional[str]:
+        body = self.fetcher.get_text(url)
+        self.writer.record(TEXT, url, body, 200 if body is not None else 0)
+        return body
+
+    def get_json(self, url: str, params: Optional[Dict[str, Any]] = None) -> Optional[Any]:
+        body = self.fetcher.get_json(url, params=params)
+        self.writer.record(JSON, url, body, 200 if body is not None else 0, params=params)
+        return body
+
+    def close(self) -> None:
+        self.fetcher.close()
+
+
+def load_cassette(path: str) -> Dict[Tuple[str, str, str], Dict[str, Any]]:
+    """
+    Читает кассету
+
+    Returns:
+        {(вид, url, параметры): запись}; при повторах по одному ключу побеждает последняя запись
+    """
+    records = {}
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            record = json.loads(line)
+            records[_record_key(record['kind'], record['url'], record.get('params'))] = record
+    return records
+
+
+class ReplayTransport:
+    """
+    Воспроизведение записанных ответов вместо рынка и браузера.
+
+    Заменяет HttpFetcher (get_text/get_json) и через атрибут pool - пул браузеров:
+    CSMarketParser проходит обычный путь (HTTP, при необходимости вкладка,
+    ожидание готовности, извлечение), но страницы берутся из кассеты.
+    Задержка и ошибки задаются параметрами; решение об ошибке и задержка
+    определяются seed, адресом и номером запроса к этому адресу, поэтому
+    повторный прогон с тем же seed воспроизводит те же ошибки при любом
+    порядке выполнения потоков.
+    """
+
+    def __init__(self, records: Optional[Dict[Tuple[str, str, str], Dict[str, Any]]] = None,
+                 latency_ms: float = 0, jitter_ms: float = 0, error_rate: float = 0.0,
+                 seed: int = 0, tabs: int = 0):
+        """
+        Args:
+            records: Записи кассеты (load_cassette; по умолчанию пустая, ответы добавляются через put)
+            latency_ms: Задержка каждого ответа в миллисекундах
+            jitter_ms: Случайная добавка к задержке (от 0 до jitter_ms)
+            error_rate: Доля запросов, завершающихся ошибкой (0..1)
+            seed: Зерно для задержек и ошибок
+            tabs: Сколько вкладок одновременно выдает пул (0 - без ограничения)
+        """
+        self.records = records if records is not None else {}
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.seed = seed
+        self.pool = ReplayBrowserPool(self, tabs)
+        self._lock = threading.Lock()
+        self._attempts: Dict[Tuple[str, str], int] = {}
+        self._stats = {'requests': 0, 'hits': 0, 'misses': 0, 'injected_errors': 0, 'delay': 0.0}
+
+    @classmethod
+    def from_file(cls, path: str, **kwargs) -> 'ReplayTransport':
+        """Транспорт по кассете из файла (параметры - как у конструктора)"""
+        return cls(load_cassette(path), **kwargs)
+
+    def put(self, kind: str, url: str, body: Any, status: int = 200, params: Optional[Dict[str, Any]] = None) -> None:
+        """Добавляет или заменяет ответ (кассеты, собранные в памяти, и смена цен между циклами)"""
+        self.records[_record_key(kind, url, params)] = {
+            'kind': kind, 'url': url, 'params': params, 'status': status, 'body': body,
+        }
+
+    def _serve(self, kind: str, url: str, params: Optional[Dict[str, Any]] = None) -> Tuple[Optional[Dict[str, Any]], bool]:
+        """
+        Выдерживает задержку и находит запись
+
+        Returns:
+            (запись или None, True если ошибка внесена искусственно)
+        """
+        with self._lock:
+            attempt = self._attempts.get((kind, url), 0)
+            self._attempts[(kind, url)] = attempt + 1
+        rng = random.Random(f"{self.seed}|{kind}|{url}|{attempt}")
+        delay = (self.latency_ms + rng.uniform(0, self.jitter_ms)) / 1000
+        injected = rng.random() < self.error_rate
+        if delay > 0:
+            time.sleep(delay)
+
+        record = None if injected else self.records.get(_record_key(kind, url, params))
+        if record is None and kind == PAGE and not injected:
+            # Кассета без отрендеренных страниц: вкладка получает серверный HTML
+            record = self.records.get(_record_key(TEXT, url))
+        with self._lock:
+            self._stats['requests'] += 1
+            self._stats['delay'] += delay
+            if injected:
+                self._stats['injected_errors'] += 1
+            elif record is None:
+                self._stats['misses'] += 1
+            else:
+                self._stats['hits'] += 1
+        return record, injected
+
+    def get_text(self, url: str) -> Optional[str]:
+        record, injected = self._serve(TEXT, url)
+        if injected:
+            print(f"Воспроизведение: внесенная ошибка загрузки {url}")
+        if record is None or record['status'] != 200:
+            return None
+        return record['body']
+
+    def get_json(self, url: str, params: Optional[Dict[str, Any]] = None) -> Optional[Any]:
+        record, _ = self._serve(JSON, url, params)
+        if record is None or record['status'] != 200:
+            return None
+        return record['body']
+
+    def close(self) -> None:
+        pass
+
+    def stats(self) -> Dict[str, Any]:
+        """Счетчики: запросы, найденные/ненайденные в кассете ответы, внесенные ошибки, суммарная задержка"""
+        with self._lock:
+            stats = dict(self._stats)
+        stats['delay'] = round(stats['delay'], 3)
+        return stats
+
+
+class ReplayPage:
+    """Вкладка, которая открывает страницы из кассеты (интерфейс вкладки DrissionPage, нужный парсеру)"""
+
+    def __init__(self, transport: ReplayTransport):
+        self.transport = transport
+        self.url: Optional[str] = None
+        self.html = ''
+        self._status = 0
+        self._fields: Optional[Dict[str, Any]] = None
+
+    def get(self, url: str) -> None:
+        record, injected = self.transport._serve(PAGE, url)
+        if injected:
+            raise ConnectionError(f"Воспроизведение: внесенная ошибка загрузки {url}")
+        self.url = url
+        self.html = (record or {}).get('body') or ''
+        self._status = record['status'] if record else 404
+        self._fields = None
+
+    def _extract(self) -> Dict[str, Any]:
+        if self._fields is None:
+            self._fields = get_extraction_plan(self.url).extract(self.html, self.url)
+        return self._fields
+
+    def run_js(self, script: str) -> Dict[str, Any]:
+        """Отвечает на скрипт извлечения и на проверку готовности по HTML из кассеты"""
+        fields = self._extract()
+        if script == get_js_extractor(self.url):
+            return {'v': JS_EXTRACTION_VERSION, 'title': fields['title'], 'price': fields['price']}
+        rule = PageReadiness().rule_for(self.url)
+        # Составные селекторы и фразы в блоках кроме title/h1 по HTML не проверяются:
+        # для них страница ошибки видна по статусу, записанному парсером
+        marked = any(pattern.search(self.html) for pattern in map(_selector_re, rule.error_selectors) if pattern)
+        head = ' '.join(
+            match.group(1) for match in (
+                HEAD_RES[sel].search(self.html) for sel in rule.error_text_selectors if sel in HEAD_RES
+            ) if match
+        ).lower()
+        return {
+            'state': 'complete',
+            'price': bool(fields['price']),
+            'title': bool(fields['title']),
+            'error': self._status != 200 or marked or any(text in head for text in rule.error_texts),
+            'resources': 0,
+        }
+
+
+class ReplayBrowserPool:
+    """Пул вкладок воспроизведения (интерфейс BrowserPool, нужный парсеру и обновлятелю)"""
+
+    def __init__(self, transport: ReplayTransport, tabs: int = 0):
+        self.transport = transport
+        self._slots = threading.BoundedSemaphore(tabs) if tabs else None
+        self._lock = threading.Lock()
+        self.acquired = 0
+
+    def acquire(self, timeout: Optional[float] = None) -> ReplayPage:
+        if self._slots and not self._slots.acquire(timeout=timeout):
+            raise TimeoutError("Нет свободной вкладки воспроизведения")
+        with self._lock:
+            self.acquired += 1
+        return ReplayPage(self.transport)
+
+    def release(self, tab, discard: bool = False) -> None:
+        if self._slots:
+            self._slots.release()
+
+    def warm_up(self) -> None:
+        pass
+
+    def health_check(self) -> int:
+        return 0
+
+    def stats(self) -> Dict[str, Any]:
+        return {'replay': True, 'acquired': self.acquired}
+
+    def close(self) -> None:
+        pass
+
+
+_shared_replay: Optional[ReplayTransport] = None
+_shared_writer: Optional[CassetteWriter] = None
+_shared_lock = threading.Lock()
+
+
+def get_replay_transport(path: str, latency_ms: float = 0, jitter_ms: float = 0, error_rate: float = 0.0,
+                         seed: int = 0, tabs: int = 0) -> ReplayTransport:
+    """
+    Возвращает общий для процесса транспорт воспроизведения, загружая кассету при первом вызове.
+    Параметры учитываются только при создании.
+    """
+    global _shared_replay
+    with _shared_lock:
+        if _shared_replay is None:
+            _shared_replay = ReplayTransport.from_file(
+                path, latency_ms=latency_ms, jitter_ms=jitter_ms, error_rate=error_rate, seed=seed, tabs=tabs
+            )
+        return _shared_replay
+
+
+def get_cassette_writer(path: str) -> CassetteWriter:
+    """Возвращает общую для процесса кассету записи, создавая ее при первом вызове"""
+    global _shared_writer
+    with _shared_lock:
+        if _shared_writer is None:
+            _shared_writer = CassetteWriter(path)
+        return _shared_writer